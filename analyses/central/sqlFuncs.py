@@ -26,16 +26,20 @@ def create_connection(db_file):
     return None
 
 
-def get_data(conn, startdate, enddate, cpd):
+def get_data(conn, startdate, enddate, cpd, archive_dir=None):
     """
     gather data between start and end dates
     :param conn: SQLlite3 connection
     :param startdate: starting date string , format ex. '2019-07-23 00:00:00'
     :param enddate: end date string, format ex. 2019-07-24 23:59:59
     :param cpd: the SQLlite database header of the data column
+    :param archive_dir: directory of monthly Picarro archives for cpd 'data', see get_picarro_data()
     :return:
     """
 
+    if cpd == 'data':
+        return finish_data(get_picarro_data(conn, startdate, enddate, archive_dir))
+
     cur = conn.cursor()
     # get data between start and end date
     cur.execute(f"SELECT * FROM {cpd} WHERE date BETWEEN '{startdate}' AND '{enddate}'")
@@ -60,6 +64,58 @@ def get_data(conn, startdate, enddate, cpd):
     badcols = list(pd.Series(range(1, 15)).astype(str))
     data.drop(badcols, axis=1, inplace=True)
 
+    return finish_data(data)
+
+
+def get_picarro_data(conn, startdate, enddate, archive_dir=None):
+    """
+    Gather Picarro data between start and end dates from the data table and any monthly archives of it. The Picarro
+    processor moves old months out of the database into .npz files in an archive folder next to it (see
+    summit_picarro.archive_months()), so a copy of the database is read with the archive folder copied beside it.
+    Rows that are in both keep the archived version, as the processor does.
+    :param conn: SQLlite3 connection
+    :param startdate: starting date string , format ex. '2019-07-23 00:00:00'
+    :param enddate: end date string, format ex. 2019-07-24 23:59:59
+    :param archive_dir: directory of the archives, defaults to the 'archive' folder next to the database file
+    :return: dataframe, with columns id, date, status, pos, ch4
+    """
+    import numpy as np
+    from pathlib import Path
+
+    columns = ['id', 'date', 'instrument_status', 'mpv_position', 'ch4']
+
+    if archive_dir is None:
+        db_file = conn.execute('PRAGMA database_list').fetchone()[2]  # (seq, name, file) of the main database
+        archive_dir = Path(db_file).parent / 'archive'
+
+    start, end = pd.to_datetime(startdate), pd.to_datetime(enddate)
+
+    frames = []
+    for path in sorted(Path(archive_dir).glob('picarro_*_*.npz')):
+        with np.load(path) as archive:
+            month = pd.DataFrame({col: archive[col] for col in columns})
+
+        frames.append(month[(month['date'] >= start) & (month['date'] <= end)])
+
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(columns)} FROM data WHERE date BETWEEN ? AND ?", (startdate, enddate))
+    frames.append(pd.DataFrame(cur.fetchall(), columns=columns))
+
+    data = pd.concat(frames, ignore_index=True)
+    data['date'] = pd.to_datetime(data['date'])
+    data = data.drop_duplicates(subset='date', keep='first').sort_values(by='date')  # archives were read first
+
+    data = data.rename(columns={'instrument_status': 'status', 'mpv_position': 'pos'})
+    data['date'] = data['date'].astype(str)
+    return data.reset_index(drop=True)
+
+
+def finish_data(data):
+    """
+    Add proper datetimes and fake date points to data from get_data()
+    :param data: dataframe, with at least a date column
+    :return: the same dataframe, without rows that have missing values
+    """
     # create proper datetimes
     data['datetime'] = pd.to_datetime(data['date'])
     data.dropna(axis=0, inplace=True)
@@ -21,7 +21,7 @@ dbdir = os.path.join(root2, 'summit_picarro.sqlite')
 conn = create_connection(dbdir)
 
 # identify date range
-start = '2019-06-00 00:00:00'
+start = '2019-06-01 00:00:00'
 end = '2019-07-30 23:59:59'
 
 # get the data
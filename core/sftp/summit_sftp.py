@@ -1,5 +1,6 @@
 import os
 import json
+import glob
 from pathlib import Path
 
 from sqlalchemy import Column, Integer, String, ForeignKey
@@ -45,19 +46,6 @@ class RemoteFile(Base):
 		self.relpath = path.replace(REMOTE_BASE_PATH, '')
 
 
-def search_for_attr_value(obj_list, attr, value):
-	"""
-	Finds the first (not necesarilly the only) object in a list, where its
-	attribute 'attr' is equal to 'value', returns None if none is found.
-	:param obj_list: list, of objects to search
-	:param attr: string, attribute to search for
-	:param value: mixed types, value that should be searched for
-	:return: obj, from obj_list, where attribute attr matches value
-		**** warning: returns the *first* obj, not necessarily the only
-	"""
-	return next((obj for obj in obj_list if getattr(obj, attr, None) == value), None)
-
-
 def connect_to_sftp():
 	"""
 	Uses paramiko to create a connection to Brendan's instance. Relies on authetication information from a JSON file.
@@ -74,62 +62,119 @@ def connect_to_sftp():
 	return client.open_sftp()
 
 
+def open_sftp_channels(con, n):
+	"""
+	Open more SFTP channels over the same SSH connection as con, so several requests can be in flight at once.
+	:param con: SFTPClient, an active SFTP connection
+	:param n: int, the total number of channels wanted, including con
+	:return: list, of n SFTPClients
+	"""
+	import paramiko
+
+	transport = con.get_channel().get_transport()
+	return [con] + [paramiko.SFTPClient.from_transport(transport) for _ in range(n - 1)]
+
+
+def borrow_channel(free, func, *args):
+	"""
+	Run func with the next free SFTP channel as its first argument, and return the channel to the queue afterwards.
+	:param free: Queue, of SFTPClients not currently in use
+	:param func: function, taking an SFTPClient and *args
+	:return: the result of func
+	"""
+	con = free.get()
+	try:
+		return func(con, *args)
+	finally:
+		free.put(con)
+
+
 def list_remote_files(con, directory):
 	"""
 	List the files and folders in a remote directory using an active SFTPClient from Paramiko
 	:param con: SFTPClient, an active connection to an SFTP server
 	:param directory: string, the directory to search
-	:return: (generator, generator), the files and directories as separate generators
+	:return: (list, list), the files and directories as separate lists
 	"""
 	from stat import S_ISDIR
 
-	print(directory)
-	all_files = [file for file in con.listdir_attr(directory)]
-
 	files = []
 	dirs = []
 
-	for file in all_files:
+	for file in con.listdir_attr(directory):
+		file.path = directory + f'/{file.filename}'  # ad-hoc add the remote filepath since Paramiko ignores this?!
 		if S_ISDIR(file.st_mode):
-			file.path = directory + f'/{file.filename}'  # ad-hoc add the remote filepath since Paramiko ignores this?!
 			dirs.append(file)
 		else:
-			file.path = directory + f'/{file.filename}'  # ad-hoc add the remote filepath since Paramiko ignores this?!
 			files.append(file)
 
-	files = (file for file in files)
-	dirs = (dir for dir in dirs)
-
 	return (files, dirs)
 
 
-def list_remote_files_recur(con, directory, files=None, dirs=None):
+def list_remote_files_bfs(free, directory):
 	"""
-	List all remote files, recursively through all directories in the given directory.
+	List all remote files in the given directory and every directory below it, breadth-first. Each directory is listed
+	on the next free channel as soon as its parent has been listed, so one listing is in flight per channel.
 
-	:param con: SFTPClient object, an active SFTP connection
-	:param directory: directory to search for files and folders
-	:param files: optional, generator; file generator to append to with chain()
-	:param dirs: optional, generator; directory generator to append to with chain()
-	:return: files; a generator of all the SFTPAttribute files
+	:param free: Queue, of SFTPClients to list with, see open_sftp_channels()
+	:param directory: string, directory to search for files and folders
+	:return: list, of the SFTPAttributes of every file, with .path added
 	"""
-	from itertools import chain
+	from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-	if not files and not dirs:
-		files, dirs = list_remote_files(con, directory)
+	files = []
+	with ThreadPoolExecutor(max_workers=free.qsize()) as executor:
+		pending = {executor.submit(borrow_channel, free, list_remote_files, directory)}
 
-	dirs, dirs_is_empty = gen_isempty(dirs)
+		while pending:
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
 
-	if not dirs_is_empty:
-		directory_to_check = None
-		for d in dirs:
-			directory_to_check = d.path
-			new_files, new_dirs = list_remote_files(con, directory_to_check)
-			files = chain(files, new_files)
-			dirs = chain(dirs, new_dirs)
-		return list_remote_files_recur(con, directory_to_check, files=files, dirs=dirs)
-	else:
-		return files
+			for future in done:
+				new_files, new_dirs = future.result()
+				files.extend(new_files)
+				pending.update(executor.submit(borrow_channel, free, list_remote_files, d.path) for d in new_dirs)
+
+	return files
+
+
+def get_resumable(con, remote_path, local_path, size, st_mtime):
+	"""
+	Download a remote file to a .part file beside local_path, continuing from the end of any .part file left by an
+	interrupted transfer, then move it into place and give it the remote modification time. The .part file is named
+	for the size and modification time of the remote file it was started from, so a leftover .part of a remote file
+	that has since been rewritten is removed and the download starts over.
+
+	:param con: SFTPClient, an active SFTP connection
+	:param remote_path: string, path of the remote file
+	:param local_path: string, path to download the file to
+	:param size: int, size of the remote file in bytes
+	:param st_mtime: int, modification time of the remote file
+	:return: None
+	"""
+	local_path = Path(local_path)
+	part = local_path.with_name(f'{local_path.name}.{size}-{int(st_mtime)}.part')
+
+	for old_part in local_path.parent.glob(glob.escape(local_path.name) + '.*part'):
+		if old_part != part:
+			old_part.unlink()  # left by a download of an older version of the remote file
+
+	offset = part.stat().st_size if part.exists() else 0
+
+	if offset > size:
+		offset = 0  # the .part is longer than the remote file, so the partial download is no good
+
+	with con.open(remote_path, 'rb') as remote, open(part, 'ab' if offset else 'wb') as local:
+		remote.seek(offset)
+		remote.prefetch(size)  # pipeline reads of the rest of the file, as SFTPClient.get() does
+
+		while True:
+			data = remote.read(32768)
+			if not data:
+				break
+			local.write(data)
+
+	os.replace(part, local_path)
+	os.utime(local_path, (st_mtime, st_mtime))
 
 
 def scan_and_create_dir_tree(path, file=True):
@@ -155,30 +200,28 @@ def scan_and_create_dir_tree(path, file=True):
 			path_to_check.mkdir()
 
 
-def gen_isempty(gen):
-	"""
-	Returns an identical generator and False if it has at least one value, True if it's empty
-	:param gen: generator, any generator
-	:return: (generator, Boolean), returns the same generator, and True if empty, False if not
+def retrieve_new_files(logger, channels=4, batch_size=500):
 	"""
-	try:
-		item = next(gen)
-
-		def my_generator():
-			yield item
-			yield from gen
-
-		return my_generator(), False
-	except StopIteration:
-		return (_ for _ in []), True
+	Sync new and updated files from each remote folder to its local copy. Remote folders are listed and files are
+	downloaded over several SFTP channels at once, local and remote files are matched by their relative paths in
+	memory, and the database is updated in batches as downloads finish.
 
-
-def retrieve_new_files(logger):
-	from summit_core import connect_to_db, list_files_recur, split_into_sets_of_n
+	:param logger: logger, to log events to
+	:param channels: int, number of SFTP channels to list and download with at once
+	:param batch_size: int, number of downloaded files to commit to the database at a time
+	:return: None
+	"""
+	from queue import Queue
+	from concurrent.futures import ThreadPoolExecutor, as_completed
+	from summit_core import connect_to_db, list_files_recur
 
 	logger.info('Running retrieve_new_files()')
 
 	con = connect_to_sftp()
+	free = Queue()
+	for channel in open_sftp_channels(con, channels):
+		free.put(channel)
+
 	engine, session = connect_to_db('sqlite:///zugspitze.sqlite', CORE_DIR)
 
 	for path in ['folder1', 'folder2', 'folder3']:
@@ -187,96 +230,89 @@ def retrieve_new_files(logger):
 		local_path = CORE_DIR / path
 		remote_path = REMOTE_BASE_PATH + f'/{path}'
 
-		all_remote_files = list_remote_files_recur(con, remote_path)  # get a list of all SFTPAttributes + paths
-
-		all_local_files = [str(p) for p in list_files_recur(local_path)]  # get all local file paths
-
-		new_remote_files = []
-		for remote_file in all_remote_files:
-			new_remote_files.append(RemoteFile(remote_file.st_mtime, remote_file.path))
-		# create DB objects for all remote paths
-
-		new_local_files = []
-		for remote_file in all_local_files:
-			new_local_files.append(LocalFile(os.stat(remote_file).st_mtime, remote_file))
-		# create DB objects for all local paths
-
-		remote_sets = split_into_sets_of_n([r.path for r in new_remote_files], 750)  # don't exceed 1K sqlite var limit
-		local_sets = split_into_sets_of_n([l.path for l in new_local_files], 750)
-
-		# loop through remote, then local filesets to check against DB and commit any new ones
-		for Filetype, filesets, new_files in zip([RemoteFile, LocalFile],
-												 [remote_sets, local_sets],
-												 [new_remote_files, new_local_files]):
-			paths_in_db = []
-			for set_ in filesets:
-				in_db = session.query(Filetype.path).filter(Filetype.path.in_(set_)).all()
-				if in_db:
-					paths_in_db.extend(in_db)
-
-			for file in new_files:
-				if file.path in paths_in_db:
-					file_in_db = session.query(Filetype).filter(Filetype.path == file.path).one_or_none()
-					if file.st_mtime > file_in_db.st_mtime:
-						file_in_db.st_mtime = file.st_mtime
-						session.merge(file_in_db)
-				else:
-					session.add(file)
-			session.commit()  # commit at the end of each filetype
+		all_remote_files = {f.path: f for f in list_remote_files_bfs(free, remote_path)}  # SFTPAttributes by path
 
-		# local and remote files are now completely up-to-date in the database
-		files_to_retrieve = []
-		remote_files = session.query(RemoteFile).order_by(RemoteFile.relpath).all()
-		local_files = session.query(LocalFile).order_by(LocalFile.relpath).all()
+		all_local_files = {str(p): p.stat().st_mtime for p in list_files_recur(local_path)
+						   if p.is_file() and p.suffix != '.part'}  # st_mtimes by path, skipping partial downloads
 
-		for remote_file in remote_files:
-			if remote_file.local is None:
-				local_match = search_for_attr_value(local_files, 'relpath', remote_file.relpath)
-				if local_match:
-					remote_file.local = local_match
-					if remote_file.st_mtime > local_match.st_mtime:
-						files_to_retrieve.append(remote_file)  # add the remote file to download if st_mtime is greater
-				else:
-					files_to_retrieve.append(remote_file)  # add the remote file if there's no local copy (create later)
-			else:
-				if remote_file.st_mtime > remote_file.local.st_mtime:
-					files_to_retrieve.append(remote_file)
+		remote_in_db = {f.path: f for f in session.query(RemoteFile).filter(RemoteFile.path.like(remote_path + '/%'))}
+		local_in_db = {f.path: f for f in session.query(LocalFile).filter(LocalFile.path.like(str(local_path) + '/%'))}
 
-		logger.info(f'Remote files: {len(remote_files)}')
-		logger.info(f'Local files: {len(local_files)}')
-		logger.info(f'{len(files_to_retrieve)} file need updating or retrieval.')
+		# add new files and update the st_mtime of changed ones in the database
+		for remote_file in all_remote_files.values():
+			file_in_db = remote_in_db.get(remote_file.path)
+			if file_in_db is None:
+				remote_in_db[remote_file.path] = RemoteFile(remote_file.st_mtime, remote_file.path)
+				session.add(remote_in_db[remote_file.path])
+			elif remote_file.st_mtime > file_in_db.st_mtime:
+				file_in_db.st_mtime = remote_file.st_mtime
 
-		ct = 0
-		for remote_file in files_to_retrieve:
-			if remote_file.local is not None:
-				con.get(remote_file.path, remote_file.local.path)  # get remote file and put in the local's path
+		for local_file, st_mtime in all_local_files.items():
+			file_in_db = local_in_db.get(local_file)
+			if file_in_db is None:
+				local_in_db[local_file] = LocalFile(st_mtime, local_file)
+				session.add(local_in_db[local_file])
+			elif st_mtime > file_in_db.st_mtime:
+				file_in_db.st_mtime = st_mtime
 
-				remote_file.local.st_mtime = remote_file.st_mtime  # update, then merge
-				session.merge(remote_file)
+		session.commit()
 
-				logger.info(f'Remote file {remote_file.relpath} was updated.')
-				ct += 1
-			else:
-				new_local_path = CORE_DIR / remote_file.relpath.lstrip('/')
+		# local and remote files are now completely up-to-date in the database
+		local_by_relpath = {f.relpath: f for f in local_in_db.values()}
 
-				scan_and_create_dir_tree(new_local_path)  # scan the path and create any needed folders
+		files_to_retrieve = []
+		for remote_file in sorted(remote_in_db.values(), key=lambda f: f.relpath):
+			if remote_file.path not in all_remote_files:
+				continue  # no longer on the remote, so it can't be retrieved
 
-				new_local_path = str(new_local_path)  # revert to string
-				con.get(remote_file.path, new_local_path)  # get file and put in it's relative place
+			if remote_file.local is None:
+				remote_file.local = local_by_relpath.get(remote_file.relpath)
 
-				new_local = LocalFile(remote_file.st_mtime, new_local_path)
-				new_local.remote = remote_file
+			if remote_file.local is None or remote_file.st_mtime > remote_file.local.st_mtime:
+				files_to_retrieve.append(remote_file)  # retrieve if there's no local copy, or the remote is newer
 
-				session.add(new_local)  # create, relate, and add the local file that was transferred
-				session.merge(remote_file)
+		logger.info(f'Remote files: {len(remote_in_db)}')
+		logger.info(f'Local files: {len(local_in_db)}')
+		logger.info(f'{len(files_to_retrieve)} file need updating or retrieval.')
 
-				logger.info(f'Remote file {remote_file.relpath} was retrieved and added to local database.')
-				ct += 1
+		with ThreadPoolExecutor(max_workers=channels) as executor:
+			futures = {}
+			for remote_file in files_to_retrieve:
+				if remote_file.local is not None:
+					local_file = remote_file.local.path  # get remote file and put in the local's path
+				else:
+					new_local_path = CORE_DIR / remote_file.relpath.lstrip('/')
+					scan_and_create_dir_tree(new_local_path)  # scan the path and create any needed folders
+					local_file = str(new_local_path)  # get file and put in it's relative place
+
+				attrs = all_remote_files[remote_file.path]
+				futures[executor.submit(borrow_channel, free, get_resumable, remote_file.path, local_file,
+										attrs.st_size, attrs.st_mtime)] = (remote_file, local_file)
+
+			ct = 0
+			for future in as_completed(futures):
+				remote_file, local_file = futures[future]
+
+				try:
+					future.result()
+				except Exception as e:
+					logger.warning(f'Remote file {remote_file.relpath} failed to download with {e.args}. It will '
+								   'resume from where it left off next time.')
+					continue
+
+				if remote_file.local is not None:
+					remote_file.local.st_mtime = remote_file.st_mtime
+					logger.info(f'Remote file {remote_file.relpath} was updated.')
+				else:
+					remote_file.local = LocalFile(remote_file.st_mtime, local_file)
+					session.add(remote_file.local)  # create, relate, and add the local file that was transferred
+					logger.info(f'Remote file {remote_file.relpath} was retrieved and added to local database.')
 
-			if ct % 100 == 0:
-				session.commit()  # routinely commit files in batches of 100
+				ct += 1
+				if ct % batch_size == 0:
+					session.commit()  # routinely commit files in batches
 
 		session.commit()
 
-		session.close()
-		engine.dispose()
+	session.close()
+	con.close()
@@ -8,14 +8,19 @@ The system path is first extended to account for loading modules from their own
 structure is the same and the parent folder is named "Summit" (per cloning from Git), or "summmit_master",
 the original directory name, the will find the correct directories and add them to the system path.
 
-Log and data files are sync to several folders in the FTP directory, and move_log_files() moves these to Summit/data/...
-
-move_log_files() runs asynchronously, every five minutes, and is scheduled prior to main(), so it works independently.
-It checks for and transfers any new files before sleeping for another five minutes.
-
-All other processors run sequentially (as defined in main()), every 10 minutes.
-
-Sleeps are blocked into 30s periods to permit keyboard interrupts and easy restarts of the whole processing sequence.
+Log and data files are sync to several folders in the FTP directory, and watch_log_files() moves these to
+Summit/data/... as they arrive. It watches the sync directories for filesystem events (or polls them if watchdog isn't
+installed), and triggers only the processor that owns each new file, so data is processed within seconds instead of
+waiting for the next interval. The watcher is restarted if it stops on an error, and sync_log_files() is also scheduled
+every 10 minutes to move anything it missed.
+
+All other processors are run by a Scheduler (see summit_core), which runs independent processors side-by-side in a
+process pool, each on its own interval as a fallback to being triggered by new files. Jobs that depend on others, like
+dual_plot_methane() on the methane and Picarro processors, run once their dependencies have finished and reported new
+data. Jobs that write the same database, like the Picarro processor and archiver, are never run at the same time.
+
+The scheduler checks for due jobs every 30s, or as soon as one is triggered or finishes, to permit keyboard interrupts
+and easy restarts of the whole processing sequence.
 """
 
 import sys
@@ -26,47 +31,102 @@ for d in processor_dirs:
     sys.path.append(str(d))
 
 from voc_main_loop import main as voc_processor
+from voc_main_loop import reidentify_windows
 from methane_main_loop import main as methane_processor
 from methane_main_loop import dual_plot_methane
 from picarro_main_loop import main as picarro_processor
+from picarro_main_loop import archive_old_data as picarro_archiver
 from error_main_loop import check_for_new_data, check_existing_errors
 from summit_daily import check_load_dailies as daily_processor
 from summit_daily import plot_dailies
-from summit_core import check_send_plots, move_log_files
+from summit_core import check_send_plots, watch_log_files, sync_log_files
 from summit_errors import send_processor_email
 import asyncio
 
 
 async def main(logger):
-    errors = []  # initiate with no errors
-
-    while True:
-        """
-        Processors that are passed a logger will log to /core, others will log to their individual directories/files.
-        """
-
-        dailies = await asyncio.create_task(daily_processor(logger))
-        if dailies:
-            daily_plots = await asyncio.create_task(plot_dailies(logger))
-
-        vocs = await asyncio.create_task(voc_processor())
-        methane = await asyncio.create_task(methane_processor())
-        picarro = await asyncio.create_task(picarro_processor())
+    """
+    Processors that are given a logger_name will log to /core, others will log to their individual directories/files.
+    Intervals are in seconds. New files trigger their processor through watch_log_files(). Jobs that do long writes to
+    the same database are given it in databases, so the Scheduler never runs them at the same time.
+
+    Every database's schema is created once here, before the Scheduler starts its worker processes, and the Scheduler
+    passes the record of them to every worker, so processors don't check them on every connection.
+    """
+    from summit_core import ScheduledJob, Scheduler
+    from summit_core import core_dir, voc_dir, methane_dir, picarro_dir
+    from summit_core import create_schemas, Config, Plot, MovedFile, Rollup
+    from summit_voc import Base as VocBase
+    from summit_methane import Base as MethaneBase
+    from summit_picarro import Base as PicarroBase
+    from summit_daily import Base as DailyBase
 
-        if methane or picarro:
-            await asyncio.create_task(dual_plot_methane(logger))
+    try:
+        create_schemas([('sqlite:///summit_core.sqlite', core_dir, [Config, Plot, MovedFile]),
+                        ('sqlite:///summit_voc.sqlite', voc_dir, [VocBase, Rollup]),
+                        ('sqlite:///summit_methane.sqlite', methane_dir, [MethaneBase, Rollup]),
+                        ('sqlite:///summit_picarro.sqlite', picarro_dir, [PicarroBase, Rollup]),
+                        ('sqlite:///summit_daily.sqlite', core_dir, [DailyBase])])
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred while creating database schemas, they will be created on first use.')
+        send_processor_email('MAIN', exception=e)
 
-        if vocs or methane or picarro:
-            await asyncio.create_task(check_send_plots(logger))
+    errors = []  # initiate with no errors
 
-        errors = await asyncio.create_task(check_for_new_data(logger, active_errors=errors))
+    async def check_errors():
+        nonlocal errors
+        errors = await check_for_new_data(logger, active_errors=errors)
 
         if errors:
-            errors = await asyncio.create_task(check_existing_errors(logger, active_errors=errors))
-
-        print('Sleeping...')
-        for i in range(40):
-            await asyncio.sleep(30)
+            errors = await check_existing_errors(logger, active_errors=errors)
+
+        return False  # nothing depends on error checking
+
+    async def sync_files():
+        await sync_log_files(logger, on_new_data=trigger_file_type)
+        return False  # processors are triggered directly for the types that had new files
+
+    async def watch_files():
+        while True:
+            await watch_log_files(logger, on_new_data=trigger_file_type)
+            logger.warning('watch_log_files() stopped, restarting it in 60s.')
+            await asyncio.sleep(60)
+
+    jobs = [
+        ScheduledJob('daily_processor', daily_processor, interval=30 * 60, databases=['daily'],
+                     logger_dir=core_dir, logger_name='daily_processor'),
+        ScheduledJob('plot_dailies', plot_dailies, depends_on=['daily_processor'],
+                     logger_dir=core_dir, logger_name='plot_dailies'),
+        ScheduledJob('voc_processor', voc_processor, interval=10 * 60, databases=['voc']),
+        ScheduledJob('reidentify_windows', reidentify_windows, depends_on=['voc_processor'], databases=['voc'],
+                     logger_dir=core_dir, logger_name='reidentify_windows'),
+        ScheduledJob('methane_processor', methane_processor, interval=10 * 60, databases=['methane']),
+        ScheduledJob('picarro_processor', picarro_processor, interval=5 * 60, databases=['picarro']),
+        ScheduledJob('picarro_archiver', picarro_archiver, interval=24 * 60 * 60, databases=['picarro'],
+                     logger_dir=core_dir, logger_name='picarro_archiver'),
+        ScheduledJob('dual_plot_methane', dual_plot_methane, depends_on=['methane_processor', 'picarro_processor'],
+                     logger_dir=core_dir, logger_name='dual_plot_methane'),
+        ScheduledJob('check_send_plots', check_send_plots,
+                     depends_on=['plot_dailies', 'voc_processor', 'methane_processor', 'picarro_processor',
+                                 'dual_plot_methane'],
+                     logger_dir=core_dir, logger_name='check_send_plots'),
+        ScheduledJob('check_errors', check_errors, interval=20 * 60, in_pool=False),
+        ScheduledJob('sync_log_files', sync_files, interval=10 * 60, in_pool=False)
+    ]
+
+    file_type_jobs = {'voc': 'voc_processor', 'methane': 'methane_processor', 'daily': 'daily_processor',
+                      'picarro': 'picarro_processor'}
+
+    scheduler = Scheduler(jobs, logger)
+
+    def trigger_file_type(type_):
+        scheduler.trigger(file_type_jobs[type_])
+
+    watcher = asyncio.ensure_future(watch_files())
+    try:
+        await scheduler.run()
+    finally:
+        watcher.cancel()
 
 
 if __name__ == '__main__':
@@ -83,7 +143,6 @@ if __name__ == '__main__':
         raise e
 
     loop = asyncio.get_event_loop()
-    loop.create_task(move_log_files(logger))
     loop.create_task(main(logger))
 
     loop.run_forever()
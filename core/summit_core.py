@@ -2,13 +2,16 @@ import os
 import json
 import asyncio
 from pathlib import Path
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+from multiprocessing.managers import BaseManager
 import datetime as dt
 from datetime import datetime
 
 from sqlalchemy.types import TypeDecorator, VARCHAR
 from sqlalchemy.ext.mutable import MutableDict, MutableList
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Index
 
 Base = declarative_base()
 
@@ -37,6 +40,7 @@ picarro_dir = project_dir / 'processors/summit_picarro_processor'
 methane_dir = project_dir / 'processors/summit_methane_processor'
 error_dir = project_dir / 'processors/errors'
 core_dir = project_dir / 'core'
+picarro_archive_dir = picarro_dir / 'archive'  # monthly archives of old Picarro data, see archive_months()
 taylor_basepath = '/data/web/htdocs/instaar/groups/arl/res_parameters/summit_plots'
 
 processor_dirs = [voc_dir, picarro_dir, methane_dir, error_dir, core_dir]
@@ -61,6 +65,17 @@ picarro_logs_sync = data_file_paths.get('picarro_logs_sync')
 
 taylor_auth = data_file_paths.get('taylor_server_auth')
 
+rollup_periods = {'5min': '5min', 'hourly': '1h', 'daily': '1D'}  # pandas frequencies for each Rollup period
+
+plot_cache_filename = 'plot_cache.json'  # hashes of the inputs to each plot in a directory, see cached_plot()
+unchanged_plots = set()  # paths of plots that weren't redrawn this process since their inputs hadn't changed
+figures = OrderedDict()  # {key: (figure, axes)} of the plots drawn most recently this process, see reuse_figure()
+max_figures = 32  # figures kept for reuse in each process, the least recently used are closed past this
+render_service = None  # proxy to the Scheduler's RenderService, set in each job process, see render_plots()
+sftp_pools = {}  # {pid: SFTPPool} of open connections for uploading, see get_sftp_pool()
+
+PlotSpec = namedtuple('PlotSpec', 'func directory args kwargs')  # a plot to draw with render_plots()
+
 
 class Config(Base):
     """
@@ -74,7 +89,8 @@ class Config(Base):
     id = Column(Integer, primary_key=True)
 
     processor = Column(String, unique=True)  # only one config per processor
-    filesize = Column(Integer)
+    filesize = Column(Integer)  # for PA logs, the byte offset read to by read_new_lines()
+    file_id = Column(String)  # for PA logs, identifies the file read to filesize, see read_new_bytes()
     pa_startline = Column(Integer)
     last_data_date = Column(DateTime)
     days_to_plot = Column(Integer)
@@ -170,6 +186,42 @@ class Plot(Base):
         return self._name
 
 
+class Rollup(Base):
+    """
+    Rollups are summary statistics of one data series (ie 'co', or 'ethane') over a fixed period, so plots and analyses
+    don't need to re-aggregate raw data every time. Unlike the other core models, they're kept in each processor's own
+    database next to the data they summarize, and are only re-calculated for periods that received new data, see
+    update_rollups().
+    """
+    __tablename__ = 'rollups'
+    __table_args__ = (Index('ix_rollups_series_period_date', 'series', 'period', 'date', unique=True),)
+
+    id = Column(Integer, primary_key=True)
+
+    series = Column(String)
+    period = Column(String)  # a key of rollup_periods, ie '5min'
+    date = Column(DateTime)  # start of the period
+    median = Column(Float)
+    mean = Column(Float)
+    stdev = Column(Float)
+    count = Column(Integer)
+
+    def __init__(self, series, period, date, median=None, mean=None, stdev=None, count=0):
+        self.series = series
+        self.period = period
+        self.date = date
+        self.median = median
+        self.mean = mean
+        self.stdev = stdev
+        self.count = count
+
+    def __str__(self):
+        return f'<Rollup of {self.series} for {self.period} at {self.date}>'
+
+    def __repr__(self):
+        return f'<Rollup of {self.series} for {self.period} at {self.date}>'
+
+
 MutableList.associate_with(JList)
 MutableDict.associate_with(JDict)
 
@@ -203,29 +255,147 @@ def configure_logger(rundir, name):
     return logger
 
 
+engines = {}  # process-wide registry of {(pid, database url): (engine, sessionmaker)}, see connect_to_db()
+schemas = set()  # {(database url, table names of schema)} that have already been created, see create_schema()
+
+
+def database_url(engine_str, directory):
+    """
+    Make a relative SQLite connection string absolute, so the database can be found without changing directories.
+
+    :param engine_str: connection string for the database, ie 'sqlite:///summit_voc.sqlite'
+    :param directory: directory the database should be in
+    :return: sqlalchemy URL
+    """
+    from sqlalchemy.engine.url import make_url
+
+    url = make_url(engine_str)
+
+    if url.drivername.startswith('sqlite') and url.database and not os.path.isabs(url.database):
+        url = url.set(database=str(Path(directory).resolve() / url.database))
+
+    return url
+
+
 def connect_to_db(engine_str, directory):
     """
     Takes string name of the database to create/connect to, and the directory it should be in.
 
+    Engines are kept in a process-wide registry keyed by database, so only the first call for each database in a
+    process creates an engine; every later call only creates a new session from the same engine. The registry is also
+    keyed by process id so processes forked by the Scheduler never share connections with their parent.
+
+    Engines are never disposed. SQLite files are pooled with a QueuePool (older SQLAlchemy defaults to NullPool, which
+    reconnects for every session), so closing a session only returns its connection to the pool, and each connection
+    and its pragmas are set up once per process instead of every time a database is used.
+
+    SQLite connections are opened in WAL mode with the other settings in summit_migrations.sqlite_pragmas, so reading
+    a database (ie for plotting) doesn't block writing to it.
+
     :param engine_str: connection string for the database
     :param directory: directory the database should in (created?) in
-    :return: engine, session, Base
+    :return: engine, session
 
     Example:
-    engine, session, Base = connect_to_db('sqlite:///reservoir.sqlite', dir)
+    engine, session = connect_to_db('sqlite:///reservoir.sqlite', dir)
     """
 
-    from sqlalchemy import create_engine
+    from sqlalchemy import create_engine, event
     from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import QueuePool
+    from summit_migrations import set_sqlite_pragmas
 
-    # Base = declarative_base()  # needed to subclass for sqlalchemy objects
+    url = database_url(engine_str, directory)
+    key = (os.getpid(), str(url))
+
+    if key not in engines:
+        if url.drivername.startswith('sqlite') and url.database and url.database != ':memory:':
+            # connections are returned to the pool from whichever thread closed the session
+            engine = create_engine(url, poolclass=QueuePool, connect_args={'check_same_thread': False})
+        else:
+            engine = create_engine(url)
+
+        if url.drivername.startswith('sqlite'):
+            event.listen(engine, 'connect', set_sqlite_pragmas)
+        engines[key] = (engine, sessionmaker(bind=engine))
+
+    engine, sessy = engines[key]
+
+    return engine, sessy()
 
-    with TempDir(directory):
-        engine = create_engine(engine_str)
-    sessy = sessionmaker(bind=engine)
-    sess = sessy()
 
-    return engine, sess
+def create_schema(engine, schema):
+    """
+    Create any missing tables, and any columns missing from existing tables, for a declarative Base or a single model.
+    Any indexes in summit_migrations.indexes for the new tables are then created.
+    This is only done once per database, so it can be called every time a database is connected to without querying
+    the database's schema each time. summit.py creates every schema with create_schemas() before starting the
+    Scheduler, which passes the record of them to every worker process it starts (see init_job_process()), so they
+    never check again. Schemas are recorded by their table names rather than by object, so the record means the same
+    in processes that were spawned (ie on Windows) and imported their own copy of every model.
+
+    :param engine: sqlalchemy engine, ie from connect_to_db()
+    :param schema: a declarative Base to create all tables for, or a single model, ie Config
+    :return: None
+    """
+    if hasattr(schema, '__table__'):
+        tables = [schema.__table__]
+    else:
+        tables = list(schema.metadata.sorted_tables)
+
+    key = (str(engine.url), tuple(sorted(table.name for table in tables)))
+
+    if key in schemas:
+        return
+
+    from summit_migrations import migrate
+
+    for table in tables:
+        table.create(engine, checkfirst=True)
+        add_missing_columns(engine, table)
+
+    migrate(engine)
+
+    schemas.add(key)
+
+
+def create_schemas(databases):
+    """
+    Create the schemas of every database once, ie at startup before any processors run.
+
+    :param databases: list, of (engine_str, directory, list of schemas) tuples, see connect_to_db() and create_schema()
+    :return: None
+    """
+    for engine_str, directory, database_schemas in databases:
+        engine, session = connect_to_db(engine_str, directory)
+        session.close()
+
+        for schema in database_schemas:
+            create_schema(engine, schema)
+
+
+def add_missing_columns(engine, table):
+    """
+    create_all() only creates missing tables, so columns added to a model after its database was created are added to
+    the existing table here. New columns are left null for existing rows.
+
+    :param engine: sqlalchemy engine, connected to the database
+    :param table: sqlalchemy Table, ie DataFile.__table__
+    :return: list, of names of the columns that were added
+    """
+    from sqlalchemy import inspect, text
+
+    existing_columns = [c['name'] for c in inspect(engine).get_columns(table.name)]
+
+    added = []
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing_columns:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} '
+                                  + f'{column.type.compile(engine.dialect)}'))
+                added.append(column.name)
+
+    return added
 
 
 def check_filesize(filepath):
@@ -245,6 +415,124 @@ def check_filesize(filepath):
         return
 
 
+def read_new_bytes(filepath, offset, file_id=None):
+    """
+    Read only the complete lines appended to a file since it was last read to the given byte offset. Partially written
+    last lines are left for the next read. If the file is smaller than the offset, the offset doesn't fall at the end
+    of a line, or its first line is not the one it had when last read, the file was truncated or replaced and is read
+    again from the start.
+
+    :param filepath: Path, of the file to read
+    :param offset: int, byte offset that the file was previously read to, 0 to read the whole file
+    :param file_id: str, id returned when the file was last read to offset, or None if it isn't known
+    :return: tuple, (bytes of complete lines, int offset to pass the next time the file is read, str file_id to pass
+        with it); if the returned offset equals the number of bytes returned, the file was read from the start
+    """
+    import logging
+    from hashlib import sha1
+
+    logger = logging.getLogger(__name__)
+
+    offset = offset if offset else 0
+
+    with open(filepath, 'rb') as file:
+        first_line = file.readline()
+        new_file_id = sha1(first_line).hexdigest() if first_line.endswith(b'\n') else None
+
+        size = file.seek(0, 2)
+
+        if offset and file_id and new_file_id != file_id:
+            logger.warning(f'File {filepath.name} was replaced since last read and will be read from the start.')
+            offset = 0
+        elif offset > size:
+            logger.warning(f'File {filepath.name} is smaller than when last read and will be read from the start.')
+            offset = 0
+        elif offset:
+            file.seek(offset - 1)
+            if file.read(1) != b'\n':
+                logger.warning(f'File {filepath.name} changed since last read and will be read from the start.')
+                offset = 0
+
+        if offset == size:
+            return b'', offset, new_file_id
+
+        file.seek(offset)
+        contents = file.read()
+
+    last_newline = contents.rfind(b'\n')
+
+    if last_newline == -1:
+        return b'', offset, new_file_id  # no complete lines yet
+
+    return contents[:last_newline + 1], offset + last_newline + 1, new_file_id
+
+
+def read_new_lines(filepath, offset, file_id=None):
+    """
+    Read only the complete lines appended to a file since it was last read to the given byte offset, see
+    read_new_bytes().
+
+    :param filepath: Path, of the file to read
+    :param offset: int, byte offset that the file was previously read to, 0 to read the whole file
+    :param file_id: str, id returned when the file was last read to offset, or None if it isn't known
+    :return: tuple, (list of str lines, int offset to pass the next time the file is read, str file_id to pass with it)
+    """
+    contents, offset, file_id = read_new_bytes(filepath, offset, file_id)
+
+    return contents.decode('utf-8', errors='replace').splitlines(), offset, file_id
+
+
+def scan_directory(directory, match=''):
+    """
+    Get the size and modification time of every file in a directory (not recursively), from a single scandir().
+
+    :param directory: Path, directory to scan
+    :param match: str, only files with this in their name are included, ie 'l.txt'
+    :return: dict, of {filename: [size, mtime]}
+    """
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if match in entry.name and entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime]
+
+    return files
+
+
+def read_manifest(path):
+    """
+    :param path: Path, of a manifest written by write_manifest()
+    :return: dict, of {filename: [size, mtime]}, or empty if there's no manifest yet
+    """
+    try:
+        return json.loads(path.read_text()) if path.exists() else {}
+    except ValueError:
+        return {}  # a corrupt manifest only means every file is checked once
+
+
+def write_manifest(path, manifest):
+    """
+    Write a manifest under a temporary name and then rename it, so it's never read half-written.
+
+    :param path: Path, of the manifest
+    :param manifest: dict, of {filename: [size, mtime]}, ie from scan_directory()
+    :return: None
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(json.dumps(manifest))
+    os.replace(tmp_path, path)
+
+
+def find_changed_files(manifest, current):
+    """
+    :param manifest: dict, of {filename: [size, mtime]} from the last scan, ie from read_manifest()
+    :param current: dict, of {filename: [size, mtime]} from scan_directory()
+    :return: set, of filenames that are new, or have changed size or modification time since the last scan
+    """
+    return {name for name, stats in current.items() if manifest.get(name) != stats}
+
+
 def list_files_recur(path):
     """
     :param path: pathlib Path object
@@ -310,45 +598,339 @@ def search_for_attr_value(obj_list, attr, value):
     return next((obj for obj in obj_list if getattr(obj, attr, None) == value), None)
 
 
+@lru_cache(maxsize=512)
+def julian_day(prefix):
+    """
+    Get midnight of a day written as '%Y%j' or '%y%j', ie '2019254' or '19254'. Results are cached, since every line or
+    file from the same day shares its prefix.
+
+    :param prefix: str, four or two-digit year followed by the three-digit day of year
+    :return: datetime
+    """
+    if len(prefix) not in (5, 7) or not (prefix.isascii() and prefix.isdigit()):
+        raise ValueError(f"day '{prefix}' does not match format '%Y%j' or '%y%j'")
+
+    year, doy = int(prefix[:-3]), int(prefix[-3:])
+
+    if len(prefix) == 5:
+        year += 2000 if year < 69 else 1900  # same century rule as strptime's %y
+
+    if not 1 <= doy <= 366:
+        raise ValueError(f'day of year {doy} is out of range')
+
+    return datetime(year, 1, 1) + dt.timedelta(days=doy - 1)
+
+
+def short_fields(*fields):
+    """
+    Check that fields are one or two digits, as strptime() reads %m, %d, %H, %M and %S, since int() also accepts signs,
+    spaces and underscores.
+
+    :param fields: str, each a field of a timestamp
+    :return: boolean, True if every field is one or two ASCII digits
+    """
+    return all(1 <= len(field) <= 2 and field.isascii() and field.isdigit() for field in fields)
+
+
+@lru_cache(maxsize=512)
+def calendar_day(value):
+    """
+    Get midnight of a day written as '%m/%d/%Y', ie '9/11/2019' as PeakSimple writes them. Results are cached, since
+    every line from the same day shares its date.
+
+    :param value: str, month/day/four-digit year
+    :return: datetime
+    """
+    month, day, year = value.split('/')
+
+    if not (len(year) == 4 and year.isdigit() and short_fields(month, day)):
+        raise ValueError(f"date '{value}' does not match format '%m/%d/%Y'")
+
+    return datetime(int(year), int(month), int(day))
+
+
+def _labview_date(value):
+    """'%Y%j%H%M%S', ie '2019254061643'"""
+    if len(value) != 13 or not (value.isascii() and value.isdigit()):
+        raise ValueError(f"time data '{value}' does not match format '%Y%j%H%M%S'")
+    return julian_day(value[:7]).replace(hour=int(value[7:9]), minute=int(value[9:11]), second=int(value[11:]))
+
+
+def _daily_date(value):
+    """'%y%j%H%M', ie '192540616'"""
+    if len(value) != 9 or not (value.isascii() and value.isdigit()):
+        raise ValueError(f"time data '{value}' does not match format '%y%j%H%M'")
+    return julian_day(value[:5]).replace(hour=int(value[5:7]), minute=int(value[7:]))
+
+
+def _peaksimple_date(value):
+    """'%m/%d/%Y %H:%M:%S', ie '9/11/2019 6:16:43'"""
+    day, time = value.split(' ')
+    hour, minute, second = time.split(':')
+    if not short_fields(hour, minute, second):
+        raise ValueError(f"time data '{value}' does not match format '%m/%d/%Y %H:%M:%S'")
+    return calendar_day(day).replace(hour=int(hour), minute=int(minute), second=int(second))
+
+
+def _crf_date(value):
+    """'%m/%d/%Y %H:%M', ie '9/11/2019 6:16'"""
+    day, time = value.split(' ')
+    hour, minute = time.split(':')
+    if not short_fields(hour, minute):
+        raise ValueError(f"time data '{value}' does not match format '%m/%d/%Y %H:%M'")
+    return calendar_day(day).replace(hour=int(hour), minute=int(minute))
+
+
+date_parsers = {'%Y%j%H%M%S': _labview_date, '%y%j%H%M': _daily_date,
+                '%m/%d/%Y %H:%M:%S': _peaksimple_date, '%m/%d/%Y %H:%M': _crf_date}
+
+
+def parse_date(value, fmt):
+    """
+    Parse one timestamp, like datetime.strptime(value, fmt), but with hand-written parsers for the fixed formats
+    written by the instruments (see date_parsers), which share cached days. Other formats fall back to strptime(), as
+    do timestamps the hand-written parsers can't read, ie '19254061' with its minute unpadded, so anything strptime()
+    accepts is still accepted. The one exception is non-ASCII digits, which strptime() allows but are rejected for the
+    instrument formats, since they only come from corrupted files.
+
+    :param value: str, timestamp to parse
+    :param fmt: str, strptime format of the timestamp
+    :return: datetime
+    """
+    parser = date_parsers.get(fmt)
+
+    if parser is None:
+        return datetime.strptime(value, fmt)
+
+    if not value.isascii():
+        raise ValueError(f"time data '{value}' does not match format '{fmt}'")
+
+    try:
+        return parser(value)
+    except ValueError:
+        return datetime.strptime(value, fmt)  # raises the same ValueError strptime() would if it can't be parsed
+
+
+def parse_dates(values, fmt, errors='raise'):
+    """
+    Parse a whole column of timestamps at once. The fixed-width Julian formats are converted digit-by-digit with NumPy,
+    and all others are given to pandas.to_datetime(). Julian timestamps that aren't the usual width (ie with unpadded
+    fields) are parsed one at a time with strptime(), and non-ASCII digits are rejected, the same as with parse_date().
+
+    :param values: list, of str timestamps
+    :param fmt: str, strptime format of the timestamps
+    :param errors: str, 'raise' to raise a ValueError for any unparseable value, or 'coerce' to return NaT for them
+    :return: numpy array, of datetime64[us], which .tolist() turns into datetimes (and None for NaT)
+    """
+    import numpy as np
+
+    widths = {'%Y%j%H%M%S': (13, 4), '%y%j%H%M': (9, 2)}  # {format: (width, year digits)}
+
+    if fmt not in widths:
+        import pandas as pd
+        return pd.to_datetime(pd.Series(values, dtype=object), format=fmt, errors=errors).to_numpy('datetime64[us]')
+
+    width, year_digits = widths[fmt]
+    values = np.asarray(values, dtype=str)
+    dates = np.full(values.shape, np.datetime64('NaT'), dtype='datetime64[us]')
+
+    valid = (np.char.str_len(values) == width) & np.char.isdigit(values)
+    valid[valid] = np.char.str_len(np.char.encode(values[valid])) == width  # isdigit() allows non-ASCII digits
+
+    digits = values[valid].astype(f'S{width}').view('uint8').reshape(-1, width).astype('int64') - ord('0')
+
+    def number(start, stop):
+        return digits[:, start:stop] @ 10 ** np.arange(stop - start - 1, -1, -1)
+
+    year, doy = number(0, year_digits), number(year_digits, year_digits + 3)
+    hour, minute = number(year_digits + 3, year_digits + 5), number(year_digits + 5, year_digits + 7)
+    second = number(year_digits + 7, width) if width > year_digits + 7 else np.zeros_like(year)
+
+    if year_digits == 2:
+        year = year + np.where(year < 69, 2000, 1900)
+
+    in_range = (doy >= 1) & (doy <= 366) & (hour < 24) & (minute < 60) & (second < 60)
+
+    days = (year - 1970).astype('datetime64[Y]').astype('datetime64[D]') + (doy - 1)
+    seconds = (hour * 3600 + minute * 60 + second).astype('timedelta64[s]')
+    parsed = np.where(in_range, days + seconds, np.datetime64('NaT'))
+
+    dates[valid] = parsed
+
+    ascii_ = np.char.str_len(np.char.encode(values)) == np.char.str_len(values)
+    for ind in np.flatnonzero(np.isnat(dates) & ascii_):
+        try:
+            dates[ind] = datetime.strptime(values[ind], fmt)
+        except ValueError:
+            pass
+
+    if errors == 'raise' and np.isnat(dates).any():
+        bad = values[np.isnat(dates)][0]
+        raise ValueError(f"time data '{bad}' does not match format '{fmt}'")
+
+    return dates
+
+
 def find_closest_date(date, list_of_dates, how='abs'):
     """
     This is a helper function that works on Python datetimes. It returns the closest date value, either absolutely,
-    or closest without being above/below, and the timedelta from the provided date.
+    or closest without being above/below, and the timedelta from the provided date. To match many dates at once, use
+    match_dates().
 
     :param date: datetime
     :param list_of_dates: list, of datetimes
     :param how: ['abs', 'pos','neg']
             'abs': Absolute closest datetime, either above or below the given date
-            'pos': Matched datetime must be greater than given date
-            'neg': Matched datetime must be less than given date
+            'pos': Matched datetime must be greater than or equal to given date
+            'neg': Matched datetime must be less than or equal to given date
     :return: match, delta: the matching date from the list, and it's difference to the original as a timedelta
     """
+    matches = match_dates([date], list_of_dates, how=how)
 
-    if how == 'abs':
-        try:
-            match = min(list_of_dates, key=lambda x: abs(x - date))
-        except ValueError:
-            return None, None
-    elif how == 'pos':
-        try:
-            deltas = [list_date - date for list_date in list_of_dates if list_date - date >= dt.timedelta(0)]
-            match = min(deltas)
-        except ValueError:
-            return None, None
-    elif how == 'neg':
-        try:
-            deltas = [list_date - date for list_date in list_of_dates if list_date - date <= dt.timedelta(0)]
-            match = max(deltas)
-        except ValueError:
-            return None, None
-    else:
-        assert False, "Supplied 'how' not in ['abs', 'pos', 'neg']"
+    if not matches:
+        return None, None
 
+    match = list_of_dates[matches[0][1]]
     delta = match - date
 
     return match, delta
 
 
+def match_dates(dates, candidates, how='abs', tolerance=None, exact=True):
+    """
+    Match every date in dates to its closest date in candidates, by binary search over the sorted candidates. This
+    takes O((n + m) log m) instead of the O(n * m) of calling find_closest_date() for each date. Candidates can be
+    matched to more than one date. Candidates equal to a date are its closest, like with find_closest_date(), so with
+    exact=False a date whose closest candidate is equal to it is left unmatched, as if it had no match at all.
+
+    :param dates: list, of datetimes to find matches for
+    :param candidates: list, of datetimes to match to, in any order
+    :param how: ['abs', 'pos','neg']
+            'abs': Absolute closest datetime, either above or below the given date
+            'pos': Matched datetime must be greater than or equal to given date
+            'neg': Matched datetime must be less than or equal to given date
+    :param tolerance: timedelta, matches must be less than this far from their date, or None to allow any match
+    :param exact: boolean, False to leave dates unmatched if their closest candidate is the same date
+    :return: list, of (date index, candidate index) tuples, for every date that had a match
+    """
+    from bisect import bisect_left, bisect_right
+
+    assert how in ['abs', 'pos', 'neg'], "Supplied 'how' not in ['abs', 'pos', 'neg']"
+
+    order = sorted(range(len(candidates)), key=lambda i: candidates[i])
+    sorted_candidates = [candidates[i] for i in order]
+
+    matches = []
+    for ind, date in enumerate(dates):
+        options = []
+
+        if how in ['abs', 'pos']:
+            after = bisect_left(sorted_candidates, date)  # first candidate >= date
+            if after < len(sorted_candidates):
+                options.append(after)
+
+        if how in ['abs', 'neg']:
+            before = bisect_right(sorted_candidates, date) - 1  # last candidate <= date
+            if before >= 0:
+                options.append(before)
+
+        if not options:
+            continue
+
+        best = min(options, key=lambda i: abs(sorted_candidates[i] - date))
+
+        if not exact and sorted_candidates[best] == date:
+            continue
+
+        if tolerance is not None and not abs(sorted_candidates[best] - date) < tolerance:
+            continue
+
+        matches.append((ind, order[best]))
+
+    return matches
+
+
+class IntervalIndex:
+    """
+    An IntervalIndex answers which of a set of objects with date_start and date_end attributes (ie Crfs or
+    CompoundWindows) covers a date, using a binary search over their sorted start dates. It's built once per pass from
+    everything in the table, rather than scanning or querying for every date.
+
+    Gaps and overlaps between intervals are found while building the index and kept for QC. Overlapping intervals
+    shouldn't exist, but if they do, the one that started most recently covers the overlapped period, and lookups fall
+    back to checking every earlier interval.
+    """
+
+    def __init__(self, intervals, include_start=True):
+        """
+        :param intervals: list, of objects with date_start and date_end attributes
+        :param include_start: boolean, True if a date equal to an interval's date_start is in it, False if intervals are
+            exclusive of both ends. date_end is always exclusive.
+        """
+        self.intervals = sorted([i for i in intervals if i.date_start is not None and i.date_end is not None],
+                                key=lambda i: i.date_start)
+        self.starts = [i.date_start for i in self.intervals]
+        self.include_start = include_start
+
+        self.gaps = []  # list of (end, next start) tuples
+        self.overlaps = []  # list of (interval, interval) tuples
+
+        latest = None  # interval with the latest end so far
+        for interval in self.intervals:
+            if latest is not None:
+                if interval.date_start < latest.date_end:
+                    self.overlaps.append((latest, interval))
+                elif interval.date_start > latest.date_end:
+                    self.gaps.append((latest.date_end, interval.date_start))
+
+            if latest is None or interval.date_end > latest.date_end:
+                latest = interval
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def find(self, date):
+        """
+        :param date: datetime, to find the covering interval for
+        :return: the interval covering date, or None
+        """
+        from bisect import bisect_left, bisect_right
+
+        if self.include_start:
+            ind = bisect_right(self.starts, date) - 1  # last interval starting at or before date
+        else:
+            ind = bisect_left(self.starts, date) - 1  # last interval starting before date
+
+        if ind < 0:
+            return None
+
+        # without overlaps, only the last interval to start can cover the date
+        candidates = reversed(self.intervals[:ind + 1]) if self.overlaps else [self.intervals[ind]]
+
+        return next((i for i in candidates if date < i.date_end), None)
+
+    def find_all(self, dates):
+        """
+        :param dates: list, of datetimes
+        :return: list, parallel to dates, of the covering interval for each date, or None
+        """
+        return [self.find(date) for date in dates]
+
+    def log_qc(self, logger, name='interval'):
+        """
+        Log any gaps or overlaps found in the intervals as warnings.
+
+        :param logger: logging logger to log to
+        :param name: str, what the intervals are called in the log, ie 'CRF'
+        :return: None
+        """
+        for end, start in self.gaps:
+            logger.warning(f'No {name} covers the period from {end} to {start}.')
+
+        for first, second in self.overlaps:
+            logger.warning(f'The {name} starting {second.date_start} overlaps the {name} ending {first.date_end}.')
+
+
 def create_daily_ticks(days_in_plot, minors_per_day=4):
     """
     Takes a number of days to plot back, and creates major (1 day) and minor (6 hour) ticks.
@@ -387,6 +969,119 @@ def five_minute_medians(dates, vals):
     return df.index.tolist(), df['vals'].tolist()
 
 
+def rollup_bounds(date_start, date_end):
+    """
+    Expand a date range to whole days, which contain whole periods for every length in rollup_periods. Rollups are
+    always updated for whole days so no period is calculated from only part of its data.
+
+    :param date_start: datetime, earliest date that changed
+    :param date_end: datetime, latest date that changed
+    :return: datetime, datetime; midnight of date_start's day, and midnight after date_end's day
+    """
+    day_start = datetime(date_start.year, date_start.month, date_start.day)
+    day_end = datetime(date_end.year, date_end.month, date_end.day) + dt.timedelta(days=1)
+
+    return day_start, day_end
+
+
+def update_rollups(conn, data, date_start, date_end, periods=None):
+    """
+    Re-calculate the Rollups of every series in data for all periods between two dates. Existing Rollups in that range
+    are replaced, and periods that no longer have any data have their Rollups removed. Nothing is committed, so this can
+    be part of the same transaction as the data it summarizes.
+
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param data: DataFrame, with a 'date' column and one column per series, containing all data between the dates
+    :param date_start: datetime, start of the first period to update, ie from rollup_bounds()
+    :param date_end: datetime, end of the last period to update, ie from rollup_bounds()
+    :param periods: list, of keys of rollup_periods to update, defaults to all of them
+    :return: int, number of Rollups written
+    """
+    import pandas as pd
+
+    rollups = Rollup.__table__
+    series = [col for col in data.columns if col != 'date']
+
+    data = data.set_index(pd.to_datetime(data['date']))[series].apply(pd.to_numeric)
+    data = data[(data.index >= date_start) & (data.index < date_end)]
+
+    records = []
+    for period in (periods or rollup_periods):
+        conn.execute(rollups.delete()
+                     .where(rollups.c.series.in_(series))
+                     .where(rollups.c.period == period)
+                     .where(rollups.c.date >= date_start)
+                     .where(rollups.c.date < date_end))
+
+        if data.empty:
+            continue
+
+        stats = data.resample(rollup_periods[period]).agg(['median', 'mean', 'std', 'count'])
+
+        for name in series:
+            name_stats = stats[name][stats[(name, 'count')] > 0]
+            name_stats = name_stats.astype(object).where(name_stats.notna(), None)  # native types, None for NaN
+
+            records.extend({'series': name, 'period': period, 'date': date.to_pydatetime(),
+                            'median': row['median'], 'mean': row['mean'], 'stdev': row['std'],
+                            'count': int(row['count'])}
+                           for date, row in name_stats.iterrows())
+
+    if records:
+        conn.execute(rollups.insert(), records)
+
+    return len(records)
+
+
+def get_rollups(conn, series, period, date_start=None, date_end=None):
+    """
+    Get the Rollups for one series and period, ordered by date.
+
+    :param conn: sqlalchemy Connection or Engine for the database the Rollups are in
+    :param series: str, name of the series, ie 'co'
+    :param period: str, a key of rollup_periods, ie '5min'
+    :param date_start: datetime, earliest period start to get, or None for all
+    :param date_end: datetime, latest period start to get, or None for all
+    :return: DataFrame, with columns ['date', 'median', 'mean', 'stdev', 'count']
+    """
+    import pandas as pd
+    from sqlalchemy import select
+
+    rollups = Rollup.__table__
+    columns = ['date', 'median', 'mean', 'stdev', 'count']
+
+    query = (select(*[rollups.c[col] for col in columns])
+             .where(rollups.c.series == series)
+             .where(rollups.c.period == period)
+             .order_by(rollups.c.date))
+
+    if date_start:
+        query = query.where(rollups.c.date >= date_start)
+    if date_end:
+        query = query.where(rollups.c.date <= date_end)
+
+    rollups = pd.DataFrame(conn.execute(query).fetchall(), columns=columns)
+    rollups['date'] = pd.to_datetime(rollups['date'])  # keep the datetime dtype even when there are no Rollups
+
+    return rollups
+
+
+def get_rollup_medians(conn, series, period, date_start=None, date_end=None):
+    """
+    Get the medians of the Rollups for one series and period as lists, ready to be plotted.
+
+    :param conn: sqlalchemy Connection or Engine for the database the Rollups are in
+    :param series: str, name of the series, ie 'ethane'
+    :param period: str, a key of rollup_periods, ie 'hourly'
+    :param date_start: datetime, earliest period start to get, or None for all
+    :param date_end: datetime, latest period start to get, or None for all
+    :return: dates, medians; lists of the period start datetimes and the medians of each period
+    """
+    rollups = get_rollups(conn, series, period, date_start=date_start, date_end=date_end)
+
+    return list(rollups['date'].dt.to_pydatetime()), rollups['median'].tolist()
+
+
 def connect_to_sftp():
     """
     Uses paramiko to create a connection to the Taylor drive. Relies on authetication information from a JSON file.
@@ -400,26 +1095,474 @@ def connect_to_sftp():
     return client.open_sftp()
 
 
-def add_or_ignore_plot(plot, core_session):
+class LocalSFTPClient:
     """
-    Queries database and adds a plot only if one with the same path doesn't already exist.
-    :param plot: Plot, to be added to database
-    :param core_session: sqlalchemy.Session object
-    :return: None
+    A stand-in for paramiko's SFTPClient that "uploads" to a local directory instead, so SFTPPool can be used without
+    a server, ie SFTPPool(connect=lambda: LocalSFTPClient(some_dir)). Only the calls SFTPPool makes are supported.
     """
-    plots_in_db = [p[0] for p in core_session.query(Plot._path).all()]
 
-    if str(plot.path.resolve()) not in plots_in_db:
-        core_session.add(plot)
-    return
+    def __init__(self, root):
+        self.root = Path(root)
 
+    def _local(self, remote_path):
+        return self.root / remote_path.lstrip('/')
 
-def append_df_to_excel(filename, df, sheet_name='Sheet1', startrow=None,
-                       truncate_sheet=False,
-                       **to_excel_kwargs):
+    def stat(self, remote_path):
+        return self._local(remote_path).stat()
+
+    def put(self, localpath, remote_path):
+        import shutil
+        local = self._local(remote_path)
+        local.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(localpath, local)
+
+    def utime(self, remote_path, times):
+        os.utime(self._local(remote_path), times)
+
+    def get_channel(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class SFTPPool:
     """
-    Append a DataFrame [df] to existing Excel file [filename] into [sheet_name] Sheet.
-    If [filename] doesn't exist, then this function will create it.
+    A pool of open SFTP connections that are reused between uploads, rather than connecting once per remote
+    directory. Idle connections are kept alive with SSH keep-alive packets, and any connection that errors is closed
+    and replaced with a new one the next time one is needed. Uploads are run in a thread for each connection, so
+    up to size files are transferred at once.
+    """
+
+    def __init__(self, size=4, connect=connect_to_sftp, keepalive=30):
+        """
+        :param size: int, the most connections to open and files to transfer at once
+        :param connect: function, returning a new connected SFTPClient, or a stand-in like LocalSFTPClient
+        :param keepalive: int, seconds between keep-alive packets on idle connections
+        """
+        from queue import LifoQueue
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.size = size
+        self.connect = connect
+        self.keepalive = keepalive
+        self.idle = LifoQueue()
+        self.executor = ThreadPoolExecutor(max_workers=size)
+
+    def get_connection(self):
+        """
+        Get an idle connection that's still active, or open a new one if there aren't any.
+
+        :return: SFTPClient
+        """
+        from queue import Empty
+
+        while True:
+            try:
+                con = self.idle.get_nowait()
+            except Empty:
+                break
+
+            channel = con.get_channel()
+            if channel is None or (not channel.closed and channel.get_transport().is_active()):
+                return con
+            con.close()  # dropped by the server while idle
+
+        con = self.connect()
+        channel = con.get_channel()
+        if channel is not None:
+            channel.get_transport().set_keepalive(self.keepalive)
+        return con
+
+    def upload(self, filepath, remote_path):
+        """
+        Upload one file to a remote directory, unless a file of the same name, size and modification time is already
+        there. The remote file is given the local modification time, so it's skipped again until it changes locally.
+
+        :param filepath: pathlib.Path, local file to upload
+        :param remote_path: string, remote directory to upload it to
+        :return: boolean, True if the remote file is now up to date, False if the upload failed
+        """
+        remote_file = f'{remote_path.rstrip("/")}/{filepath.name}'
+
+        try:
+            local = filepath.stat()
+        except OSError:
+            return False  # removed or unreadable since it was listed
+
+        try:
+            con = self.get_connection()
+        except Exception:
+            return False
+
+        try:
+            try:
+                remote = con.stat(remote_file)
+                if remote.st_size == local.st_size and int(remote.st_mtime) == int(local.st_mtime):
+                    self.idle.put(con)
+                    return True
+            except FileNotFoundError:
+                pass
+
+            con.put(str(filepath), remote_file)
+            con.utime(remote_file, (int(local.st_atime), int(local.st_mtime)))
+            self.idle.put(con)
+            return True
+
+        except Exception:
+            con.close()  # the connection may be unusable, so don't return it to the pool
+            return False
+
+    def close(self):
+        """
+        Close all idle connections and stop the upload threads.
+
+        :return: None
+        """
+        from queue import Empty
+
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                break
+        self.executor.shutdown(wait=False)
+
+
+def get_sftp_pool(size=4):
+    """
+    Get the SFTPPool for this process, creating it on first use. Jobs are run in a pool of processes that live as long
+    as summit.py does, so connections are reused between runs of check_send_plots().
+
+    :param size: int, number of connections, only used when the pool is created
+    :return: SFTPPool
+    """
+    pool = sftp_pools.get(os.getpid())
+
+    if pool is None:
+        pool = SFTPPool(size=size)
+        sftp_pools[os.getpid()] = pool
+
+    return pool
+
+
+def plot_inputs_hash(func, args, kwargs):
+    """
+    Hash everything a plot is drawn from; its data, limits, ticks and labels, and the function drawing it.
+
+    :param func: function, the plotting function
+    :param args: tuple, positional arguments to func
+    :param kwargs: dict, keyword arguments to func
+    :return: str, hex digest of the inputs
+    """
+    import pickle
+    import hashlib
+
+    return hashlib.sha1(pickle.dumps((func.__name__, args, sorted(kwargs.items())), protocol=4)).hexdigest()
+
+
+def read_plot_cache(directory):
+    """
+    :param directory: Path, directory the plots are saved in
+    :return: dict, of {plot filename: hash of its inputs}, see cached_plot()
+    """
+    cache_path = Path(directory) / plot_cache_filename
+
+    try:
+        return json.loads(cache_path.read_text()) if cache_path.exists() else {}
+    except ValueError:
+        return {}  # a corrupt cache only means everything is redrawn once
+
+
+def write_plot_cache(directory, cache):
+    """
+    Write the plot cache under a temporary name and then rename it, so it's never read half-written.
+
+    :param directory: Path, directory the plots are saved in
+    :param cache: dict, of {plot filename: hash of its inputs}
+    :return: None
+    """
+    cache_path = Path(directory) / plot_cache_filename
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    tmp_path.write_text(json.dumps(cache))
+    os.replace(tmp_path, cache_path)
+
+
+def find_cached_plot(cache, inputs_hash, directory):
+    """
+    :param cache: dict, of {plot filename: hash of its inputs}, from read_plot_cache()
+    :param inputs_hash: str, from plot_inputs_hash()
+    :param directory: Path, directory the plots are saved in
+    :return: str, filename of the plot drawn from the same inputs if its file still exists, otherwise None
+    """
+    return next((name for name, previous_hash in cache.items()
+                 if previous_hash == inputs_hash and (Path(directory) / name).exists()), None)
+
+
+def cached_plot(func):
+    """
+    Decorator for plotting functions that save a plot to the current directory and return its filename. The hash of
+    each plot's inputs is kept in plot_cache.json in the same directory, and if a plot is requested again with the same
+    inputs and its file still exists, it's not redrawn. The filename is returned either way, and skipped plots are
+    added to unchanged_plots so add_or_ignore_plot() doesn't stage them for uploading again.
+
+    :param func: function, a plotting function, ie summit_voc_plot()
+    :return: function
+    """
+    from functools import wraps
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        inputs_hash = plot_inputs_hash(func, args, kwargs)
+        cache = read_plot_cache('.')
+
+        name = find_cached_plot(cache, inputs_hash, '.')
+        if name:
+            unchanged_plots.add(str(Path(name).resolve()))
+            return name
+
+        name = func(*args, **kwargs)
+
+        cache[str(name)] = inputs_hash
+        write_plot_cache('.', cache)
+
+        unchanged_plots.discard(str(Path(name).resolve()))
+        return name
+
+    return wrapper
+
+
+def reuse_figure(key):
+    """
+    Get the figure and axes last used to draw a plot in this process, or create them. Figures are created without
+    pyplot, so pyplot doesn't track them; only the max_figures most recently used are kept, and older ones are cleared
+    and dropped so they can be garbage collected.
+
+    :param key: hashable, identifying the plot, ie (function name, plot filename)
+    :return: matplotlib Figure, Axes
+    """
+    from matplotlib.figure import Figure
+
+    if key in figures:
+        figures.move_to_end(key)
+    else:
+        f1 = Figure()
+        figures[key] = (f1, f1.gca())
+
+        while len(figures) > max_figures:
+            old_figure, _ = figures.popitem(last=False)[1]
+            old_figure.clear()
+
+    return figures[key]
+
+
+def draw_lines(ax, series, fmt='-o'):
+    """
+    Draw each (x, y) pair as a line. If the axes already has one line per pair (ie it was reused with reuse_figure()),
+    the lines are updated in place with set_data(), otherwise the axes is cleared and re-plotted.
+
+    :param ax: matplotlib Axes
+    :param series: list, of (x, y) pairs of lists
+    :param fmt: str, matplotlib format string for new lines
+    :return: None
+    """
+    lines = ax.get_lines()
+
+    if len(lines) == len(series):
+        for line, (x, y) in zip(lines, series):
+            line.set_data(x, y)
+
+        ax.set_autoscale_on(True)  # limits set on the last draw turned autoscaling off
+        ax.relim()
+        ax.autoscale_view()
+    else:
+        ax.cla()
+        for x, y in series:
+            ax.plot(x, y, fmt)
+
+
+def init_render_worker():
+    """
+    Runs once in each plot rendering process, so matplotlib is loaded with the non-interactive Agg backend before any
+    plots are sent to it.
+
+    :return: None
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from matplotlib.figure import Figure  # import the figure and date machinery now, not during the first plot
+    from pandas.plotting import register_matplotlib_converters
+    register_matplotlib_converters()
+
+
+def render_plot(func, directory, args, kwargs):
+    """
+    Draw one plot inside a rendering process. Plot caching is handled by render_plots(), so the plotting function is
+    called without its cached_plot() wrapper.
+
+    :param func: function, a plotting function, ie summit_voc_plot()
+    :param directory: Path, directory to save the plot in
+    :param args: tuple, positional arguments to func
+    :param kwargs: dict, keyword arguments to func
+    :return: str, filename of the plot
+    """
+    with TempDir(directory):
+        return getattr(func, '__wrapped__', func)(*args, **kwargs)
+
+
+class RenderService:
+    """
+    A pool of plot rendering processes shared by every job. The Scheduler starts one in its own RenderManager process
+    and hands a proxy for it to each job process, so there is one set of rendering processes (and reused figures, see
+    reuse_figure()) for the whole program, rather than one per job process.
+    """
+
+    def __init__(self, max_workers=None):
+        """
+        :param max_workers: int, number of rendering processes, defaults to the number of CPUs
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.max_workers = max_workers
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, initializer=init_render_worker)
+
+    def render(self, func, directory, args, kwargs):
+        """
+        Draw one plot in the pool and wait for it, see render_plot().
+
+        :return: str, filename of the plot
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+
+        pool = self.pool
+
+        try:
+            return pool.submit(render_plot, func, directory, args, kwargs).result()
+        except BrokenProcessPool:
+            if pool is self.pool:  # replace it for the plots that follow, only once if many plots failed
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_render_worker)
+                pool.shutdown(wait=False)
+            raise
+
+    def shutdown(self):
+        """
+        Stop the rendering processes once any plots in progress are drawn.
+
+        :return: None
+        """
+        self.pool.shutdown()
+
+
+class RenderManager(BaseManager):
+    """
+    Runs a RenderService in a server process, see Scheduler.start_render_service().
+    """
+    pass
+
+
+RenderManager.register('RenderService', RenderService)
+
+
+def set_render_service(service):
+    """
+    Runs once in each job process to give render_plots() the Scheduler's RenderService.
+
+    :param service: proxy for a RenderService, or None to render plots in the calling process
+    :return: None
+    """
+    global render_service
+    render_service = service
+
+
+def init_job_process(service, created_schemas):
+    """
+    Runs once in each of the Scheduler's job processes, to give it the RenderService and the record of schemas that
+    were already created. Processes are spawned rather than forked on Windows, so they don't inherit either.
+
+    :param service: proxy for a RenderService, see set_render_service()
+    :param created_schemas: set, of schema keys already created, see create_schema()
+    :return: None
+    """
+    set_render_service(service)
+    schemas.update(created_schemas)
+
+
+async def render_plots(specs):
+    """
+    Draw many plots at once in the Scheduler's RenderService, without blocking the event loop. Plots whose inputs
+    haven't changed since they were last drawn are skipped, the same as with cached_plot(), and the plot cache of each
+    directory is updated once after all plots are drawn. Outside of the Scheduler (ie when running a processor by
+    itself) there is no RenderService, and the plots are drawn one at a time in this process instead.
+
+    :param specs: list, of PlotSpecs
+    :return: list, of the Path of each plot, in the same order as specs
+    """
+    caches = {}
+    paths = [None] * len(specs)
+    to_render = []
+
+    for ind, spec in enumerate(specs):
+        directory = Path(spec.directory)
+        inputs_hash = plot_inputs_hash(spec.func, spec.args, spec.kwargs)
+
+        if directory not in caches:
+            caches[directory] = read_plot_cache(directory)
+
+        name = find_cached_plot(caches[directory], inputs_hash, directory)
+        if name:
+            paths[ind] = directory / name
+            unchanged_plots.add(str(paths[ind].resolve()))
+        else:
+            to_render.append((ind, spec, inputs_hash))
+
+    if render_service is None:
+        if to_render:
+            init_render_worker()
+        names = [render_plot(spec.func, Path(spec.directory), spec.args, spec.kwargs) for _, spec, _ in to_render]
+    else:
+        loop = asyncio.get_event_loop()  # proxy calls block, so each waits in its own thread
+        names = await asyncio.gather(*[loop.run_in_executor(None, render_service.render, spec.func,
+                                                            Path(spec.directory), spec.args, spec.kwargs)
+                                       for _, spec, _ in to_render])
+
+    for (ind, spec, inputs_hash), name in zip(to_render, names):
+        directory = Path(spec.directory)
+        caches[directory][str(name)] = inputs_hash
+        paths[ind] = directory / name
+        unchanged_plots.discard(str(paths[ind].resolve()))
+
+    for directory, cache in caches.items():
+        write_plot_cache(directory, cache)
+
+    return paths
+
+
+def add_or_ignore_plot(plot, core_session):
+    """
+    Queries database and adds a plot only if one with the same path doesn't already exist. Plots that weren't redrawn
+    because their inputs hadn't changed (see cached_plot()) are ignored, since they've already been uploaded.
+    :param plot: Plot, to be added to database
+    :param core_session: sqlalchemy.Session object
+    :return: None
+    """
+    if str(plot.path.resolve()) in unchanged_plots:
+        return
+
+    plots_in_db = [p[0] for p in core_session.query(Plot._path).all()]
+
+    if str(plot.path.resolve()) not in plots_in_db:
+        core_session.add(plot)
+    return
+
+
+def append_df_to_excel(filename, df, sheet_name='Sheet1', startrow=None,
+                       truncate_sheet=False,
+                       **to_excel_kwargs):
+    """
+    Append a DataFrame [df] to existing Excel file [filename] into [sheet_name] Sheet.
+    If [filename] doesn't exist, then this function will create it.
     Adapted From:
         https://stackoverflow.com/questions/38074678/append-existing-excel-sheet-with-new-dataframe-using-python-pandas
     :param filename: File path or existing ExcelWriter (Example: '/path/to/file.xlsx')
@@ -481,32 +1624,21 @@ def append_df_to_excel(filename, df, sheet_name='Sheet1', startrow=None,
     return
 
 
-async def send_files_sftp(filepaths, remote_path):
+async def send_files_sftp(filepaths, remote_path, pool=None):
     """
-    Send a list of files to the provided remote path.
+    Send a list of files to the provided remote path, several at once over the pooled connections. Files that are
+    already on the remote with the same size and modification time aren't sent again.
     :param filepaths: list, of pathlib Path objects
     :param remote_path: string, path on the remote server to send files to
+    :param pool: SFTPPool, to upload with, defaults to the one for this process, see get_sftp_pool()
     :return: list, of booleans of which plots uploaded sucessfully
     """
+    if pool is None:
+        pool = get_sftp_pool()
 
-    bools = []
-    try:
-        con = connect_to_sftp()
-        con.chdir(remote_path)
-
-        for file in filepaths:
-            try:
-                con.put(str(file), file.name)
-                bools.append(True)
-            except:
-                bools.append(False)
-
-        con.close()
-    except:
-        while len(bools) < len(filepaths):
-            bools.append(False)
-
-    return bools
+    loop = asyncio.get_event_loop()
+    return list(await asyncio.gather(*[loop.run_in_executor(pool.executor, pool.upload, file, remote_path)
+                                       for file in filepaths]))
 
 
 async def check_send_plots(logger):
@@ -533,31 +1665,29 @@ async def check_send_plots(logger):
 
         remote_dirs = set([p.remote_path for p in plots_to_upload.all()])
 
-        for remote_dir in remote_dirs:
-            plot_set = plots_to_upload.filter(Plot.remote_path == remote_dir).all()
+        plot_sets = [plots_to_upload.filter(Plot.remote_path == remote_dir).all() for remote_dir in remote_dirs]
+        plot_sets = [plot_set for plot_set in plot_sets if plot_set]
 
-            if plot_set:
-                paths_to_upload = [p.path for p in plot_set]
-                successes = await send_files_sftp(paths_to_upload, remote_dir)
+        all_successes = await asyncio.gather(*[send_files_sftp([p.path for p in plot_set], plot_set[0].remote_path)
+                                               for plot_set in plot_sets])
 
-                for plot, success in zip(plots_to_upload, successes):
-                    if success:
-                        logger.info(f'Plot {plot.name} uploaded to website.')
-                        session.delete(plot)
-                    else:
-                        logger.warning(f'Plot {plot.name} failed to upload.')
+        for plot_set, successes in zip(plot_sets, all_successes):
+            for plot, success in zip(plot_set, successes):
+                if success:
+                    logger.info(f'Plot {plot.name} uploaded to website.')
+                    session.delete(plot)
+                else:
+                    logger.warning(f'Plot {plot.name} failed to upload.')
 
         session.commit()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in check_send_plots().')
         send_processor_email('Core', exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
@@ -566,7 +1696,7 @@ class MovedFile(Base):
     MovedFiles are used to track files that have been moved to the /data directory from their FTP directories.
     The FTP directories are cleaned somewhat regularly, so they're not a good home for the permanent data files.
 
-    Filepaths are used to track and move them, and filesize is the sole determiner if a file is moved again.
+    Filepaths are used to track and move them, and a file is moved again if its size or modification time changes.
     """
     __tablename__ = 'files'
 
@@ -576,13 +1706,15 @@ class MovedFile(Base):
     _name = Column(String)
     location = Column(String)
     size = Column(Integer)
+    mtime = Column(Float)  # st_mtime of the synced file when it was last copied
     type = Column(String)
 
-    def __init__(self, path, type, location, size):
+    def __init__(self, path, type, location, size, mtime=None):
         self.path = path
         self.type = type
         self.location = location  # either 'sync' or 'data'
         self.size = size
+        self.mtime = mtime
 
     @property
     def path(self):
@@ -598,100 +1730,732 @@ class MovedFile(Base):
         return self._name
 
 
+def sync_locations():
+    """
+    All directories that are synced from the instruments, with the processor type that owns them, the data directory
+    they're moved to, and the file extension of their data files.
+
+    :return: list, of (sync_path, type_, data_path, file_type) tuples
+    """
+    sync_paths = [methane_logs_sync, voc_logs_sync, daily_logs_sync, picarro_logs_sync]
+    data_paths = [methane_logs_path, voc_logs_path, daily_logs_path, picarro_logs_path]
+    data_types = ['methane', 'voc', 'daily', 'picarro']
+    file_types = ['.txt', '.txt', '.txt', '.dat']
+
+    return list(zip(sync_paths, data_types, data_paths, file_types))
+
+
+def appended_to(path, dest, offset, block_size=4096):
+    """
+    Check if a file is a copy that has only had bytes appended to it, by comparing its first line and the block before
+    offset with the same bytes of the copy. Files rewritten with new content (ie a log re-exported with more rows)
+    differ in one or the other, without reading either file whole.
+
+    :param path: Path, the file that may have been appended to
+    :param dest: Path, the copy of the file as it was when offset bytes long
+    :param offset: int, size of the file when it was copied to dest
+    :param block_size: int, number of bytes before offset to compare
+    :return: boolean, True if path starts with the same bytes as dest
+    """
+    if not dest.is_file() or dest.stat().st_size != offset:
+        return False
+
+    with open(path, 'rb') as src, open(dest, 'rb') as dst:
+        if src.readline() != dst.readline():
+            return False
+
+        start = max(offset - block_size, 0)
+        src.seek(start)
+        dst.seek(start)
+
+        return src.read(offset - start) == dst.read(offset - start)
+
+
+def copy_to_data(path, data_path, logger, offset=0):
+    """
+    Copy a synced file to its data directory, overwriting any older copy, and warn if it can't be moved. If the data
+    copy is offset bytes long and the file still starts with the same bytes (see appended_to()), only the bytes after
+    offset are appended to it, since logs usually only grow. Otherwise the file is copied whole to a temporary file and
+    renamed over the old copy, so it's never seen partly written.
+
+    :param path: Path, the synced file to copy
+    :param data_path: Path, directory the file should be copied to
+    :param logger: logging logger to log to
+    :param offset: int, size of the file when it was last copied, 0 to copy the whole file
+    :return: boolean, True if the file was copied
+    """
+    import tempfile
+    from shutil import copyfileobj, copymode
+
+    dest = data_path / path.name
+
+    try:
+        if offset and appended_to(path, dest, offset):
+            with open(path, 'rb') as src, open(dest, 'ab') as dst:
+                src.seek(offset)
+                copyfileobj(src, dst)
+        else:
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=data_path)  # no file type in the name, so it's not read
+            try:
+                with open(path, 'rb') as src, open(fd, 'wb') as dst:
+                    copyfileobj(src, dst)
+                copymode(path, tmp)  # mkstemp creates files only the owner can read
+                os.replace(tmp, dest)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)  # don't leave partial copies in the data directory
+                raise
+        return True
+    except PermissionError:
+        logger.error(f'File {path.name} could not be moved due to a permissions error.')
+        from summit_errors import send_processor_warning
+        send_processor_warning(PROC, 'PermissionError',
+                               f'File {path.name} could not be moved due a permissions error.\n'
+                               + 'Copying/pasting the file, deleting the old one, and renaming '
+                               + 'the file to its old name should allow it to be processed.\n'
+                               + 'This will require admin privelidges.')
+        return False
+
+
+def update_data_file(path, stat, type_, data_path, moved_file, session, logger):
+    """
+    Copy a synced file to the data directory if it's new, or its size or modification time differ from when it was
+    last copied. Files that have only been appended to have just their new bytes copied.
+
+    :param path: Path, the file in the sync directory
+    :param stat: os.stat_result, of path
+    :param type_: str, in ['methane', 'voc', 'daily', 'picarro']
+    :param data_path: Path, the data directory for this type of file
+    :param moved_file: MovedFile, the data directory copy of this file, or None if it hasn't been moved yet
+    :param session: sqlalchemy Session, connected to the core database
+    :param logger: logging logger to log to
+    :return: boolean, True if the file was moved or updated
+    """
+    if moved_file is None:
+        if not copy_to_data(path, data_path, logger):
+            return False
+        session.add(MovedFile(data_path / path.name, type_, 'data', check_filesize(data_path / path.name),
+                              stat.st_mtime))
+        logger.info(f'File {path.name} moved to data directory.')
+        return True
+
+    if stat.st_size == moved_file.size and moved_file.mtime in (None, stat.st_mtime):
+        moved_file.mtime = stat.st_mtime  # files moved before mtimes were recorded are assumed to be up to date
+        return False
+
+    offset = moved_file.size if stat.st_size > moved_file.size else 0
+
+    if not copy_to_data(path, data_path, logger, offset=offset):
+        return False
+
+    moved_file.size = check_filesize(moved_file.path)  # the file may have grown while being copied
+    moved_file.mtime = stat.st_mtime
+    logger.info(f'File {moved_file.name} updated in data directory.')
+    return True
+
+
+def move_sync_file(path, type_, data_path, session, logger, manifest=None):
+    """
+    Move a single synced file to the data directory if it's new or has changed since it was last moved.
+
+    :param path: Path, the file in the sync directory
+    :param type_: str, in ['methane', 'voc', 'daily', 'picarro']
+    :param data_path: Path, the data directory for this type of file
+    :param session: sqlalchemy Session, connected to the core database
+    :param logger: logging logger to log to
+    :param manifest: dict, of {filename: MovedFile} for every data file of this type, or None to query for this file
+    :return: boolean, True if the file was moved or updated
+    """
+    if manifest is None:
+        moved_file = (session.query(MovedFile)
+                      .filter(MovedFile.location == 'data')
+                      .filter(MovedFile.type == type_)
+                      .filter(MovedFile._name == path.name)
+                      .first())
+    else:
+        moved_file = manifest.get(path.name)
+
+    return update_data_file(path, path.stat(), type_, data_path, moved_file, session, logger)
+
+
+def move_sync_files(session, logger):
+    """
+    Comb all the sync directories for new data files and move any that are new or have been updated. The data files of
+    each type are queried once as a manifest by name, and each sync file is passed to move_sync_file() with it, so
+    only files whose size or modification time changed are copied.
+
+    :param session: sqlalchemy Session, connected to the core database
+    :param logger: logging logger to log to
+    :return: set, of the types ['methane', 'voc', 'daily', 'picarro'] that had new or updated files
+    """
+    updated_types = set()
+
+    for sync_path, type_, data_path, file_type in sync_locations():
+        manifest = {d.name: d for d in (session.query(MovedFile)
+                                        .filter(MovedFile.location == 'data')
+                                        .filter(MovedFile.type == type_))}
+
+        for path in get_all_data_files(sync_path, file_type):
+            if move_sync_file(path, type_, data_path, session, logger, manifest=manifest):
+                updated_types.add(type_)
+
+    session.commit()
+
+    return updated_types
+
+
+def move_changed_files(to_move, logger):
+    """
+    Move a set of changed sync files with move_sync_file(), committing once they've all been moved. This blocks while
+    files are copied, so watch_log_files() runs it in a thread.
+
+    :param to_move: list, of (Path, location) tuples, where location is a tuple from sync_locations()
+    :param logger: logging logger to log to
+    :return: set, of the types ['methane', 'voc', 'daily', 'picarro'] that had new or updated files
+    """
+    updated_types = set()
+
+    engine, session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
+
+    try:
+        for path, (_, type_, data_path, _) in to_move:
+            if move_sync_file(path, type_, data_path, session, logger):
+                updated_types.add(type_)
+        session.commit()
+    finally:
+        session.close()
+
+    return updated_types
+
+
+async def sync_log_files(logger, on_new_data=None):
+    """
+    Comb the sync directories once for new data files and move any that are new or have been updated. This is run on
+    startup by watch_log_files() to catch up, and by the Scheduler as a fallback in case the watcher misses a file or
+    has stopped.
+
+    :param logger: logging logger to log to
+    :param on_new_data: function, called with a type in ['methane', 'voc', 'daily', 'picarro'] for each type that had
+        new or updated files
+    :return: boolean, True if ran without errors
+    """
+    try:
+        from summit_errors import send_processor_email
+    except ImportError:
+        logger.error('ImportError occurred in sync_log_files()')
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
+        create_schema(engine, MovedFile)
+    except Exception as e:
+        logger.error(f'Exception {e.args} prevented connection to the database in sync_log_files()')
+        send_processor_email('Core', exception=e)
+        return False
+
+    try:
+        logger.info('Running sync_log_files()')
+        # copying files and committing can take a while, so it's done in a thread to keep the event loop running
+        updated_types = await asyncio.get_event_loop().run_in_executor(None, move_sync_files, session, logger)
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in sync_log_files().')
+        send_processor_email('Core', exception=e)
+        return False
+    finally:
+        session.close()
+
+    if on_new_data is not None:
+        for type_ in updated_types:
+            on_new_data(type_)
+
+    return True
+
+
 async def move_log_files(logger):
     """
     Runs continuously and sleeps for 10 minutes at a time. Comb the directories for new data files and move any that
     are new or have been updated. This WILL NOT handle turning over a new year in the daily files well, as they have no
     year in the filename. I can't fix that.
 
+    watch_log_files() replaces this at runtime, but this is kept for running without the scheduler.
+
     :param logger: logging logger to log to
-    :return: boolean, True if ran without errors
+    :return: boolean, False if stopped by an error
     """
-
     while True:
+        if not await sync_log_files(logger):
+            return False
+
+        import gc
+        gc.collect()
+
+        for i in range(20):
+            await asyncio.sleep(30)
+
+
+class SyncWatcher:
+    """
+    Watches directories for files that are created or modified and passes their paths to a callback. The callback is
+    called from a background thread, so it must be thread-safe.
+
+    watchdog's native observer (inotify on Linux, ReadDirectoryChangesW on Windows) is used if it's installed,
+    otherwise the directories are polled every poll_interval seconds, comparing file sizes and modification times. The
+    polling fallback only stats files and never touches the database.
+    """
+
+    def __init__(self, paths, callback, poll_interval=30):
+        """
+        :param paths: list, of Paths to directories that should be watched recursively
+        :param callback: function, called with the Path of every new or changed file
+        :param poll_interval: int, seconds between scans if falling back to polling
+        """
+        self.paths = [Path(p) for p in paths if p is not None]
+        self.callback = callback
+        self.poll_interval = poll_interval
+
+        self.observer = None
+        self.poll_thread = None
+        self.stopped = None
+
+    def start(self):
+        import logging
+        logger = logging.getLogger(__name__)
+
         try:
-            from summit_errors import send_processor_email, EmailTemplate, sender, processor_email_list
-            from shutil import copy
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
         except ImportError:
-            logger.error('ImportError occurred in move_log_files()')
+            logger.warning('watchdog is not installed, falling back to polling for new files.')
+            self.start_polling()
+            return
+
+        callback = self.callback
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    callback(Path(event.src_path))
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    callback(Path(event.src_path))
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    callback(Path(event.dest_path))
+
+        self.observer = Observer()
+        for path in self.paths:
+            self.observer.schedule(Handler(), str(path), recursive=True)
+        self.observer.start()
+
+    def start_polling(self):
+        import threading
+
+        self.stopped = threading.Event()
+        self.poll_thread = threading.Thread(target=self.poll, daemon=True)
+        self.poll_thread.start()
+
+    def snapshot(self):
+        """
+        :return: dict, of {Path: (size, mtime)} for every file in the watched directories
+        """
+        files = {}
+        for path in self.paths:
+            for file in list_files_recur(path):
+                try:
+                    stat = file.stat()
+                except FileNotFoundError:
+                    continue  # removed between listing and stat
+                files[file] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def poll(self):
+        last = self.snapshot()
+
+        while not self.stopped.wait(self.poll_interval):
+            current = self.snapshot()
+            for file, stats in current.items():
+                if last.get(file) != stats:
+                    self.callback(file)
+            last = current
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+        if self.stopped:
+            self.stopped.set()
+
+
+def find_sync_location(path):
+    """
+    Find the sync directory a file belongs to.
+
+    :param path: Path, of a file in one of the sync directories
+    :return: tuple, (sync_path, type_, data_path, file_type) from sync_locations(), or None if it's not a data file
+    """
+    for location in sync_locations():
+        sync_path, _, _, file_type = location
+        if sync_path is None:
+            continue
+        if file_type in path.name and Path(sync_path) in path.parents:
+            return location
+    return None
+
+
+async def watch_log_files(logger, on_new_data=None, settle_time=5):
+    """
+    Event-driven replacement for move_log_files(). All sync directories are combed once on startup to catch anything
+    that arrived while the processor was down, then a SyncWatcher reports new and changed files as they're written.
+    Each file is moved on its own, and on_new_data is called with the type of every file that was moved so only the
+    processor that owns it is run.
+
+    The PA logs (NMHC_PA.LOG and CH4.LOG) are read in place and never moved, but changes to them also call on_new_data.
+
+    Errors stop the watcher and return False, so it should be restarted by the caller (see summit.py), and
+    sync_log_files() should be scheduled periodically to move anything missed in the meantime.
+
+    :param logger: logging logger to log to
+    :param on_new_data: function, called with a type in ['methane', 'voc', 'daily', 'picarro'] when new data arrives
+    :param settle_time: int, seconds to wait for more changes before moving files, since files are written in pieces
+    :return: boolean, False if stopped by an error
+    """
+    try:
+        from summit_errors import send_processor_email
+    except ImportError:
+        logger.error('ImportError occurred in watch_log_files()')
+        return False
+
+    if on_new_data is None:
+        def on_new_data(type_):
+            return
+
+    pa_logs = {methane_LOG_path: 'methane', voc_LOG_path: 'voc'}
+
+    logger.info('Running watch_log_files()')
+    if not await sync_log_files(logger, on_new_data=on_new_data):
+        return False
+
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue()
+
+    def enqueue(path):
+        loop.call_soon_threadsafe(queue.put_nowait, path)  # called from the watcher's thread
+
+    watch_paths = [location[0] for location in sync_locations()]
+    watch_paths.extend([p.parent for p in pa_logs.keys() if p is not None])
+
+    watcher = SyncWatcher(set(watch_paths), enqueue)
+    watcher.start()
+
+    try:
+        while True:
+            changed = {await queue.get()}
+
+            while True:  # let files finish writing, and collect every change in the meantime
+                try:
+                    changed.add(await asyncio.wait_for(queue.get(), settle_time))
+                except asyncio.TimeoutError:
+                    break
+
+            updated_types = set()
+            to_move = []
+            for path in changed:
+                if path in pa_logs:
+                    updated_types.add(pa_logs[path])
+                    continue
+
+                location = find_sync_location(path)
+                if location and path.is_file():
+                    to_move.append((path, location))
+
+            if to_move:
+                # in a thread, so copies and commits don't block the Scheduler running in the same event loop
+                updated_types.update(await loop.run_in_executor(None, move_changed_files, to_move, logger))
+
+            for type_ in updated_types:
+                on_new_data(type_)
+
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in watch_log_files().')
+        send_processor_email('Core', exception=e)
+        return False
+
+    finally:
+        watcher.stop()
+
+
+def run_in_process(func, logger_dir=None, logger_name=None):
+    """
+    Runs an async processor function to completion inside a worker process. Processors that take a logger are given
+    one configured in the worker, since loggers and their handlers don't survive the trip to a new process.
+
+    :param func: async function, the processor to run, ie voc_main_loop.main
+    :param logger_dir: Path, directory to create the logger in, see configure_logger()
+    :param logger_name: str, name of the logger to pass to func, or None if func takes no arguments
+    :return: the return value of func, usually a boolean for whether or not new data was created
+    """
+    if logger_name is None:
+        return asyncio.run(func())
+    else:
+        return asyncio.run(func(configure_logger(logger_dir, logger_name)))
+
+
+class ScheduledJob:
+    """
+    A ScheduledJob is one processor or task known to the Scheduler. Jobs with an interval are run every interval
+    seconds; jobs with dependencies are run after all of their dependencies have finished, but only if one of them
+    reported new data (returned a truthy value) since the job last ran. A job can have both. Any job can also be
+    triggered directly, ie when new files for it arrive, and is run as soon as it and its dependencies are idle.
+
+    Jobs run in the Scheduler's process pool unless in_pool is False, in which case func must be an async function
+    that takes no arguments and it will be awaited in the main event loop. This is needed for jobs that keep state
+    between runs, like the active errors in check_for_new_data().
+
+    Jobs that write to the same SQLite database are never run at the same time, since only one of them could hold the
+    write lock, and long writes by one (ie deleting an archived month) would time the other out.
+    """
+
+    def __init__(self, name, func, interval=None, depends_on=None, logger_dir=None, logger_name=None, in_pool=True,
+                 databases=None):
+        self.name = name
+        self.func = func
+        self.interval = interval  # seconds between runs, or None if only run when dependencies trigger it
+        self.depends_on = depends_on if depends_on else []
+        self.databases = set(databases) if databases else set()  # names of the databases the job writes to
+        self.logger_dir = logger_dir
+        self.logger_name = logger_name
+        self.in_pool = in_pool
+
+        self.running = False
+        self.pending = False  # set when a dependency reports new data, or the job is triggered
+        self.last_result = None
+        self.next_run = datetime.now()  # jobs with an interval are due immediately on startup
+
+    def __str__(self):
+        return f'<ScheduledJob {self.name}>'
+
+    def __repr__(self):
+        return f'<ScheduledJob {self.name}>'
+
+    def is_due(self, jobs, now):
+        """
+        :param jobs: dict, of {name: ScheduledJob} for all jobs in the Scheduler
+        :param now: datetime, the current time
+        :return: boolean, True if the job should be started now
+        """
+        if self.running:
             return False
 
+        if any(jobs[dep].running for dep in self.depends_on):
+            return False  # wait for every dependency to finish before running
+
+        if any(job.running and job.databases & self.databases for job in jobs.values()):
+            return False  # wait for any job writing to the same database to finish
+
+        if self.pending:
+            return True
+
+        return self.interval is not None and now >= self.next_run
+
+
+class Scheduler:
+    """
+    Runs ScheduledJobs concurrently, respecting their dependencies and individual intervals. Independent processors
+    that write to different SQLite files are run side-by-side in a process pool, and jobs that share a file take turns,
+    see ScheduledJob.is_due(). A process pool is used rather than threads because the processors change the working
+    directory with TempDir, which is shared by all threads in a process.
+    """
+
+    def __init__(self, jobs, logger, max_workers=None, render_workers=None, tick=30):
+        """
+        :param jobs: list, of ScheduledJob objects
+        :param logger: logging logger to log to
+        :param max_workers: int, number of worker processes, defaults to the number of pooled jobs
+        :param render_workers: int, number of plot rendering processes for all jobs, defaults to the number of CPUs
+        :param tick: int, seconds to sleep between checking for jobs that are due
+        """
+        self.jobs = {job.name: job for job in jobs}
+        self.logger = logger
+        self.tick = tick
+        self.max_workers = max_workers if max_workers else max(1, len([j for j in jobs if j.in_pool]))
+        self.render_workers = render_workers
+        self.wake = None  # asyncio.Event, created once running in the event loop
+        self.pool = None  # ProcessPoolExecutor, created once running and replaced if it breaks, see new_pool()
+        self.render_manager = None  # RenderManager, started once running, see start_render_service()
+        self.render_service = None  # proxy for the RenderService in render_manager, given to every job process
+        self.tasks = set()  # running run_job() tasks, kept so they aren't garbage collected before finishing
+
+        self.check_graph()
+
+    def check_graph(self):
+        """
+        Verify every dependency exists and that the dependency graph has no cycles, which would prevent jobs from ever
+        being run.
+
+        :return: list, of job names in an order where every job comes after its dependencies
+        """
+        for job in self.jobs.values():
+            for dep in job.depends_on:
+                if dep not in self.jobs:
+                    raise ValueError(f'Job {job.name} depends on unknown job {dep}.')
+
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f'Job {name} is part of a dependency cycle.')
+            visiting.add(name)
+            for dep in self.jobs[name].depends_on:
+                visit(dep)
+            visiting.remove(name)
+            ordered.append(name)
+
+        for name in self.jobs:
+            visit(name)
+
+        return ordered
+
+    def dependents(self, name):
+        """
+        :param name: str, name of a job
+        :return: list, of ScheduledJobs that depend directly on the named job
+        """
+        return [job for job in self.jobs.values() if name in job.depends_on]
+
+    def trigger(self, name):
+        """
+        Flag a job to run as soon as possible instead of waiting for its interval. A job triggered while it's running
+        will run again once it finishes, so no new data is missed.
+
+        :param name: str, name of a job
+        :return: None
+        """
+        self.jobs[name].pending = True
+
+        if self.wake:
+            self.wake.set()
+
+    def new_pool(self):
+        """
+        Create the process pool that pooled jobs run in, shutting down the last one if there was one. Each job process
+        is given the RenderService to draw its plots in, and the schemas that were already created.
+
+        :return: ProcessPoolExecutor
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+        self.pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_job_process,
+                                        initargs=(self.render_service, set(schemas)))
+        return self.pool
+
+    def start_render_service(self):
+        """
+        Start the single RenderService that every job draws its plots in, see render_plots().
+
+        :return: proxy for the RenderService
+        """
+        self.render_manager = RenderManager()
+        self.render_manager.start()
+        self.render_service = self.render_manager.RenderService(self.render_workers)
+        return self.render_service
+
+    def shutdown(self):
+        """
+        Shut down the job process pool, then the RenderService and its process.
+
+        :return: None
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+        if self.render_manager is not None:
+            self.render_service.shutdown()
+            self.render_manager.shutdown()
+            self.render_manager = None
+            self.render_service = None
+
+    async def run_job(self, job):
+        """
+        Run a single job, then record its result and flag any dependents if it produced new data. If a worker process
+        dies (ie it runs out of memory), the pool can't be used again, so it's replaced for the jobs that follow.
+
+        :param job: ScheduledJob, to be run
+        :return: None
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        loop = asyncio.get_event_loop()
+        self.logger.info(f'Starting {job.name}')
+        started = datetime.now()
+        pool = self.pool
+
         try:
-            engine, session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-            MovedFile.__table__.create(engine, checkfirst=True)
+            if job.in_pool:
+                result = await loop.run_in_executor(pool, run_in_process, job.func,
+                                                    job.logger_dir, job.logger_name)
+            else:
+                result = await job.func()
+        except BrokenProcessPool as e:
+            self.logger.error(f'Exception {e.args} occurred while running {job.name} in the scheduler, a worker '
+                              + 'process died and the process pool will be replaced.')
+            if pool is self.pool:
+                self.new_pool()  # other jobs running in the same pool fail too, but only the first replaces it
+            result = False
         except Exception as e:
-            logger.error(f'Exception {e.args} prevented connection to the database in move_log_files()')
-            send_processor_email('Core', exception=e)
-            return False
+            self.logger.error(f'Exception {e.args} occurred while running {job.name} in the scheduler.')
+            result = False
 
-        try:
-            logger.info('Running move_log_files()')
-
-            sync_paths = [methane_logs_sync, voc_logs_sync, daily_logs_sync, picarro_logs_sync]
-            data_paths = [methane_logs_path, voc_logs_path, daily_logs_path, picarro_logs_path]
-            data_types = ['methane', 'voc', 'daily', 'picarro']
-            file_types = ['.txt', '.txt', '.txt', '.dat']
-
-            for sync_path, type_, data_path, file_type in zip(sync_paths, data_types, data_paths, file_types):
-                sync_files = [MovedFile(path, type_, 'sync', check_filesize(path))
-                              for path in get_all_data_files(sync_path, file_type)]
-                data_files = (session.query(MovedFile)
-                              .filter(MovedFile.location == 'data')
-                              .filter(MovedFile.type == type_)
-                              .all())
-                moved_data_files = [d.name for d in data_files]
-
-                for file in sync_files:
-                    if file.name not in moved_data_files:
-                        try:
-                            copy(file.path, data_path)  # will overwrite
-                        except PermissionError:
-                            logger.error(f'File {file.name} could not be moved due to a permissions error.')
-                            from summit_errors import send_processor_warning
-                            send_processor_warning(PROC, 'PermissionError',
-                                                   f'File {file.name} could not be moved due a permissions error.\n'
-                                                   + 'Copying/pasting the file, deleting the old one, and renaming '
-                                                   + 'the file to its old name should allow it to be processed.\n'
-                                                   + 'This will require admin privelidges.')
-                            continue
-                        file.path = data_path / file.name
-                        file.location = 'data'
-                        session.merge(file)
-                        logger.info(f'File {file.name} moved to data directory.')
-                    else:
-                        matched_file = search_for_attr_value(data_files, 'name', file.name)
-                        if file.size > matched_file.size:
-                            try:
-                                copy(file.path, data_path)  # will overwrite
-                            except PermissionError:
-                                logger.error(f'File {file.name} could not be moved due to a permissions error.')
-                                from summit_errors import send_processor_warning
-
-                                send_processor_warning(PROC, 'PermissionError',
-                                                       f'File {file.name} could not be moved due a permissions error.\n'
-                                                       + 'Copying/pasting the file, deleting the old one, and renaming '
-                                                       + 'the file to its old name should allow it to be processed.\n'
-                                                       + 'This will require admin privelidges.')
-                                continue
-
-                            matched_file.size = check_filesize(matched_file.path)
-                            session.merge(matched_file)
-                            logger.info(f'File {matched_file.name} updated in data directory.')
-
-            session.commit()
-
-            session.close()
-            engine.dispose()
-
-            import gc
-            gc.collect()
-
-            for i in range(20):
-                await asyncio.sleep(30)
+        job.last_result = result
+        job.running = False
+        if job.interval is not None:
+            job.next_run = started + dt.timedelta(seconds=job.interval)
 
-        except Exception as e:
-            logger.error(f'Exception {e.args} occurred in move_log_files().')
-            send_processor_email('Core', exception=e)
-            session.close()
-            engine.dispose()
-            return False
+        self.logger.info(f'{job.name} finished in {(datetime.now() - started).total_seconds():.1f}s')
+
+        if result:
+            for dependent in self.dependents(job.name):
+                dependent.pending = True
+
+        self.wake.set()  # dependents or re-triggered jobs may now be due
+
+    async def run(self):
+        """
+        Run forever, starting every job that is due. Jobs are checked every tick, or immediately when a job finishes or
+        is triggered.
+
+        :return: None
+        """
+        self.wake = asyncio.Event()
+        self.start_render_service()
+        self.new_pool()
+
+        try:
+            while True:
+                now = datetime.now()
+
+                for name in self.check_graph():
+                    job = self.jobs[name]
+                    if job.is_due(self.jobs, now):
+                        job.running = True
+                        job.pending = False
+                        task = asyncio.ensure_future(self.run_job(job))
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
+
+                try:
+                    await asyncio.wait_for(self.wake.wait(), self.tick)
+                except asyncio.TimeoutError:
+                    pass
+
+                self.wake.clear()
+        finally:
+            self.shutdown()
@@ -0,0 +1,101 @@
+"""
+Connection settings and indexes for the SQLite databases, applied to every database connected to with
+summit_core.connect_to_db() and created with summit_core.create_schema().
+
+Indexes are listed by database filename, so they can be added to existing databases without importing every
+processor's models. Each is (index name, table, columns), or (index name, table, columns, True) for a unique index, and
+is matched to the queries that use it. Indexes are only created if their table exists, so they're added the first time
+a processor creates its tables.
+"""
+
+from pathlib import Path
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+sqlite_pragmas = {
+    'journal_mode': 'WAL',  # readers (ie plotting) no longer block the processor writing, and the reverse
+    'synchronous': 'NORMAL',  # safe with WAL; only syncs at checkpoints instead of every commit
+    'cache_size': -64000,  # negative values are in KiB, so ~64MB of page cache per connection
+    'mmap_size': 268435456,  # read up to 256MB of the database through memory-mapping
+    'busy_timeout': 30000,  # wait up to 30s for another process to finish writing instead of failing
+}
+
+indexes = {
+    'summit_voc.sqlite': [
+        ('ix_peaks_name_run_id', 'peaks', ('name', 'run_id')),  # get_dates_peak_info(): Peak.name == compound
+        ('ix_peaks_run_id', 'peaks', ('run_id',)),  # integrate_peaks(): peaks for a set of runs
+        ('ix_gcruns_type_date', 'gcruns', ('type', 'date')),  # get_dates_peak_info(): ambient runs ordered by date
+        ('ix_gcruns_date', 'gcruns', ('date',)),  # plot_new_data(): runs since the plot start date
+        ('ix_gcruns_crf_id', 'gcruns', ('crf_id',)),
+        ('ix_logfiles_filename', 'logfiles', ('filename',), True),  # check_load_logs(): one LogFile per file
+    ],
+    'summit_picarro.sqlite': [
+        # find_cal_events(): data for one MPV position that's not in a cal event, ordered by date
+        ('ix_data_mpv_position_cal_id_date', 'data', ('mpv_position', 'cal_id', 'date')),
+        # plot_new_data(): newest MPV 1 point, and all MPV 0/1 data since the plot start date
+        ('ix_data_mpv_position_date', 'data', ('mpv_position', 'date')),
+    ],
+    'summit_methane.sqlite': [
+        ('ix_peaks_run_id', 'peaks', ('run_id',)),
+        ('ix_peaks_pa_line_id', 'peaks', ('pa_line_id',)),
+        ('ix_samples_run_id', 'samples', ('run_id',)),
+    ],
+    'summit_core.sqlite': [
+        # move_sync_file(): files in a location, of one type, by name
+        ('ix_files_location_type_name', 'files', ('location', 'type', '_name')),
+    ],
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Engine 'connect' event hook that applies sqlite_pragmas to every new connection.
+
+    :param dbapi_connection: sqlite3.Connection, as passed by the event
+    :param connection_record: sqlalchemy _ConnectionRecord, unused
+    :return: None
+    """
+    cursor = dbapi_connection.cursor()
+    for pragma, value in sqlite_pragmas.items():
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
+
+def migrate(engine):
+    """
+    Create any missing indexes for the database the engine is connected to.
+
+    :param engine: sqlalchemy engine, ie from connect_to_db()
+    :return: list, of names of the indexes that were created
+    """
+    logger = logging.getLogger(__name__)
+
+    if not engine.url.drivername.startswith('sqlite') or not engine.url.database:
+        return []
+
+    database_indexes = indexes.get(Path(engine.url.database).name, [])
+
+    if not database_indexes:
+        return []
+
+    created = []
+    with engine.begin() as conn:
+        existing_tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))}
+        existing_indexes = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type='index'"))}
+
+        for name, table, columns, *unique in database_indexes:
+            if table not in existing_tables or name in existing_indexes:
+                continue
+
+            kind = 'UNIQUE INDEX' if unique and unique[0] else 'INDEX'
+
+            try:
+                conn.execute(text(f'CREATE {kind} IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+                created.append(name)
+            except IntegrityError:  # sqlite leaves the transaction usable after a failed statement
+                logger.warning(f'Unique index {name} was not created, since {table} has duplicate rows.')
+
+    return created
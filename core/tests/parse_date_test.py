@@ -0,0 +1,105 @@
+"""
+Tests that summit_core.parse_date() and parse_dates() read timestamps exactly as datetime.strptime() does, for samples
+of what the instruments write and for edge cases: day 366 of a non-leap year, unpadded fields, out of range fields,
+fields int() accepts but strptime() doesn't, and non-ASCII digits. Non-ASCII digits are the one deliberate
+difference; strptime() accepts them, but parse_date() and parse_dates() reject them for the instrument formats.
+"""
+import random
+from datetime import datetime
+
+import pytest
+
+from summit_core import parse_date, parse_dates
+
+samples = {
+    '%Y%j%H%M%S': ['2019254061643', '2018305000000', '2019001235959', '2020366120000',  # LabView logs
+                   '2019366120000',  # day 366 of a non-leap year, which strptime() rolls into the next year
+                   '201925461643', '20192546164', '2019254616', '2019000061643', '2019367061643',
+                   '2019254241643', '2019254066043', '2019254061660', '2019254 61643', '', '2019254061643 '],
+    '%y%j%H%M': ['192540616', '183050000', '190012359', '203661200',  # daily files
+                 '193661200',  # day 366 of a non-leap year
+                 '19254061',  # unpadded minute, which must still parse so a daily file isn't dropped
+                 '1925461', '192546', '190000616', '193670616', '192542400', '192540660', '68001000', '69001000'],
+    '%m/%d/%Y %H:%M:%S': ['9/11/2019 6:16:43', '09/11/2019 06:16:43', '12/31/2019 23:59:59', '2/29/2020 0:00:00',
+                          '2/29/2019 0:00:00', '13/1/2019 0:00:00', '9/11/19 6:16:43', '9/11/2019  6:16:43',
+                          # signs, spaces, underscores and extra digits, which int() accepts
+                          '1/+2/2019 10:00:00', '+1/2/2019 10:00:00', '1/2/+201 10:00:00', '1/2/2019 10:-0:00',
+                          '1/2/2019 10:00: 1', '1/2/2019 1_0:00:00', '001/2/2019 10:00:00', '1/2/2019 10:00:001'],
+    '%m/%d/%Y %H:%M': ['9/11/2019 6:16', '11/1/2018 0:00', '4/9/2019 12:00', '9/11/2019 24:00', '9/11/2019',
+                       '1/+2/2019 10:00', '1/2/2019 +1:00', '1/2/2019 10: 0', '1/2/2019 10:0_0', '1/2/2019 010:00'],
+}
+
+non_ascii = {
+    '%Y%j%H%M%S': ['２０１９254061643', '2019254٠61643'],  # fullwidth and Arabic-Indic digits
+    '%y%j%H%M': ['１９254061６', '192540٦16'],
+}
+
+
+def strptime_or_none(value, fmt):
+    try:
+        return datetime.strptime(value, fmt)
+    except ValueError:
+        return None
+
+
+def assert_parses_like_strptime(values, fmt):
+    """
+    :param values: list, of str timestamps
+    :param fmt: str, strptime format of the timestamps
+    """
+    column = parse_dates(values, fmt, errors='coerce').tolist()  # None for any value that can't be parsed
+
+    for value, parsed in zip(values, column):
+        expected = strptime_or_none(value, fmt)
+
+        if expected is None:
+            with pytest.raises(ValueError):
+                parse_date(value, fmt)
+        else:
+            assert parse_date(value, fmt) == expected, value
+
+        assert parsed == expected, value
+
+
+@pytest.mark.parametrize('fmt', list(samples))
+def test_parse_date_matches_strptime(fmt):
+    assert_parses_like_strptime(samples[fmt], fmt)
+
+
+def random_julian(rng, fmt):
+    """
+    Create a random timestamp in one of the Julian formats, usually zero-padded, sometimes with fields unpadded or out
+    of range.
+    :param rng: random.Random
+    :param fmt: str, '%Y%j%H%M%S' or '%y%j%H%M'
+    :return: str
+    """
+    year = rng.randint(2015, 2025) if fmt == '%Y%j%H%M%S' else rng.randint(0, 99)
+    fields = [(year, 4 if fmt == '%Y%j%H%M%S' else 2), (rng.randint(0, 367), 3), (rng.randint(0, 24), 2),
+              (rng.randint(0, 60), 2)]
+    if fmt == '%Y%j%H%M%S':
+        fields.append((rng.randint(0, 60), 2))
+
+    pad = rng.random() < .8
+    return ''.join(str(value).zfill(width if pad or rng.random() < .5 else 0) for value, width in fields)
+
+
+
+@pytest.mark.parametrize('fmt', ['%Y%j%H%M%S', '%y%j%H%M'])
+def test_parse_date_matches_strptime_for_random_julian_dates(fmt):
+    rng = random.Random(2019)
+    assert_parses_like_strptime([random_julian(rng, fmt) for _ in range(20000)], fmt)
+
+
+@pytest.mark.parametrize('fmt', list(non_ascii))
+def test_parse_date_rejects_non_ascii_digits(fmt):
+    for value in non_ascii[fmt]:
+        with pytest.raises(ValueError):
+            parse_date(value, fmt)
+
+    assert parse_dates(non_ascii[fmt], fmt, errors='coerce').tolist() == [None] * len(non_ascii[fmt])
+
+
+def test_parse_dates_raises_for_bad_values():
+    with pytest.raises(ValueError):
+        parse_dates(['2019254061643', '2019254241643'], '%Y%j%H%M%S')  # an hour of 24
@@ -0,0 +1,75 @@
+"""
+Tests that read_new_bytes() returns only complete lines appended since the last read, and reads a file again from the
+start when it's truncated or replaced.
+"""
+from summit_core import read_new_bytes
+
+
+def test_reads_only_appended_lines(tmp_path):
+    path = tmp_path / 'NMHC_PA.LOG'
+    path.write_bytes(b'line 1\nline 2\n')
+
+    contents, offset, file_id = read_new_bytes(path, 0)
+    assert contents == b'line 1\nline 2\n'
+    assert offset == len(contents)  # read from the start
+
+    with open(path, 'ab') as f:
+        f.write(b'line 3\n')
+
+    contents, offset, file_id = read_new_bytes(path, offset, file_id)
+    assert contents == b'line 3\n'
+    assert offset == path.stat().st_size
+
+    assert read_new_bytes(path, offset, file_id) == (b'', offset, file_id)
+
+
+def test_partial_last_line_is_left_for_next_read(tmp_path):
+    path = tmp_path / 'NMHC_PA.LOG'
+    path.write_bytes(b'line 1\nline 2\nline')
+
+    contents, offset, file_id = read_new_bytes(path, 0)
+    assert contents == b'line 1\nline 2\n'
+    assert offset == len(b'line 1\nline 2\n')
+
+    with open(path, 'ab') as f:
+        f.write(b' 3\nline')
+
+    contents, offset, file_id = read_new_bytes(path, offset, file_id)
+    assert contents == b'line 3\n'
+    assert offset == len(b'line 1\nline 2\nline 3\n')
+
+
+def test_truncated_file_is_read_from_start(tmp_path):
+    path = tmp_path / 'NMHC_PA.LOG'
+    path.write_bytes(b'line 1\nline 2\nline 3\n')
+
+    _, offset, file_id = read_new_bytes(path, 0)
+
+    path.write_bytes(b'line 1\n')
+
+    contents, new_offset, _ = read_new_bytes(path, offset, file_id)
+    assert contents == b'line 1\n'
+    assert new_offset == len(contents)
+
+
+def test_replaced_file_is_read_from_start(tmp_path):
+    path = tmp_path / 'NMHC_PA.LOG'
+    path.write_bytes(b'line 1\nline 2\n')
+
+    _, offset, file_id = read_new_bytes(path, 0)
+
+    path.write_bytes(b'new 1\nnew 2\nnew 3\n')  # larger, with a different first line
+
+    contents, new_offset, new_file_id = read_new_bytes(path, offset, file_id)
+    assert contents == b'new 1\nnew 2\nnew 3\n'
+    assert new_offset == len(contents)
+    assert new_file_id != file_id
+
+
+def test_offset_inside_a_line_is_read_from_start(tmp_path):
+    path = tmp_path / 'NMHC_PA.LOG'
+    path.write_bytes(b'line 1\nline 2\n')
+
+    contents, offset, _ = read_new_bytes(path, 3)  # not at the end of a line, and no file_id to compare
+    assert contents == b'line 1\nline 2\n'
+    assert offset == len(contents)
@@ -0,0 +1,43 @@
+"""
+Tests for SFTPPool.upload(). A LocalSFTPClient stands in for the server, so the "remote" is just another temporary
+directory.
+"""
+import os
+
+from summit_core import SFTPPool, LocalSFTPClient
+
+
+def test_sftp_pool_upload(tmp_path):
+    local_dir, remote_dir = tmp_path / 'local', tmp_path / 'remote'
+    local_dir.mkdir()
+    remote_dir.mkdir()
+
+    pool = SFTPPool(size=1, connect=lambda: LocalSFTPClient(remote_dir))
+
+    local = local_dir / 'plot.png'
+    remote = remote_dir / 'plots' / 'plot.png'
+
+    local.write_bytes(b'first')
+    os.utime(local, (1560000000, 1560000000))
+
+    try:
+        assert pool.upload(local, '/plots')
+        assert remote.read_bytes() == b'first'
+
+        remote.write_bytes(b'other')  # same size, so it's only replaced if upload() doesn't skip it
+        os.utime(remote, (1560000000, 1560000000))
+
+        assert pool.upload(local, '/plots')
+        assert remote.read_bytes() == b'other', 'unchanged file was uploaded again'
+
+        local.write_bytes(b'second')
+        os.utime(local, (1560000060, 1560000060))
+
+        assert pool.upload(local, '/plots')
+        assert remote.read_bytes() == b'second', 'modified file was not uploaded again'
+        assert int(remote.stat().st_mtime) == 1560000060
+
+        assert pool.upload(local_dir / 'missing.png', '/plots') is False
+
+    finally:
+        pool.close()
@@ -0,0 +1,83 @@
+"""
+Tests that synced files are copied to the data directory correctly when they change: files that were appended to have
+only their new bytes copied, and files that were rewritten, even if they grew, are copied whole.
+"""
+import logging
+import os
+
+from summit_core import MovedFile, appended_to, copy_to_data, update_data_file
+
+logger = logging.getLogger(__name__)
+
+
+def make_dirs(tmp_path):
+    sync_dir, data_dir = tmp_path / 'sync', tmp_path / 'data'
+    sync_dir.mkdir()
+    data_dir.mkdir()
+    return sync_dir, data_dir
+
+
+def moved(path, data_dir):
+    """Copy a synced file to data_dir, and return the MovedFile that would be recorded for it."""
+    assert copy_to_data(path, data_dir, logger)
+    copy = data_dir / path.name
+    return MovedFile(copy, 'picarro', 'data', copy.stat().st_size, path.stat().st_mtime)
+
+
+def test_appended_file_is_appended(tmp_path):
+    sync_dir, data_dir = make_dirs(tmp_path)
+    path = sync_dir / 'log.dat'
+
+    path.write_bytes(b'header\nrow 1\nrow 2\n')
+    moved_file = moved(path, data_dir)
+    size = path.stat().st_size
+
+    with open(path, 'ab') as f:
+        f.write(b'row 3\n')
+    os.utime(path, (1560000060, 1560000060))
+
+    assert appended_to(path, data_dir / path.name, size)
+    assert update_data_file(path, path.stat(), 'picarro', data_dir, moved_file, None, logger)
+    assert (data_dir / path.name).read_bytes() == b'header\nrow 1\nrow 2\nrow 3\n'
+    assert moved_file.size == path.stat().st_size
+
+
+def test_rewritten_file_is_copied_whole(tmp_path):
+    sync_dir, data_dir = make_dirs(tmp_path)
+    path = sync_dir / 'log.dat'
+
+    path.write_bytes(b'header\nrow 1\nrow 2\n')
+    moved_file = moved(path, data_dir)
+    size = path.stat().st_size
+
+    path.write_bytes(b'header\nrow A\nrow B\nrow C\n')  # same header, different rows, and larger
+    os.utime(path, (1560000060, 1560000060))
+
+    assert not appended_to(path, data_dir / path.name, size)
+    assert update_data_file(path, path.stat(), 'picarro', data_dir, moved_file, None, logger)
+    assert (data_dir / path.name).read_bytes() == b'header\nrow A\nrow B\nrow C\n'
+
+
+def test_file_with_new_first_line_is_copied_whole(tmp_path):
+    sync_dir, data_dir = make_dirs(tmp_path)
+    path = sync_dir / 'log.dat'
+
+    path.write_bytes(b'header\n' + b'row\n' * 2000)
+    moved(path, data_dir)
+    size = path.stat().st_size
+
+    path.write_bytes(b'HEADER\n' + b'row\n' * 2001)  # differs only before the last block that's compared
+
+    assert not appended_to(path, data_dir / path.name, size)
+    assert copy_to_data(path, data_dir, logger, offset=size)
+    assert (data_dir / path.name).read_bytes() == path.read_bytes()
+
+
+def test_unchanged_file_is_not_copied(tmp_path):
+    sync_dir, data_dir = make_dirs(tmp_path)
+    path = sync_dir / 'log.dat'
+
+    path.write_bytes(b'header\nrow 1\n')
+    moved_file = moved(path, data_dir)
+
+    assert not update_data_file(path, path.stat(), 'picarro', data_dir, moved_file, None, logger)
@@ -7,13 +7,14 @@ usefullness of example plot
 
 # Import libraries & functions
 import datetime as dt
+from pathlib import Path
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.pyplot import figure
 
 # Import Required Functions
 from summit_core import connect_to_db
-from summit_picarro import Base, Datum
+from summit_picarro import Base, get_data, filter_ambient
 from summit_methane import GcRun
 
 
@@ -139,18 +140,14 @@ engine, session = connect_to_db('sqlite:///Jsummit_picarro.sqlite', rundir)
 Base.metadata.create_all(engine)                                                # Create base
 
 date_limits, major_ticks, minor_ticks = custom_create_daily_ticks(6)
-all_data = (session.query(Datum.date, Datum.ch4)                                    # get date and methane
-            .filter((Datum.mpv_position == 0.0) | (Datum.mpv_position == 1.0))      # filter for not cal events
-            .filter((Datum.instrument_status == 963), (Datum.alarm_status == 0))    # filter out bad data
-            .filter(Datum.date >= date_limits['left'])                                # just get certain dates
-            .all())
+all_data = get_data(session.connection(), date_start=date_limits['left'],                 # just get certain dates
+                    columns=['ch4', 'mpv_position', 'instrument_status', 'alarm_status'],  # incl. archived months
+                    archive_dir=Path(rundir) / 'archive')                      # archived with this copy, not live
+all_data = filter_ambient(all_data)                                             # filter out cal events and bad data
 
 # Gather the Picarro Methane Data
-picarro_dates = []
-picarro_ch4 = []
-for result in all_data:
-    picarro_dates.append(result.date)
-    picarro_ch4.append(result.ch4)
+picarro_dates = list(all_data['date'].dt.to_pydatetime())
+picarro_ch4 = all_data['ch4'].tolist()
 
 # Connect to the Methane Database
 engine, session = connect_to_db('sqlite:///Jsummit_methane.sqlite', rundir)     # Create eng & sess
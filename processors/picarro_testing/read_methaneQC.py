@@ -143,7 +143,6 @@ def brendan_test():
 
     session.commit()
     session.close()
-    engine.dispose()
 
 if __name__ == '__main__':
     # main()
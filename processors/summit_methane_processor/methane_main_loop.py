@@ -27,7 +27,7 @@ async def check_load_pa_log(logger):
 
     try:
         from summit_core import methane_LOG_path as pa_filepath
-        from summit_core import connect_to_db, check_filesize, core_dir, Config, split_into_sets_of_n
+        from summit_core import connect_to_db, create_schema, read_new_lines, core_dir, Config, split_into_sets_of_n
         from summit_methane import Base, read_pa_line, PaLine
         from summit_core import methane_dir as rundir
         from pathlib import Path
@@ -38,7 +38,7 @@ async def check_load_pa_log(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -46,7 +46,7 @@ async def check_load_pa_log(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Config)
 
         ch4_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
 
@@ -61,21 +61,14 @@ async def check_load_pa_log(logger):
         return False
 
     try:
-        if check_filesize(pa_filepath) <= ch4_config.filesize:
+        pa_file_contents, new_offset, file_id = read_new_lines(pa_filepath, ch4_config.filesize, ch4_config.file_id)
+
+        if new_offset == ch4_config.filesize and file_id == ch4_config.file_id:
             logger.info('PA file did not change size.')
             return False
 
-        ch4_config.filesize = check_filesize(pa_filepath)
-        core_session.merge(ch4_config)
-        core_session.commit()
-
-        line_to_start = ch4_config.pa_startline - 3  # pad start to avoid missing samples
-        if line_to_start < 0:
-            line_to_start = 0
-
-        pa_file_contents = pa_filepath.read_text().split('\n')[line_to_start:]
-
-        ch4_config.pa_startline = ch4_config.pa_startline + len(pa_file_contents) - 1
+        ch4_config.filesize = new_offset  # committed once lines are loaded, or they would be skipped on failure
+        ch4_config.file_id = file_id
 
         pa_file_contents[:] = [line for line in pa_file_contents if line]
 
@@ -85,6 +78,8 @@ async def check_load_pa_log(logger):
 
         if not pa_lines:
             logger.info('No new PaLines found.')
+            core_session.merge(ch4_config)
+            core_session.commit()
             return False
         else:
             ct = 0  # count committed logs
@@ -119,16 +114,12 @@ async def check_load_pa_log(logger):
         core_session.commit()
 
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
         return False
@@ -145,7 +136,7 @@ async def check_load_run_logs(logger):
     try:
         from summit_core import methane_logs_path
         from summit_core import methane_dir as rundir
-        from summit_core import get_all_data_files, connect_to_db
+        from summit_core import get_all_data_files, connect_to_db, create_schema
         from summit_methane import Base, GcRun, Sample, read_log_file
     except ImportError as e:
         logger.error('ImportError occurred in check_load_run_logs()')
@@ -154,7 +145,7 @@ async def check_load_run_logs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -192,12 +183,10 @@ async def check_load_run_logs(logger):
                 logger.warning('There were not ten Samples per GcRun as expected.')
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
 
         logger.error(f'Exception {e.args} occurred in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -214,7 +203,7 @@ async def match_runs_to_lines(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db
+        from summit_core import connect_to_db, create_schema
         from summit_methane import GcRun, PaLine, match_lines_to_runs, Base
     except ImportError as e:
         send_processor_email(PROC, exception=e)
@@ -223,7 +212,7 @@ async def match_runs_to_lines(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -268,7 +257,7 @@ async def match_peaks_to_samples(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db, split_into_sets_of_n
+        from summit_core import connect_to_db, create_schema, split_into_sets_of_n
         from summit_methane import Peak, Sample, GcRun, Base, sample_rts
         from operator import attrgetter
         import datetime as dt
@@ -279,7 +268,7 @@ async def match_peaks_to_samples(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in match_peaks_to_samples()')
         send_processor_email(PROC, exception=e)
@@ -324,7 +313,6 @@ async def match_peaks_to_samples(logger):
 
         session.commit()
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
@@ -343,7 +331,7 @@ async def add_one_standard(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db
+        from summit_core import connect_to_db, create_schema
         from summit_methane import Standard, Base
     except ImportError as e:
         logger.error('ImportError occurred in add_one_standard()')
@@ -352,7 +340,7 @@ async def add_one_standard(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -370,7 +358,6 @@ async def add_one_standard(logger):
             session.commit()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
@@ -390,9 +377,9 @@ async def quantify_samples(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db, search_for_attr_value
+        from summit_core import connect_to_db, create_schema, search_for_attr_value, Rollup
         from summit_methane import Standard, GcRun, Base
-        from summit_methane import calc_ch4_mr, valid_sample
+        from summit_methane import calc_ch4_mr, valid_sample, roll_up_runs
     except Exception as e:
         logger.error('ImportError occurred in qunatify_samples()')
         send_processor_email(PROC, exception=e)
@@ -400,7 +387,8 @@ async def quantify_samples(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
+        create_schema(engine, Rollup)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -409,9 +397,14 @@ async def quantify_samples(logger):
     try:
         logger.info('Running quantify_samples()')
 
+        if session.query(Rollup.id).first() is None:
+            logger.info('No Rollups exist, all existing runs will be rolled up.')
+            roll_up_runs(session.connection())
+
         unquantified_runs = session.query(GcRun).filter(GcRun.median == None).all()
 
         ct = 0
+        quantified_dates = []
         for run in unquantified_runs:
 
             # TODO: Move the majority of this to class methods for GcRuns; will make editing integrations WAY easier
@@ -468,22 +461,25 @@ async def quantify_samples(logger):
 
                 session.merge(run)
                 # merge only the run, it contains and cascades samples, palines and peaks that were changed
+                quantified_dates.append(run.date)
                 ct += 1
 
             else:
                 logger.warning(f'No standard value found for GcRun at {run.date}.')
 
+        if quantified_dates:
+            session.flush()
+            roll_up_runs(session.connection(), min(quantified_dates), max(quantified_dates))
+
         session.commit()
 
         if ct:
             logger.info(f'{ct} GcRuns were successfully quantified.')
             session.close()
-            engine.dispose()
             return True
         else:
             logger.info('No GcRuns quantified.')
             session.close()
-            engine.dispose()
             return False
 
     except Exception as e:
@@ -504,7 +500,8 @@ async def plot_new_data(logger):
         from pathlib import Path
         from summit_core import core_dir, Config
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db, create_daily_ticks, TempDir, Plot, add_or_ignore_plot
+        from summit_core import connect_to_db, create_schema, create_daily_ticks, Plot, add_or_ignore_plot
+        from summit_core import PlotSpec, render_plots, get_rollup_medians, Rollup
         from summit_methane import Sample, GcRun, Base, plottable_sample, summit_methane_plot
 
         remotedir = r'/data/web/htdocs/instaar/groups/arl/summit/plots'
@@ -516,7 +513,8 @@ async def plot_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
+        create_schema(engine, Rollup)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in plot_new_data()')
         send_processor_email(PROC, exception=e)
@@ -524,8 +522,8 @@ async def plot_new_data(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Plot.__table__.create(core_engine, checkfirst=True)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Plot)
+        create_schema(core_engine, Config)
 
         ch4_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
 
@@ -544,56 +542,51 @@ async def plot_new_data(logger):
 
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
 
-        runs_with_medians = (session.query(GcRun)
+        last_ambient_date = (session.query(GcRun.date)
                              .filter(GcRun.median != None)
                              .filter(GcRun.standard_rsd < .02)
                              .filter(GcRun.rsd < .02)
-                             .order_by(GcRun.date)
-                             .all())
-
-        last_ambient_date = runs_with_medians[-1].date
+                             .order_by(GcRun.date.desc())
+                             .first()[0])
         # get date after filtering, ie don't plot if there's no new data getting plotted
 
         date_limits, major_ticks, minor_ticks = create_daily_ticks(ch4_config.days_to_plot)
 
         if last_ambient_date > ch4_config.last_data_date:
 
-            ambient_dates = [run.date for run in runs_with_medians]
-            ambient_mrs = [run.median for run in runs_with_medians]
+            ambient_dates, ambient_mrs = get_rollup_medians(session.connection(), 'ch4', 'hourly',
+                                                            date_start=date_limits['left'])
+            # hourly medians of the filtered runs, see summit_methane.roll_up_runs()
 
-            with TempDir(rundir / 'plots'):
-                name = summit_methane_plot(None, {'Summit Methane [GC]': [ambient_dates, ambient_mrs]},
-                                           limits={'bottom': 1850, 'top': 2050,
-                                                   'right': date_limits.get('right', None),
-                                                   'left': date_limits.get('left', None)},
-                                           major_ticks=major_ticks,
-                                           minor_ticks=minor_ticks)
+            plots = [PlotSpec(summit_methane_plot, rundir / 'plots',
+                              (None, {'Summit Methane [GC]': [ambient_dates, ambient_mrs]}),
+                              dict(limits={'bottom': 1850, 'top': 2050,
+                                           'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None)},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks))]
 
-                methane_plot = Plot(rundir / 'plots' / name, remotedir, True)  # stage plots to be uploaded
-                add_or_ignore_plot(methane_plot, core_session)
+            for path in await render_plots(plots):
+                add_or_ignore_plot(Plot(path, remotedir, True), core_session)  # stage plots to be uploaded
 
-                ch4_config.last_data_date = last_ambient_date
-                core_session.merge(ch4_config)
+            ch4_config.last_data_date = last_ambient_date
+            core_session.merge(ch4_config)
 
             logger.info('New data plots created.')
         else:
             logger.info('No new data found to be plotted.')
 
         session.close()
-        engine.dispose()
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_new_data()')
         send_processor_email(PROC, exception=e)
         core_session.close()
-        core_engine.dispose()
         session.close()
-        engine.dispose()
         return False
 
 
@@ -612,7 +605,8 @@ async def dual_plot_methane(logger):
         from summit_core import core_dir, Config
         from summit_core import methane_dir
         from summit_core import picarro_dir
-        from summit_core import connect_to_db, create_daily_ticks, TempDir, Plot, add_or_ignore_plot
+        from summit_core import connect_to_db, create_schema, create_daily_ticks, Plot, add_or_ignore_plot
+        from summit_core import PlotSpec, render_plots, get_rollup_medians, Rollup
         from summit_picarro import Datum
         from summit_methane import Base, GcRun, summit_methane_plot
 
@@ -627,10 +621,12 @@ async def dual_plot_methane(logger):
 
     try:
         gc_engine, gc_session = connect_to_db('sqlite:///summit_methane.sqlite', methane_dir)
-        Base.metadata.create_all(gc_engine)
+        create_schema(gc_engine, Base)
+        create_schema(gc_engine, Rollup)
 
         picarro_engine, picarro_session = connect_to_db('sqlite:///summit_picarro.sqlite', picarro_dir)
-        PicarroBase.metadata.create_all(picarro_engine)
+        create_schema(picarro_engine, PicarroBase)
+        create_schema(picarro_engine, Rollup)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in dual_plot_methane()')
         send_processor_email(PROC, exception=e)
@@ -638,8 +634,8 @@ async def dual_plot_methane(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Plot.__table__.create(core_engine, checkfirst=True)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Plot)
+        create_schema(core_engine, Config)
 
         twoplot_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
 
@@ -683,64 +679,46 @@ async def dual_plot_methane(logger):
         if newest_data_point <= twoplot_config.last_data_date:
             logger.info('No new data was found to plot.')
             core_session.close()
-            core_engine.dispose()
             picarro_session.close()
-            picarro_engine.dispose()
             return False
 
         date_limits, major_ticks, minor_ticks = create_daily_ticks(twoplot_config.days_to_plot)
 
         if newest_data_point > twoplot_config.last_data_date:
 
-            runs_with_medians = (gc_session.query(GcRun)
-                                 .filter(GcRun.median != None)
-                                 .filter(GcRun.standard_rsd < .02)
-                                 .filter(GcRun.rsd < .02)
-                                 .order_by(GcRun.date)
-                                 .all())
-
-            gc_dates = [run.date for run in runs_with_medians]
-            gc_ch4 = [run.median for run in runs_with_medians]
-
-            picarro_data = (picarro_session.query(Datum.date, Datum.ch4)
-                            .filter((Datum.mpv_position == 0) | (Datum.mpv_position == 1))
-                            .filter((Datum.instrument_status == 963), (Datum.alarm_status == 0))
-                            .filter(Datum.date >= date_limits['left'])
-                            .all())  # grab only data that falls in plotting period
-
-            picarro_dates = [p.date for p in picarro_data]
-            picarro_ch4 = [p.ch4 for p in picarro_data]
-
-            with TempDir(methane_dir / 'plots'):
-                name = summit_methane_plot(None, {'Summit Methane [Picarro]': [picarro_dates, picarro_ch4],
-                                                  'Summit Methane [GC]': [gc_dates, gc_ch4]},
-                                           title = 'Summit Methane [Picarro & GC]',
-                                           limits={'bottom': 1850, 'top': 2050,
-                                                   'right': date_limits.get('right', None),
-                                                   'left': date_limits.get('left', None)},
-                                           major_ticks=major_ticks,
-                                           minor_ticks=minor_ticks)
-
-                methane_plot = Plot(methane_dir / 'plots' / name, remotedir, True)  # stage plots to be uploaded
-                add_or_ignore_plot(methane_plot, core_session)
-
-                twoplot_config.last_data_date = newest_data_point
-                core_session.merge(twoplot_config)
+            gc_dates, gc_ch4 = get_rollup_medians(gc_session.connection(), 'ch4', 'hourly',
+                                                  date_start=date_limits['left'])
+            picarro_dates, picarro_ch4 = get_rollup_medians(picarro_session.connection(), 'ch4', '5min',
+                                                            date_start=date_limits['left'])
+            # medians of the ambient data in the plotting period, from the Rollups each processor keeps
+
+            plots = [PlotSpec(summit_methane_plot, methane_dir / 'plots',
+                              (None, {'Summit Methane [Picarro]': [picarro_dates, picarro_ch4],
+                                      'Summit Methane [GC]': [gc_dates, gc_ch4]}),
+                              dict(title='Summit Methane [Picarro & GC]',
+                                   limits={'bottom': 1850, 'top': 2050,
+                                           'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None)},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks))]
+
+            for path in await render_plots(plots):
+                add_or_ignore_plot(Plot(path, remotedir, True), core_session)  # stage plots to be uploaded
+
+            twoplot_config.last_data_date = newest_data_point
+            core_session.merge(twoplot_config)
 
             logger.info('New data plots created.')
         else:
             logger.info('No new data found to be plotted.')
 
         gc_session.close()
-        gc_engine.dispose()
 
         picarro_session.close()
-        picarro_engine.dispose()
 
         core_session.commit()
 
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
@@ -748,13 +726,10 @@ async def dual_plot_methane(logger):
         send_processor_email(PROC, exception=e)
 
         core_session.close()
-        core_engine.dispose()
 
         gc_session.close()
-        gc_engine.dispose()
 
         picarro_session.close()
-        picarro_engine.dispose()
         return False
 
 
@@ -778,7 +753,7 @@ async def update_excel_sheet(logger):
         from summit_errors import send_processor_warning
 
         from summit_methane import GcRun, Base, add_formulas_and_format_sheet
-        from summit_core import Config, connect_to_db, append_df_to_excel
+        from summit_core import Config, connect_to_db, create_schema, append_df_to_excel
         from summit_core import methane_dir, core_dir, data_file_paths
 
         methane_sheet = data_file_paths.get('methane_sheet', None)
@@ -797,7 +772,7 @@ async def update_excel_sheet(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
@@ -805,7 +780,7 @@ async def update_excel_sheet(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Config)
 
         methane_sheet_config = core_session.query(Config).filter(Config.processor == 'methane_sheet').one_or_none()
 
@@ -864,16 +839,12 @@ async def update_excel_sheet(logger):
         core_session.commit()
 
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
         return False
@@ -890,7 +861,7 @@ async def read_excel_sheet(logger):
         from summit_errors import send_processor_warning
 
         from summit_methane import GcRun, Base, add_formulas_and_format_sheet
-        from summit_core import Config, connect_to_db, append_df_to_excel
+        from summit_core import Config, connect_to_db, create_schema, append_df_to_excel
         from summit_core import methane_dir, core_dir, data_file_paths
 
         methane_sheet = data_file_paths.get('methane_sheet', None)
@@ -909,7 +880,7 @@ async def read_excel_sheet(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
@@ -917,7 +888,7 @@ async def read_excel_sheet(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Config)
 
         methane_sheet_read_config = (core_session.query(Config)
                                                  .filter(Config.processor == 'methane_sheet_read')
@@ -940,16 +911,12 @@ async def read_excel_sheet(logger):
         core_session.commit()
 
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
         return False
@@ -1,6 +1,5 @@
 from pathlib import Path
 import logging
-from datetime import datetime
 import datetime as dt
 import statistics as s
 
@@ -8,6 +7,8 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 
+from summit_core import cached_plot, reuse_figure, draw_lines, parse_date, julian_day
+
 Base = declarative_base()  # needed to subclass for sqlalchemy objects
 
 # retention times based on sample number
@@ -249,7 +250,7 @@ def read_pa_line(line):
     ls = line.split('\t')
     line_peaks = []
 
-    line_date = datetime.strptime(ls[1] + ' ' + ls[2], '%m/%d/%Y %H:%M:%S')
+    line_date = parse_date(ls[1] + ' ' + ls[2], '%m/%d/%Y %H:%M:%S')
 
     for ind, item in enumerate(ls[3:]):
 
@@ -295,11 +296,9 @@ def read_log_file(path):
     # filter out blank line the VI is writing at the end of files that read_text() keeps
     contents[:] = [line for line in contents if line != '']
 
-    run_year = int(path.name[:4])
-    run_doy = int(path.name[4:7]) - 1  # when adding, if it's DOY 1, you don't want to add 1 to Jan 1 of that year...
     run_hour = int(path.name[7:9])
 
-    run_date = datetime(run_year, 1, 1) + dt.timedelta(days=run_doy, hours=run_hour)
+    run_date = julian_day(path.name[:7]) + dt.timedelta(hours=run_hour)  # files are named by year, DOY and hour
 
     run_dict = {}
     run_dict['logfile'] = path
@@ -349,38 +348,29 @@ def match_lines_to_runs(lines, runs):
     :return: (lines, runs, match_count) list of line objects, list of run objects, and int of runs that were matched
     """
     match_count = 0
-    from summit_core import find_closest_date, search_for_attr_value
+    from summit_core import match_dates
 
     logger = logging.getLogger(__name__)
 
-    for line in lines:
-        # For each log, attempt to find matching NmhcLine
-        # unpack date attr from all NmhcLines provided
-        run_dates = [run.date for run in runs]
-
-        [match, diff] = find_closest_date(line.date, run_dates)  # get matching date and it's difference
-
-        if not match or not diff:
-            continue
+    # Valid matches *usually* *HAD* ~03:22 difference
+    # on 6/12/2019, the sequence was changed, which resulted in differences ranging from 15 min to 55 min.
+    # on 6/20/2019 a handful of runs were ~60 min after, so the tolerance was upped to 70 min
+    matches = match_dates([line.date for line in lines], [run.date for run in runs],
+                          tolerance=dt.timedelta(minutes=70), exact=False)
 
-        if abs(diff) < dt.timedelta(minutes=70):
-            # Valid matches *usually* *HAD* ~03:22 difference
-            # on 6/12/2019, the sequence was changed, which resulted in differences ranging from 15 min to 55 min.
-            # on 6/20/2019 a handful of runs were ~60 min after, so the tolerance was upped to 70 min
+    for line_ind, run_ind in matches:
+        line = lines[line_ind]
+        matched_run = runs[run_ind]
 
-            matched_run = search_for_attr_value(runs, 'date', match)  # pull matching NmhcLine
+        line.status = 'married'
+        matched_run.status = 'married'
 
-            line.status = 'married'
-            matched_run.status = 'married'
+        for peak in line.peaks:
+            peak.run = matched_run  # relate all peaks in pa line to the newly matched run
 
-            for peak in line.peaks:
-                peak.run = matched_run  # relate all peaks in pa line to the newly matched run
-
-            matched_run.pa_line = line
-            logger.info(f'PaLine {line.date} matched to GcRun for {matched_run.date}.')
-            match_count += 1
-        else:
-            continue
+        matched_run.pa_line = line
+        logger.info(f'PaLine {line.date} matched to GcRun for {matched_run.date}.')
+        match_count += 1
 
     return (lines, runs, match_count)
 
@@ -433,6 +423,45 @@ def plottable_sample(sample):
             return True
 
 
+def roll_up_runs(conn, date_start=None, date_end=None):
+    """
+    Update the hourly and daily Rollups of ambient methane for every day between two dates, from the medians of GcRuns
+    that pass the same quality filters used for plotting. Nothing is committed, and any pending ORM changes to runs
+    should be flushed first.
+
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param date_start: datetime, earliest run date that changed, or None to start at the oldest run
+    :param date_end: datetime, latest run date that changed, or None to end at the newest run
+    :return: int, number of Rollups written
+    """
+    import pandas as pd
+    from sqlalchemy import select, func
+    from summit_core import rollup_bounds, update_rollups
+
+    runs = GcRun.__table__
+
+    if date_start is None or date_end is None:
+        oldest, newest = conn.execute(select(func.min(runs.c.date), func.max(runs.c.date))).first()
+
+        if oldest is None:
+            return 0
+
+        date_start = date_start or oldest
+        date_end = date_end or newest
+
+    start, end = rollup_bounds(date_start, date_end)
+
+    run_data = conn.execute(select(runs.c.date, runs.c.median)
+                            .where(runs.c.date >= start)
+                            .where(runs.c.date < end)
+                            .where(runs.c.median != None)
+                            .where(runs.c.standard_rsd < .02)
+                            .where(runs.c.rsd < .02)).fetchall()
+
+    return update_rollups(conn, pd.DataFrame(run_data, columns=['date', 'ch4']), start, end,
+                          periods=['hourly', 'daily'])
+
+
 def set_formula_in_row(ws, num, row, mr_col=1):
     """
     This "loops" through single cells in a column and applies mixing ratio formulas. The format of the formulas is quite
@@ -550,6 +579,7 @@ def add_formulas_and_format_sheet(filename):
     return
 
 
+@cached_plot
 def summit_methane_plot(dates, compound_dict, title = None, limits=None,
                         minor_ticks=None, major_ticks=None, unit_string='ppbv'):
     """
@@ -577,25 +607,22 @@ def summit_methane_plot(dates, compound_dict, title = None, limits=None,
                                 'propane':[None, [.5, 1, 1.5]]})
     """
 
-    import matplotlib.pyplot as plt
     from matplotlib.dates import DateFormatter
     from pandas.plotting import register_matplotlib_converters
     register_matplotlib_converters()
 
-    f1 = plt.figure()
-    ax = f1.gca()
-
+    series = []
     if dates is None:  # dates supplied by individual compounds
         for compound, val_list in compound_dict.items():
             assert val_list[0] is not None, 'A supplied date list was None'
             assert ((len(val_list[0]) > 0) and (len(val_list[0]) == len(val_list[1]))), \
                 'Supplied dates were empty or lengths did not match'
 
-            ax.plot(val_list[0], val_list[1], '-o')
+            series.append((val_list[0], val_list[1]))
 
     else:
         for compound, val_list in compound_dict.items():
-            ax.plot(dates, val_list[1], '-o')
+            series.append((dates, val_list[1]))
 
     compounds_safe = []
     for k, _ in compound_dict.items():
@@ -604,6 +631,10 @@ def summit_methane_plot(dates, compound_dict, title = None, limits=None,
 
     comp_list = ', '.join(compound_dict.keys())  # use real names for plot title
     fn_list = '_'.join(compounds_safe)  # use 'safe' names for filename
+    plot_name = f'{fn_list}_last_week.png'.replace(' ', '_')
+
+    f1, ax = reuse_figure(('summit_methane_plot', plot_name))
+    draw_lines(ax, series)
 
     if limits is not None:
         ax.set_xlim(right=limits.get('right'))
@@ -633,9 +664,6 @@ def summit_methane_plot(dates, compound_dict, title = None, limits=None,
 
     f1.subplots_adjust(bottom=.20)
 
-    plot_name = f'{fn_list}_last_week.png'.replace(' ', '_')
-
     f1.savefig(plot_name, dpi=150)
-    plt.close(f1)
 
     return plot_name
@@ -49,8 +49,9 @@ async def check_load_new_data(logger):
     try:
         from summit_core import picarro_logs_path as data_path
         from summit_core import picarro_dir as rundir
-        from summit_core import connect_to_db, get_all_data_files, check_filesize
-        from summit_picarro import Base, DataFile, Datum
+        from datetime import datetime
+        from summit_core import connect_to_db, create_schema, get_all_data_files, check_filesize, Rollup
+        from summit_picarro import Base, DataFile, read_new_data, create_date_index, insert_data, roll_up_data
         from sqlalchemy.orm.exc import MultipleResultsFound
         from summit_errors import EmailTemplate, sender, processor_email_list
 
@@ -62,13 +63,24 @@ async def check_load_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)  # also adds the offset columns to DataFiles in older databases
+        create_schema(engine, Rollup)
+        date_index = create_date_index(engine)
+
+        if not date_index:
+            logger.warning('Duplicate dates prevented creating a unique index on the data table. '
+                           + 'Duplicates will be checked for by querying instead.')
     except Exception as e:
         logger.error(f'Exception {e.args} caused database connection to fail in check_load_new_data()')
         send_processor_email(PROC, exception=e)
         return False
 
     try:
+        if session.query(Rollup.id).first() is None:
+            logger.info('No Rollups exist, all existing data will be rolled up.')
+            roll_up_data(session.connection())  # does nothing if there's no data yet
+            session.commit()
+
         db_files = session.query(DataFile)
         db_filenames = [d.name for d in db_files.all()]
 
@@ -101,7 +113,7 @@ async def check_load_new_data(logger):
 
         for file in files_to_process:
             try:
-                df = pd.read_csv(file.path, delim_whitespace=True)
+                df, new_offset, from_start = read_new_data(file)  # only rows appended since the last read
             except EmptyDataError as e:
                 logger.error(f'Exception {e.args} occurred while reading {file.name}')
                 send_processor_email(PROC, exception=e)
@@ -110,7 +122,7 @@ async def check_load_new_data(logger):
                 logger.error(f'Pandas ParserError occurred while reading {file.name}.')
                 from summit_errors import send_processor_warning
                 try:
-                    df = pd.read_csv(file.path, delim_whitespace=True, error_bad_lines=False)
+                    df, new_offset, from_start = read_new_data(file, on_bad_lines='skip')
                     send_processor_warning(PROC, 'Dataframe',
                                            (f'The Picarro Processor failed to read file {file.name} '
                                             + 'It was re-parsed, skipping unreadable lines, but should be'
@@ -127,6 +139,12 @@ async def check_load_new_data(logger):
                 send_processor_email(PROC, exception=e)
                 continue
 
+            if df.empty:
+                logger.info(f'No complete new rows were found in file {file.name}.')
+                file.byte_offset = new_offset
+                session.commit()
+                continue
+
             original_length = len(df)
 
             df.dropna(axis=0, how='any', inplace=True)
@@ -147,25 +165,17 @@ async def check_load_new_data(logger):
             df['CH4_sync'] *= 1000  # convert CH4 to ppb
             df['CH4_dry_sync'] *= 1000
 
-            df_list = df.to_dict('records')  # convert to list of dicts
+            inserted = insert_data(df, session.connection(), file_id=file.id, date_index=date_index)
 
-            data_list = []
-            for line in df_list:
-                data_list.append(Datum(line))
-
-            if data_list:
-                data_dates = [d.date for d in data_list]
-                dates_already_in_db = session.query(Datum.date).filter(Datum.date.in_(data_dates)).all()
-                dates_already_in_db[:] = [d.date for d in dates_already_in_db]
-
-                for d in data_list:
-                    if d.date not in dates_already_in_db:
-                        d.file_id = file.id  # relate Datum to the file it originated in
-                        session.add(d)
-            else:
+            if not inserted:
                 logger.info(f'No new data created from file {file.name}.')
+            else:
+                roll_up_data(session.connection(), datetime.utcfromtimestamp(df['EPOCH_TIME'].min()),
+                             datetime.utcfromtimestamp(df['EPOCH_TIME'].max()))  # only days with new data
 
             file.processed = True
+            file.rows_read = (0 if from_start else file.rows_read) + original_length
+            file.byte_offset = new_offset
             file.size = check_filesize(file.path)
             logger.info(f'All data in file {file.name} processed.')
             session.commit()
@@ -188,10 +198,11 @@ async def find_cal_events(logger):
 
     logger.info('Running find_cal_events()')
     try:
-        from summit_core import connect_to_db
+        from summit_core import connect_to_db, create_schema
         from summit_core import picarro_dir as rundir
-        from summit_picarro import Base, Datum, CalEvent, mpv_converter, find_cal_indices
-        from summit_picarro import log_event_quantification, filter_postcal_data
+        from summit_picarro import Base, Datum, CalEvent, mpv_converter, quantify_cal_events
+        from summit_picarro import log_event_quantification, filter_postcal_events, roll_up_data
+        from sqlalchemy import bindparam
     except Exception as e:
         logger.error('ImportError occured in find_cal_events()')
         send_processor_email(PROC, exception=e)
@@ -199,7 +210,7 @@ async def find_cal_events(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in find_cal_events()')
         send_processor_email(PROC, exception=e)
@@ -209,7 +220,7 @@ async def find_cal_events(logger):
         standard_data = {}
         for MPV in [2, 3, 4]:
             mpv_data = pd.DataFrame(session
-                                    .query(Datum.id, Datum.date)
+                                    .query(Datum.id, Datum.date, Datum.co, Datum.co2, Datum.ch4)
                                     .filter(Datum.mpv_position == MPV)
                                     .filter(Datum.cal_id == None)
                                     .all())
@@ -223,49 +234,48 @@ async def find_cal_events(logger):
             # use mpv_converter dict to get standard information
             standard_data[mpv_converter[MPV]] = mpv_data.sort_values(by=['date']).reset_index(drop=True)
 
-        for standard, data in standard_data.items():
-            indices = find_cal_indices(data['date'])
-
-            cal_events = []
+        set_cal_id = (Datum.__table__.update()
+                      .where(Datum.__table__.c.id == bindparam('datum_id'))
+                      .values(cal_id=bindparam('event_id')))
 
-            if not len(indices) and len(data):
-                # if there's not provided indices, but there's still calibration data, create the one event
-                event_data = session.query(Datum).filter(Datum.id.in_(data['id'])).all()
-                cal_events.append(CalEvent(event_data, standard))
+        new_cals = []
+        for standard, data in standard_data.items():
+            events, event_num = quantify_cal_events(data, back_period=21)
 
-            elif not len(indices):
-                # if there's no provided indices
-                logger.info(f'No new cal events were found for {standard} standard.')
-                continue
+            cal_events = {}
+            for num, event in events.iterrows():
+                ev = CalEvent(None, standard, date=event['end'].to_pydatetime())
 
-            prev_ind = 0
+                if event['dump']:
+                    logger.info(f'CalEvent for date {ev.date} had a duration < 90s and was ignored.')
+                    ev.standard_used = 'dump'  # give not-long-enough events standard type 'dump' so they're ignored
+                else:
+                    for cpd in ['co', 'co2', 'ch4']:
+                        setattr(ev, cpd + '_result', {'mean': float(event[cpd + '_mean']),
+                                                      'median': float(event[cpd + '_median']),
+                                                      'stdev': float(event[cpd + '_stdev'])})
+                    ev.back_period = 21
 
-            for num, ind in enumerate(indices):  # get all data within this event
-                event_data = session.query(Datum).filter(Datum.id.in_(data['id'].iloc[prev_ind:ind])).all()
-                cal_events.append(CalEvent(event_data, standard))
+                    logger.info(f'CalEvent for date {ev.date} added.')
+                    log_event_quantification(logger, ev, event['duration'])  # show quantification info as DEBUG
 
-                if num == (len(indices) - 1):  # if it's the last index, get all ahead of it as the last event
-                    event_data = session.query(Datum).filter(Datum.id.in_(data['id'].iloc[ind:])).all()
-                    cal_events.append(CalEvent(event_data, standard))
+                session.add(ev)
+                cal_events[num] = ev
 
-                prev_ind = ind
+            session.flush()  # assigns ids to the new CalEvents
 
-            for ev in cal_events:
+            session.connection().execute(set_cal_id, [{'datum_id': int(datum_id), 'event_id': cal_events[num].id}
+                                                      for datum_id, num in zip(data['id'], event_num)])
+            new_cals.extend(cal_events.values())
 
-                filter_postcal_data(ev, session)  # flag the following minute as questionable data (inst_status = 999)
+        # flag the following minute as questionable data (inst_status = 999), including any that's arrived since the
+        # last run for events that ended at the end of the data
+        flagged = filter_postcal_events(new_cals, session.connection())
 
-                if ev.date - ev.dates[0] < dt.timedelta(seconds=90):
-                    logger.info(f'CalEvent for date {ev.date} had a duration < 90s and was ignored.')
-                    ev.standard_used = 'dump'  # give not-long-enough events standard type 'dump' so they're ignored
-                    session.merge(ev)
-                else:
-                    for cpd in ['co', 'co2', 'ch4']:
-                        ev.calc_result(cpd, 21)  # calculate results for all compounds going 21s back
+        if flagged:
+            roll_up_data(session.connection(), min(w.start for w in flagged), max(w.end for w in flagged))
 
-                    session.merge(ev)
-                    logger.info(f'CalEvent for date {ev.date} added.')
-                    log_event_quantification(logger, ev)  # show quantification info as DEBUG in log
-            session.commit()
+        session.commit()
         return True
 
     except Exception as e:
@@ -288,7 +298,7 @@ async def create_mastercals(logger):
     try:
         from summit_core import picarro_dir as rundir
         from summit_core import connect_to_db
-        from summit_picarro import MasterCal, CalEvent, match_cals_by_min
+        from summit_picarro import MasterCal, CalEvent, match_cals
         import matplotlib.pyplot as plt
         import seaborn as sns
         import numpy as np
@@ -317,15 +327,13 @@ async def create_mastercals(logger):
                    .filter(CalEvent.mastercal_id == None, CalEvent.standard_used == 'mid_std')
                    .all())
 
-        mastercals = []
-        for lowcal in lowcals:
-            matching_high = match_cals_by_min(lowcal, highcals, minutes=5)
-
-            if matching_high:
-                matching_mid = match_cals_by_min(matching_high, midcals, minutes=5)
+        matching_highs = match_cals(lowcals, highcals, minutes=5)
+        matching_mids = match_cals(matching_highs, midcals, minutes=5)
 
-                if matching_mid:
-                    mastercals.append(MasterCal([lowcal, matching_high, matching_mid]))
+        mastercals = []
+        for lowcal, matching_high, matching_mid in zip(lowcals, matching_highs, matching_mids):
+            if matching_high and matching_mid:
+                mastercals.append(MasterCal([lowcal, matching_high, matching_mid]))
 
         if mastercals:
             for mc in mastercals:
@@ -360,8 +368,9 @@ async def plot_new_data(logger):
     try:
         from pathlib import Path
         from summit_core import picarro_dir as rundir
-        from summit_core import create_daily_ticks, connect_to_db, TempDir, Plot, core_dir, Config, add_or_ignore_plot
-        from summit_picarro import Base, Datum, summit_picarro_plot
+        from summit_core import create_daily_ticks, connect_to_db, Plot, core_dir, Config, add_or_ignore_plot
+        from summit_core import create_schema, get_rollups, Rollup, PlotSpec, render_plots
+        from summit_picarro import Base, Datum, summit_picarro_plot, get_data, filter_ambient
 
         plotdir = rundir / 'plots'
         remotedir = r'/data/web/htdocs/instaar/groups/arl/summit/plots'
@@ -373,7 +382,8 @@ async def plot_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
+        create_schema(engine, Rollup)
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_new_data()')
         send_processor_email(PROC, exception=e)
@@ -381,8 +391,8 @@ async def plot_new_data(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Plot.__table__.create(core_engine, checkfirst=True)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Plot)
+        create_schema(core_engine, Config)
 
         picarro_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
 
@@ -404,9 +414,7 @@ async def plot_new_data(logger):
         if newest_data_point <= picarro_config.last_data_date:
             logger.info('No new data was found to plot.')
             core_session.close()
-            core_engine.dispose()
             session.close()
-            engine.dispose()
             return False
 
         picarro_config.last_data_date = newest_data_point
@@ -414,88 +422,133 @@ async def plot_new_data(logger):
 
         date_limits, major_ticks, minor_ticks = create_daily_ticks(picarro_config.days_to_plot)
 
-        all_data = (session.query(Datum.date, Datum.co, Datum.co2, Datum.ch4)
-                    .filter((Datum.mpv_position == 0) | (Datum.mpv_position == 1))
-                    .filter((Datum.instrument_status == 963), (Datum.alarm_status == 0))
-                    .filter(Datum.date >= date_limits['left'])  # grab only data that falls in plotting period
-                    .all())
+        # grab only data that falls in plotting period, from the archives if it's been archived
+        all_data = filter_ambient(get_data(session.connection(), date_start=date_limits['left'],
+                                           columns=['co2', 'ch4', 'mpv_position', 'instrument_status',
+                                                    'alarm_status']))
 
-        if not all_data:
+        if not len(all_data):
             logger.info('No new data was found to plot.')
             core_session.close()
-            core_engine.dispose()
             session.close()
-            engine.dispose()
             return False
 
         # get only ambient data
-        dates = []
-        co = []
-        co2 = []
-        ch4 = []
-        for result in all_data:
-            dates.append(result.date)
-            co.append(result.co)
-            co2.append(result.co2)
-            ch4.append(result.ch4)
-
-        with TempDir(plotdir):
-
-            from summit_core import five_minute_medians
-            dates_co, co = five_minute_medians(dates, co)
-
-            name = summit_picarro_plot(None, ({'Summit CO': [dates_co, co]}),
-                                       limits={'right': date_limits.get('right', None),
-                                               'left': date_limits.get('left', None),
-                                               'bottom': 80,
-                                               'top': 230},
-                                       major_ticks=major_ticks,
-                                       minor_ticks=minor_ticks)
-
-            co_plot = Plot(plotdir / name, remotedir, True)  # stage plots to be uploaded
-            add_or_ignore_plot(co_plot, core_session)
-
-            name = summit_picarro_plot(None, ({'Summit CO2': [dates, co2]}),
-                                       limits={'right': date_limits.get('right', None),
-                                               'left': date_limits.get('left', None),
-                                               'bottom': 390,
-                                               'top': 420},
-                                       major_ticks=major_ticks,
-                                       minor_ticks=minor_ticks,
-                                       unit_string='ppmv')
-
-            co2_plot = Plot(plotdir / name, remotedir, True)  # stage plots to be uploaded
-            add_or_ignore_plot(co2_plot, core_session)
-
-            name = summit_picarro_plot(None, ({'Summit Methane [Picarro]': [dates, ch4]}),
-                                       limits={'right': date_limits.get('right', None),
-                                               'left': date_limits.get('left', None),
-                                               'bottom': 1850,
-                                               'top': 2050},
-                                       major_ticks=major_ticks,
-                                       minor_ticks=minor_ticks)
-
-            ch4_plot = Plot(plotdir / name, remotedir, True)  # stage plots to be uploaded
-            add_or_ignore_plot(ch4_plot, core_session)
+        dates = list(all_data['date'].dt.to_pydatetime())
+        co2 = all_data['co2'].tolist()
+        ch4 = all_data['ch4'].tolist()
+
+        co_medians = get_rollups(session.connection(), 'co', '5min', date_start=date_limits['left'])
+        dates_co, co = list(co_medians['date'].dt.to_pydatetime()), co_medians['median'].tolist()
+
+        plots = [PlotSpec(summit_picarro_plot, plotdir,
+                          (None, {'Summit CO': [dates_co, co]}),
+                          dict(limits={'right': date_limits.get('right', None),
+                                       'left': date_limits.get('left', None),
+                                       'bottom': 80,
+                                       'top': 230},
+                               major_ticks=major_ticks,
+                               minor_ticks=minor_ticks)),
+                 PlotSpec(summit_picarro_plot, plotdir,
+                          (None, {'Summit CO2': [dates, co2]}),
+                          dict(limits={'right': date_limits.get('right', None),
+                                       'left': date_limits.get('left', None),
+                                       'bottom': 390,
+                                       'top': 420},
+                               major_ticks=major_ticks,
+                               minor_ticks=minor_ticks,
+                               unit_string='ppmv')),
+                 PlotSpec(summit_picarro_plot, plotdir,
+                          (None, {'Summit Methane [Picarro]': [dates, ch4]}),
+                          dict(limits={'right': date_limits.get('right', None),
+                                       'left': date_limits.get('left', None),
+                                       'bottom': 1850,
+                                       'top': 2050},
+                               major_ticks=major_ticks,
+                               minor_ticks=minor_ticks))]
+
+        for path in await render_plots(plots):
+            add_or_ignore_plot(Plot(path, remotedir, True), core_session)  # stage plots to be uploaded
 
         logger.info('New data plots were created.')
 
         session.close()
-        engine.dispose()
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
         return True
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_new_data()')
         send_processor_email(PROC, exception=e)
 
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
+        return False
+
+
+async def archive_old_data(logger, keep_months=2):
+    """
+    Moves data from closed months out of the database and into monthly archives, so the database only holds recent
+    data. The current month and the months before it are kept, and no data is archived from the month of any flush
+    window that hasn't been completely filtered yet.
+
+    :param logger: logging logger at module level
+    :param keep_months: int, number of months (including the current one) to keep in the database
+    :return: boolean, were any months archived?
+    """
+
+    logger.info('Running archive_old_data()')
+
+    try:
+        from datetime import datetime
+        from sqlalchemy import func
+        from summit_core import picarro_dir as rundir
+        from summit_core import connect_to_db, create_schema, picarro_archive_dir
+        from summit_picarro import Base, FlushWindow, archive_months
+    except ImportError as e:
+        logger.error('ImportError occurred in archive_old_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
+        create_schema(engine, Base)
+    except Exception as e:
+        logger.error(f'Exception {e.args} prevented connection to the database in archive_old_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        now = datetime.utcnow()
+        months = now.year * 12 + now.month - keep_months  # months since year 0 of the first month to keep
+        before = datetime(months // 12, months % 12 + 1, 1)
+
+        oldest_incomplete = (session.query(func.min(FlushWindow.start))
+                             .filter(FlushWindow.complete == False)
+                             .scalar())
+
+        if oldest_incomplete and oldest_incomplete < before:
+            before = datetime(oldest_incomplete.year, oldest_incomplete.month, 1)
+
+        archived = archive_months(session.connection(), before, picarro_archive_dir)
+        session.commit()
+
+        if not archived:
+            logger.info('No data was old enough to archive.')
+            session.close()
+            return False
+
+        for path in archived:
+            logger.info(f'Data archived to {path.name}.')
+
+        session.close()
+        return True
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in archive_old_data()')
+        send_processor_email(PROC, exception=e)
+        session.rollback()
+        session.close()
         return False
 
 
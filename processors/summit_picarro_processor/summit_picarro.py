@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 import datetime as dt
 from datetime import datetime
@@ -10,9 +11,9 @@ import seaborn as sns
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session
 
-from summit_core import JDict
+from summit_core import JDict, picarro_archive_dir, cached_plot, reuse_figure, draw_lines
 
 Base = declarative_base()
 
@@ -32,6 +33,10 @@ standards = {'low_std': {'co': 69.6, 'co2': 390.24, 'ch4': 1838.5},
              'mid_std': {'co': 117.4, 'co2': 408.65, 'ch4': 1925.5},
              'high_std': {'co': 174.6, 'co2': 428.53, 'ch4': 2050.6}}
 
+archive_columns = ['id', 'date'] + column_names + ['file_id', 'cal_id']
+
+rollup_series = ['co', 'co2', 'ch4', 'h2o']  # kept as Rollups, from ambient data only
+
 Point = namedtuple('Point', 'x y')
 Curve = namedtuple('Point', 'm intercept')
 
@@ -40,7 +45,8 @@ class DataFile(Base):
     """
     A file containing synced 5-second data from the Picarro. Used mostly for tracking where data originated from, and
     what files have already been loaded. The byte-size of a file is stored to track whether or not it has been loaded
-    in full yet.
+    in full yet. The byte offset and number of rows read so far, and the file's header, are kept so only new rows
+    need to be parsed when the file grows.
     """
     __tablename__ = 'files'
 
@@ -49,13 +55,18 @@ class DataFile(Base):
     _path = Column(String, unique=True)
     size = Column(Integer)
     processed = Column(Boolean)
+    byte_offset = Column(Integer)  # bytes read so far, always at the end of a complete line
+    rows_read = Column(Integer)
+    header = Column(String)  # whitespace-delimited column names from the first line
 
-    datum = relationship('Datum')
+    datum = relationship('Datum')  # only rows still in the database, use get_data() for archived months too
 
     def __init__(self, path):
         self.path = path
         self.size = Path.stat(path).st_size
         self.processed = False
+        self.byte_offset = 0
+        self.rows_read = 0
 
     @property
     def path(self):
@@ -84,7 +95,7 @@ class Datum(Base):
     __tablename__ = 'data'
 
     id = Column(Integer, primary_key=True)
-    date = Column(DateTime)
+    date = Column(DateTime, index=True, unique=True)  # unique index lets insert_data() ignore duplicate rows
     alarm_status = Column(Integer)
     instrument_status = Column(Integer)
     cavity_pressure = Column(Float)
@@ -121,7 +132,7 @@ class CalEvent(Base):
 
     id = Column(Integer, primary_key=True)
     date = Column(DateTime)
-    data = relationship('Datum', back_populates='cal', order_by='Datum.date')
+    data = relationship('Datum', back_populates='cal', order_by='Datum.date')  # only rows still in the database
     standard_used = Column(String)  # type = 'high' | 'mid' | 'low' | other_specific_names
     co_result = Column(MutableDict.as_mutable(JDict))  # {'mean': x, 'median': x, 'stdev': x}
     co2_result = Column(MutableDict.as_mutable(JDict))  # {'mean': x, 'median': x, 'stdev': x}
@@ -131,9 +142,15 @@ class CalEvent(Base):
     mastercal = relationship('MasterCal', back_populates='subcals')
     mastercal_id = Column(Integer, ForeignKey('mastercals.id'))
 
-    def __init__(self, data, standard_used):
-        self.data = data
-        self.date = self.dates[-1]  # date of a CalEvent is the last timestamp in the cal period
+    def __init__(self, data, standard_used, date=None):
+        """
+        :param data: list, of Datums in the event, or None if they'll be assigned by cal_id afterwards
+        :param standard_used: str, the standard used, ie 'low_std'
+        :param date: datetime, the last timestamp in the event, only needed if data is None
+        """
+        if data:
+            self.data = data
+        self.date = date if date else self.dates[-1]  # date of a CalEvent is the last timestamp in the cal period
         self.standard_used = standard_used
 
     def calc_result(self, compound, back_period):
@@ -176,27 +193,84 @@ class CalEvent(Base):
         self.back_period = back_period
         return
 
+    def event_data(self):
+        """
+        Get the data in this event. Events in the database are read with get_data(), since the months they're in may
+        have been archived, and the data relationship only holds rows still in the database. Events that haven't been
+        added yet use the Datums they were created with. The data is kept on the event once read, so each of its
+        properties doesn't read it again.
+
+        :return: DataFrame, with columns ['date', 'co', 'co2', 'ch4'], ordered by date
+        """
+        cached = self.__dict__.get('_event_data')
+
+        if cached is not None and cached[0] == self.id:
+            return cached[1]  # read for the event as it is now, ie not before it was added
+
+        columns = ['date', 'co', 'co2', 'ch4']
+        session = object_session(self)
+
+        if session is None or self.id is None:
+            event_data = pd.DataFrame([[getattr(d, col) for col in columns] for d in self.data], columns=columns)
+        else:
+            # events last minutes, so a day before their end date is sure to have all their data
+            data = get_data(session.connection(), date_start=self.date - dt.timedelta(days=1), date_end=self.date,
+                            columns=columns + ['cal_id'])
+
+            event_data = data.loc[data['cal_id'] == self.id, columns].reset_index(drop=True)
+
+        self._event_data = (self.id, event_data)
+        return event_data
+
     @property
     def dates(self):
-        return [d.date for d in self.data]
+        return list(pd.to_datetime(self.event_data()['date']).dt.to_pydatetime())
 
     @property
     def co(self):
-        return [d.co for d in self.data]
+        return self.event_data()['co'].tolist()
 
     @property
     def co2(self):
-        return [d.co2 for d in self.data]
+        return self.event_data()['co2'].tolist()
 
     @property
     def ch4(self):
-        return [d.ch4 for d in self.data]
+        return self.event_data()['ch4'].tolist()
 
     @property
     def duration(self):
         return self.date - self.dates[0]
 
 
+class FlushWindow(Base):
+    """
+    A period after a calibration event where the ambient data has been filtered while the standard flushes out of the
+    sampling line. Windows are complete once data after the end of the window has been loaded, meaning every point in
+    the window has been filtered and it doesn't need to be checked again.
+    """
+    __tablename__ = 'flush_windows'
+
+    id = Column(Integer, primary_key=True)
+    start = Column(DateTime, unique=True)  # the date of the CalEvent, ie the last point of calibration data
+    end = Column(DateTime)
+    complete = Column(Boolean)
+
+    cal_id = Column(Integer, ForeignKey('cals.id'))
+
+    def __init__(self, start, end, cal_id=None):
+        self.start = start
+        self.end = end
+        self.cal_id = cal_id
+        self.complete = False
+
+    def __str__(self):
+        return f'<FlushWindow from {self.start} to {self.end}>'
+
+    def __repr__(self):
+        return f'<FlushWindow from {self.start} to {self.end}>'
+
+
 class MasterCal(Base):
     """
     A whole calibration, which consists of a high standard, low standard, and middle standard measurement.
@@ -266,6 +340,343 @@ class MasterCal(Base):
         return find_cal_by_type(self.subcals, 'low_std')
 
 
+def read_new_data(file, **kwargs):
+    """
+    Parse only the rows appended to a DataFile since it was last read, using its cached header as the column names.
+    The file's header is (re)cached if it has to be read from the start. The file's offset is NOT updated, so it can be
+    set once the data is committed.
+
+    :param file: DataFile, to read new rows from
+    :param kwargs: passed to pd.read_csv(), ie on_bad_lines='skip'
+    :return: tuple, (DataFrame of new rows, int offset read to, boolean True if the file was read from the start)
+    """
+    from io import BytesIO
+    from summit_core import read_new_bytes
+
+    contents, offset, _ = read_new_bytes(file.path, file.byte_offset)  # every .dat file has the same header
+    from_start = offset == len(contents)
+
+    if from_start:
+        header_end = contents.find(b'\n') + 1
+        file.header = contents[:header_end].decode().strip()
+        contents = contents[header_end:]
+
+    if not contents or not file.header:
+        return pd.DataFrame(), offset, from_start
+
+    df = pd.read_csv(BytesIO(contents), sep=r'\s+', header=None, names=file.header.split(), **kwargs)
+
+    return df, offset, from_start
+
+
+def create_date_index(engine):
+    """
+    Create the unique index on Datum.date for databases made before it was added to the model. This will fail if the
+    database already contains duplicate dates, in which case insert_data() has to check for duplicates itself.
+
+    :param engine: sqlalchemy engine, connected to the Picarro database
+    :return: boolean, True if the index exists
+    """
+    from sqlalchemy.exc import IntegrityError
+
+    try:
+        for index in Datum.__table__.indexes:
+            index.create(engine, checkfirst=True)
+    except IntegrityError:
+        return False
+
+    return True
+
+
+def insert_data(df, conn, file_id=None, date_index=True, chunk_size=5000, archive_dir=picarro_archive_dir):
+    """
+    Insert a DataFrame of Picarro data straight into the data table in chunks, without creating a Datum for every row.
+    Rows are converted the same way as in Datum.__init__. Rows with a date that's already in the database are skipped
+    with ON CONFLICT(date) DO NOTHING, or by querying for their dates first if the date index could not be created.
+    Rows with a date that's already been archived are skipped too, since they're no longer in the database to conflict
+    with, and the archived rows keep their calibration ids and flags.
+
+    :param df: DataFrame, as read from a .dat file, ie by read_new_data()
+    :param conn: sqlalchemy Connection, ie session.connection() so the insert is part of the session's transaction
+    :param file_id: int, id of the DataFile the data came from
+    :param date_index: boolean, False if the unique index on Datum.date does not exist, see create_date_index()
+    :param chunk_size: int, number of rows per executemany()
+    :param archive_dir: pathlib.Path, directory the monthly archives are kept in
+    :return: int, number of rows inserted
+    """
+    from sqlalchemy.dialects.sqlite import insert
+    from summit_core import split_into_sets_of_n
+
+    data = pd.DataFrame({var: df.get(column_to_instance_names.get(var)) for var in column_names}, index=df.index)
+    data['date'] = df['EPOCH_TIME'].map(datetime.utcfromtimestamp)
+    data['file_id'] = file_id
+
+    data = data[~data['date'].isin(archived_dates(data['date'], archive_dir))]
+
+    data = data.astype(object).where(data.notna(), None)  # native Python types, with None for nulls
+    records = data.to_dict('records')
+
+    if date_index:
+        stmt = insert(Datum.__table__).on_conflict_do_nothing(index_elements=['date'])
+    else:
+        # SQLite can't take in clauses with > 1000 variables, so check in sets of 500
+        dates_already_in_db = set()
+        for date_set in split_into_sets_of_n(list(data['date']), 500):
+            matches = conn.execute(Datum.__table__.select()
+                                   .with_only_columns(Datum.__table__.c.date)
+                                   .where(Datum.__table__.c.date.in_(date_set)))
+            dates_already_in_db.update(m.date for m in matches)
+
+        records[:] = [r for r in records if r['date'] not in dates_already_in_db]
+        stmt = insert(Datum.__table__)
+
+    inserted = 0
+    for chunk in split_into_sets_of_n(records, chunk_size):
+        inserted += conn.execute(stmt, chunk).rowcount
+
+    return inserted
+
+
+def next_month(date):
+    """
+    :param date: datetime
+    :return: datetime, midnight on the first day of the month after date
+    """
+    return datetime(date.year + date.month // 12, date.month % 12 + 1, 1)
+
+
+def archive_path(month, archive_dir=picarro_archive_dir):
+    """
+    :param month: datetime, any date in the month
+    :param archive_dir: pathlib.Path, directory the monthly archives are kept in
+    :return: pathlib.Path, ie archive_dir / 'picarro_2019_05.npz'
+    """
+    return Path(archive_dir) / f'picarro_{month.year}_{month.month:02d}.npz'
+
+
+def read_archive(path, columns=None):
+    """
+    Read a monthly archive of Picarro data. Columns are stored separately, so only the requested ones are decompressed.
+
+    :param path: pathlib.Path, to a .npz archive made by write_archive()
+    :param columns: list, of column names to read, defaults to all of archive_columns
+    :return: DataFrame
+    """
+    import numpy as np
+
+    with np.load(path) as archive:
+        return pd.DataFrame({col: archive[col] for col in (columns or archive.files)})
+
+
+def write_archive(data, path):
+    """
+    Write a DataFrame of Picarro data to a compressed, columnar .npz file. Dates are kept as datetime64 and all other
+    columns as floats (with NaN for nulls), except ids. The file is written under a temporary name and then renamed,
+    so a partially-written archive is never read.
+
+    :param data: DataFrame, containing every column in archive_columns
+    :param path: pathlib.Path, to write to
+    :return: None
+    """
+    import numpy as np
+
+    columns = {'id': data['id'].to_numpy(dtype='int64'),
+               'date': pd.to_datetime(data['date']).to_numpy(dtype='datetime64[ns]')}
+
+    for col in archive_columns[2:]:
+        columns[col] = pd.to_numeric(data[col]).to_numpy(dtype='float64')
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **columns)
+
+    os.replace(tmp_path, path)
+
+
+def archived_dates(dates, archive_dir=picarro_archive_dir):
+    """
+    Find which of a set of dates are already in the monthly archives. Only the archives of months the dates fall in are
+    read, and only their dates.
+
+    :param dates: iterable, of datetimes
+    :param archive_dir: pathlib.Path, directory the monthly archives are kept in
+    :return: set, of the dates that have been archived
+    """
+    dates = set(dates)
+    months = {datetime(d.year, d.month, 1) for d in dates}
+
+    archived = set()
+    for month in months:
+        path = archive_path(month, archive_dir)
+
+        if path.exists():
+            archived.update(pd.to_datetime(read_archive(path, ['date'])['date']).dt.to_pydatetime())
+
+    return dates & archived
+
+
+def archive_months(conn, before, archive_dir=picarro_archive_dir):
+    """
+    Move all data from every month that ended on or before the given date out of the database and into monthly
+    archives. If a month was already archived (ie old data was loaded again), its archive is re-written with the new
+    rows, keeping the archived version of any row that's in both. Rows are only deleted after their archive has been
+    written, and nothing is committed, so this can be part of a larger transaction.
+
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param before: datetime, only months ending on or before this are archived
+    :param archive_dir: pathlib.Path, directory the monthly archives are kept in
+    :return: list, of paths to the archives that were written
+    """
+    from sqlalchemy import select, func
+
+    data = Datum.__table__
+
+    oldest = conn.execute(select(func.min(data.c.date))).scalar()
+
+    if oldest is None:
+        return []
+
+    written = []
+    month = datetime(oldest.year, oldest.month, 1)
+
+    while next_month(month) <= before:
+        in_month = (data.c.date >= month) & (data.c.date < next_month(month))
+
+        rows = conn.execute(select(*[data.c[col] for col in archive_columns]).where(in_month)).fetchall()
+
+        if rows:
+            month_data = pd.DataFrame(rows, columns=archive_columns)
+            path = archive_path(month, archive_dir)
+
+            if path.exists():
+                month_data = pd.concat([read_archive(path), month_data], ignore_index=True)
+                month_data = month_data.drop_duplicates(subset='date', keep='first').sort_values(by='date')
+
+            write_archive(month_data, path)
+            conn.execute(data.delete().where(in_month))
+            written.append(path)
+
+        month = next_month(month)
+
+    return written
+
+
+def get_data(conn, date_start=None, date_end=None, columns=None, archive_dir=picarro_archive_dir):
+    """
+    Get Picarro data between two dates as one DataFrame, from the monthly archives and the database together. Only
+    archives for months that overlap the dates are read. Dates are inclusive at both ends, and either can be None to
+    leave that side open.
+
+    :param conn: sqlalchemy Connection or Engine for the Picarro database
+    :param date_start: datetime, earliest date to get data for
+    :param date_end: datetime, latest date to get data for
+    :param columns: list, of column names from archive_columns, defaults to all of them; date is always included
+    :param archive_dir: pathlib.Path, directory the monthly archives are kept in
+    :return: DataFrame, ordered by date, with one row per date
+    """
+    from sqlalchemy import select
+
+    data = Datum.__table__
+    columns = ['date'] + [col for col in (columns or archive_columns) if col != 'date']
+
+    frames = []
+    for path in sorted(Path(archive_dir).glob('picarro_*_*.npz')):
+        year, month = path.stem.split('_')[1:]
+        month_start = datetime(int(year), int(month), 1)
+
+        if (date_end and month_start > date_end) or (date_start and next_month(month_start) <= date_start):
+            continue
+
+        month_data = read_archive(path, columns)
+
+        if date_start:
+            month_data = month_data[month_data['date'] >= date_start]
+        if date_end:
+            month_data = month_data[month_data['date'] <= date_end]
+
+        frames.append(month_data)
+
+    query = select(*[data.c[col] for col in columns])
+
+    if date_start:
+        query = query.where(data.c.date >= date_start)
+    if date_end:
+        query = query.where(data.c.date <= date_end)
+
+    frames.append(pd.DataFrame(conn.execute(query).fetchall(), columns=columns))
+
+    all_data = pd.concat(frames, ignore_index=True)
+    all_data['date'] = pd.to_datetime(all_data['date'])
+
+    # rows loaded again after their month was archived are in both, so keep the archived ones, which have their cal_id
+    # and any flushes flagged
+    return all_data.drop_duplicates(subset='date', keep='first').sort_values(by='date').reset_index(drop=True)
+
+
+def filter_ambient(data):
+    """
+    Get only good ambient data; from valve positions 0 or 1, with an instrument status of 963 and no alarms. Data
+    filtered after calibrations (instrument status 999) is also removed.
+
+    :param data: DataFrame, with at least the columns mpv_position, instrument_status and alarm_status
+    :return: DataFrame, of only the good ambient rows
+    """
+    return data[data['mpv_position'].isin([0, 1])
+                & (data['instrument_status'] == 963) & (data['alarm_status'] == 0)]
+
+
+def roll_up_data(conn, date_start=None, date_end=None, archive_dir=picarro_archive_dir, chunk_days=31):
+    """
+    Update the Rollups of ambient data for every day between two dates, reading a month at a time from the archives and
+    database with get_data(). Nothing is committed, so this can be part of the transaction that changed the data.
+
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param date_start: datetime, earliest date that changed, or None to start at the oldest data
+    :param date_end: datetime, latest date that changed, or None to end at the newest data
+    :param archive_dir: pathlib.Path, directory the monthly archives are kept in
+    :param chunk_days: int, number of days of data to read at once
+    :return: int, number of Rollups written
+    """
+    from sqlalchemy import select, func
+    from summit_core import rollup_bounds, update_rollups
+
+    data = Datum.__table__
+
+    if date_start is None or date_end is None:
+        oldest, newest = conn.execute(select(func.min(data.c.date), func.max(data.c.date))).first()
+        archives = sorted(Path(archive_dir).glob('picarro_*_*.npz'))
+
+        if archives:
+            year, month = archives[0].stem.split('_')[1:]
+            oldest = datetime(int(year), int(month), 1)
+
+            if newest is None:
+                year, month = archives[-1].stem.split('_')[1:]
+                newest = next_month(datetime(int(year), int(month), 1)) - dt.timedelta(seconds=1)
+
+        if oldest is None:
+            return 0  # no data at all
+
+        date_start = date_start or oldest
+        date_end = date_end or newest
+
+    start, end = rollup_bounds(date_start, date_end)
+
+    written = 0
+    while start < end:
+        chunk_end = min(start + dt.timedelta(days=chunk_days), end)
+
+        chunk = filter_ambient(get_data(conn, start, chunk_end, archive_dir=archive_dir,
+                                        columns=rollup_series + ['mpv_position', 'instrument_status', 'alarm_status']))
+
+        written += update_rollups(conn, chunk[['date'] + rollup_series], start, chunk_end)
+        start = chunk_end
+
+    return written
+
+
 def find_cal_by_type(standards, std_type):
     """
 
@@ -290,15 +701,56 @@ def find_cal_indices(datetimes):
     return indices
 
 
-def log_event_quantification(logger, event):
+def quantify_cal_events(data, back_period=21, min_duration=90, gap=60):
+    """
+    Split all the calibration data for one standard into events and quantify every event in one pass. Any data more
+    than gap seconds after the previous point starts a new event, as in find_cal_indices(). Events shorter than
+    min_duration seconds are marked as dumps and not quantified. The rest are quantified from the data in the last
+    back_period seconds of the event, plus the point just before it, the same as CalEvent.calc_result().
+
+    :param data: DataFrame, with columns ['id', 'date', 'co', 'co2', 'ch4'], sorted by date
+    :param back_period: int, seconds to back-average from end of calibration period
+    :param min_duration: int, seconds an event must last to be quantified
+    :param gap: int, seconds between points that separates two events
+    :return: tuple, (DataFrame with one row per event, Series giving the event number for every row of data)
+        The events DataFrame has columns ['start', 'end', 'duration', 'dump'], and [cpd_mean, cpd_median, cpd_stdev]
+        for each of co, co2 and ch4 (NaN for dumps)
+    """
+    event_num = (data['date'].diff() > pd.Timedelta(seconds=gap)).cumsum()
+
+    dates = data['date'].groupby(event_num)
+    events = pd.DataFrame({'start': dates.first(), 'end': dates.last()})
+    events['duration'] = events['end'] - events['start']
+    events['dump'] = events['duration'] < pd.Timedelta(seconds=min_duration)
+
+    cutoff = event_num.map(events['end']) - pd.Timedelta(seconds=back_period)
+    in_back = data['date'] > cutoff
+    in_back |= in_back.shift(-1, fill_value=False) & (event_num.shift(-1) == event_num)  # include the point before
+
+    to_quantify = in_back & ~event_num.map(events['dump'])
+    stats = (data.loc[to_quantify, ['co', 'co2', 'ch4']].astype(float)
+             .groupby(event_num[to_quantify])
+             .agg(['mean', 'median', 'std']))  # std is the sample stdev, same as statistics.stdev
+
+    for cpd in ['co', 'co2', 'ch4']:
+        events[cpd + '_mean'] = stats[(cpd, 'mean')]
+        events[cpd + '_median'] = stats[(cpd, 'median')]
+        events[cpd + '_stdev'] = stats[(cpd, 'std')]
+
+    return events, event_num
+
+
+def log_event_quantification(logger, event, duration=None):
     """
     This condenses some repetitive logging behavior. Each time a CalEvent is created, this will log the results to the
     log as DEBUG (not console).
     :param logger: logger object from logging library
     :param event: CalEvent object, with new results
+    :param duration: timedelta, duration of the event if its data isn't loaded
     :return: None, output to log file
     """
-    logger.debug(f'CalEvent for date {event.date}, of duration {event.duration} quantified:')
+    duration = duration if duration is not None else event.duration
+    logger.debug(f'CalEvent for date {event.date}, of duration {duration} quantified:')
     logger.debug('Result Sets Below (Mean, Median, StDev)')
     logger.debug(f'CO: {event.co_result["mean"]:.03f}, CO2: {event.co2_result["mean"]:.03f},' +
                  f' CH4: {event.ch4_result["mean"]:.03f}')
@@ -310,6 +762,7 @@ def log_event_quantification(logger, event):
     return
 
 
+@cached_plot
 def summit_picarro_plot(dates, compound_dict, limits=None, minor_ticks=None, major_ticks=None, unit_string='ppbv'):
     """
     :param dates: list, of Python datetimes; if set, this applies to all compounds.
@@ -336,24 +789,21 @@ def summit_picarro_plot(dates, compound_dict, limits=None, minor_ticks=None, maj
                                 'propane':[None, [.5, 1, 1.5]]})
     """
 
-    import matplotlib.pyplot as plt
     from matplotlib.dates import DateFormatter
     from pandas.plotting import register_matplotlib_converters
     register_matplotlib_converters()
 
-    f1 = plt.figure()
-    ax = f1.gca()
-
+    series = []
     if dates is None:  # dates supplied by individual compounds
         for compound, val_list in compound_dict.items():
             assert val_list[0] is not None, 'A supplied date list was None'
             assert (len(val_list[0]) > 0 and len(val_list[0]) == len(val_list[1])), \
                 'Supplied dates were empty or lengths did not match'
-            ax.plot(val_list[0], val_list[1], '-o')
+            series.append((val_list[0], val_list[1]))
 
     else:
         for compound, val_list in compound_dict.items():
-            ax.plot(dates, val_list[1], '-o')
+            series.append((dates, val_list[1]))
 
     compounds_safe = []
     for k, _ in compound_dict.items():
@@ -362,6 +812,10 @@ def summit_picarro_plot(dates, compound_dict, limits=None, minor_ticks=None, maj
 
     comp_list = ', '.join(compound_dict.keys())  # use real names for plot title
     fn_list = '_'.join(compounds_safe).replace(' ', '_')  # use 'safe' names for filename
+    plot_name = f'{fn_list}_last_week.png'
+
+    f1, ax = reuse_figure(('summit_picarro_plot', plot_name))
+    draw_lines(ax, series)
 
     if limits is not None:
         ax.set_xlim(right=limits.get('right'))
@@ -388,9 +842,7 @@ def summit_picarro_plot(dates, compound_dict, limits=None, minor_ticks=None, maj
 
     f1.subplots_adjust(bottom=.20)
 
-    plot_name = f'{fn_list}_last_week.png'
     f1.savefig(plot_name, dpi=150)
-    plt.close(f1)
 
     return plot_name
 
@@ -402,22 +854,30 @@ def match_cals_by_min(cal, cals, minutes=4):
     :param minutes: int, minutes difference to tolerate ## MAY CHANGE TO upper/lower limits
     :return: cal from the list cals, or None
     """
-    from summit_core import find_closest_date, search_for_attr_value
+    return match_cals([cal], cals, minutes=minutes)[0]
 
-    cal_dates = [c.date for c in cals]
 
-    if not cal_dates:
-        return None
+def match_cals(to_match, cals, minutes=4):
+    """
+    Match many CalEvents to their closest CalEvent in cals at once, see match_cals_by_min().
+
+    :param to_match: list, of CalEvents (or None) to find matches for
+    :param cals: list, of CalEvents
+    :param minutes: int, minutes difference to tolerate
+    :return: list, parallel to to_match, of the matching cal from cals, or None
+    """
+    from summit_core import match_dates
 
-    [match, diff] = find_closest_date(cal.date, cal_dates)
+    matched = [None] * len(to_match)
 
-    if not match or not diff:
-        return None
+    candidates = [(ind, c) for ind, c in enumerate(to_match) if c is not None]
+    matches = match_dates([c.date for _, c in candidates], [c.date for c in cals],
+                          tolerance=dt.timedelta(minutes=minutes), exact=False)  # don't match a cal to itself
 
-    if abs(diff) < dt.timedelta(minutes=minutes):
-        return search_for_attr_value(cals, 'date', match)  # return the matching cal if within tolerance
-    else:
-        return None
+    for cand_ind, cal_ind in matches:
+        matched[candidates[cand_ind][0]] = cals[cal_ind]  # the matching cal if within tolerance
+
+    return matched
 
 
 def calc_two_pt_curve(low, high):
@@ -441,20 +901,59 @@ def filter_postcal_data(cal, session):
     :param cal: CalEvent
     :return: None
     """
-    last_cal_date = cal.data[-1].date
-    end_flush_date = last_cal_date + dt.timedelta(minutes=1)
-    flush_data = (session.query(Datum)
-                  .filter(Datum.date > last_cal_date, Datum.date <= end_flush_date)
-                  .all())
-
-    for data in flush_data:
-        data.instrument_status = 999  # set to anything but 963 and it will be filtered
-        session.merge(data)
+    filter_postcal_events([cal], session.connection())
     session.commit()
 
     return
 
 
+def filter_postcal_events(cals, conn, flush_period=60):
+    """
+    Filter the ambient data for one minute after the end of many calibration events at once, to allow for the sampling
+    line to flush all the standard out. Every flush window is recorded in the flush_windows table, and a window is only
+    flagged again if the data after it hadn't all arrived the last time, so re-running this is cheap and won't touch
+    already filtered data.
+
+    Nothing is committed, so this can be part of a larger transaction.
+
+    :param cals: list, of CalEvents that have been flushed or committed so they have ids
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param flush_period: int, seconds after each event to filter
+    :return: list, of (start, end) for each window that was flagged
+    """
+    from sqlalchemy import bindparam, func, select
+    from sqlalchemy.dialects.sqlite import insert
+
+    data = Datum.__table__
+    windows = FlushWindow.__table__
+
+    if cals:
+        conn.execute(insert(windows).on_conflict_do_nothing(index_elements=['start']),
+                     [{'start': cal.date, 'end': cal.date + dt.timedelta(seconds=flush_period),
+                       'cal_id': cal.id, 'complete': False} for cal in cals])
+
+    to_flag = conn.execute(select(windows.c.start, windows.c.end).where(windows.c.complete == False)).fetchall()
+
+    if not to_flag:
+        return []
+
+    conn.execute(data.update()
+                 .where(data.c.date > bindparam('flush_start'))
+                 .where(data.c.date <= bindparam('flush_end'))
+                 .values(instrument_status=999),  # set to anything but 963 and it will be filtered
+                 [{'flush_start': w.start, 'flush_end': w.end} for w in to_flag])
+
+    last_date = conn.execute(select(func.max(data.c.date))).scalar()
+
+    # windows with data after them are complete; the rest are flagged again as data arrives
+    conn.execute(windows.update()
+                 .where(windows.c.complete == False)
+                 .where(windows.c.end < last_date)
+                 .values(complete=True))
+
+    return to_flag
+
+
 def mastercal_plot(cpd, low_coord, mid_coord, high_coord, curve, middle_y_offset, date):
     """
     This function creates a plot for each master calibration event that displays a line between the low and high
@@ -0,0 +1,96 @@
+"""
+Tests that Picarro data survives being archived: archived months are read back by get_data(), rows of archived months
+that are read again from old .dat files aren't inserted again, and the archived version of a row (with its cal_id and
+flush flag) is kept over any copy of it that reaches the database.
+"""
+import calendar
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from summit_picarro import Base, Datum, column_to_instance_names, insert_data, archive_months, archive_path
+from summit_picarro import read_archive, get_data
+
+
+def dat_rows(dates, ch4=1900.):
+    """
+    :param dates: list, of datetimes
+    :param ch4: float, methane for every row
+    :return: DataFrame, as read from a .dat file
+    """
+    df = pd.DataFrame({column: 0. for column in column_to_instance_names.values()}, index=range(len(dates)))
+    df['INST_STATUS'] = 963
+    df['CH4_dry_sync'] = ch4
+    df['EPOCH_TIME'] = [calendar.timegm(date.timetuple()) for date in dates]
+    return df
+
+
+def flag(conn, date):
+    """Give a row a cal_id and the 999 flush flag, as find_cal_events() and filter_postcal_events() do."""
+    data = Datum.__table__
+    conn.execute(data.update().where(data.c.date == date).values(cal_id=1, instrument_status=999))
+
+
+def test_archived_rows_are_kept(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "summit_picarro.sqlite"}')
+    Base.metadata.create_all(engine)
+    archive_dir = tmp_path / 'archive'
+
+    january = [datetime(2019, 1, 31, 23, 59, s) for s in range(0, 50, 5)]
+    february = [datetime(2019, 2, 1, 0, 0, s) for s in range(0, 50, 5)]
+
+    with engine.begin() as conn:
+        assert insert_data(dat_rows(january + february), conn, archive_dir=archive_dir) == 20
+        flag(conn, january[0])
+
+        assert archive_months(conn, datetime(2019, 2, 1), archive_dir) == [archive_path(january[0], archive_dir)]
+
+    with engine.begin() as conn:
+        in_db = {row.date for row in conn.execute(Datum.__table__.select())}
+        assert in_db == set(february)
+
+        # an old file read again from the start, with one row that was never loaded
+        new_row = datetime(2019, 1, 31, 23, 59, 55)
+        assert insert_data(dat_rows(january + [new_row], ch4=0.), conn, archive_dir=archive_dir) == 1
+
+        data = get_data(conn, archive_dir=archive_dir)
+        assert list(data['date']) == sorted(january + [new_row] + february)
+
+        flagged = data[data['date'] == january[0]].iloc[0]
+        assert flagged['cal_id'] == 1 and flagged['instrument_status'] == 999
+        assert (data.loc[data['date'].isin(january), 'ch4'] == 1900.).all()
+
+        archive_months(conn, datetime(2019, 2, 1), archive_dir)
+
+    archived = read_archive(archive_path(january[0], archive_dir))
+    assert list(pd.to_datetime(archived['date'])) == january + [new_row]
+
+    flagged = archived[pd.to_datetime(archived['date']) == january[0]].iloc[0]
+    assert flagged['cal_id'] == 1 and flagged['instrument_status'] == 999
+
+
+def test_archived_version_wins_in_merges(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "summit_picarro.sqlite"}')
+    Base.metadata.create_all(engine)
+    archive_dir = tmp_path / 'archive'
+
+    date = datetime(2019, 1, 15)
+
+    with engine.begin() as conn:
+        insert_data(dat_rows([date]), conn, archive_dir=archive_dir)
+        flag(conn, date)
+        archive_months(conn, datetime(2019, 2, 1), archive_dir)
+
+        # a copy of the row that reached the database without going through insert_data()
+        conn.execute(Datum.__table__.insert().values(date=date, instrument_status=963, ch4=0.))
+
+        data = get_data(conn, archive_dir=archive_dir)
+        assert len(data) == 1
+        assert data['cal_id'].iloc[0] == 1 and data['instrument_status'].iloc[0] == 999
+
+        archive_months(conn, datetime(2019, 2, 1), archive_dir)
+
+    archived = read_archive(archive_path(date, archive_dir))
+    assert len(archived) == 1
+    assert archived['cal_id'].iloc[0] == 1 and archived['instrument_status'].iloc[0] == 999
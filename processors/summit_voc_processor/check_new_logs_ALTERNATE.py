@@ -137,8 +137,6 @@ if recentDate > logcheck_config.last_data_date:
 core_session.merge(logcheck_config)
 core_session.commit()
 core_session.close()
-core_engine.dispose()
 session.close()
-engine.dispose()
 
 print(failed)
@@ -6,6 +6,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey
 
+from summit_core import cached_plot, reuse_figure, draw_lines, parse_date
 from summit_errors import send_processor_email
 
 Base = declarative_base()
@@ -127,7 +128,7 @@ def read_daily_line(line):
 
     dailydata = {}
 
-    dailydata['date'] = datetime.strptime(ls[0].split('.')[0], '%y%j%H%M')
+    dailydata['date'] = parse_date(ls[0].split('.')[0], '%y%j%H%M')
     dailydata['ads_xfer_a'] = float(ls[1])
     dailydata['ads_xfer_b'] = float(ls[2])
     dailydata['valves_temp'] = float(ls[3])
@@ -182,6 +183,7 @@ async def check_load_dailies(logger):
 
     try:
         from summit_core import connect_to_db, get_all_data_files, core_dir, daily_logs_path, search_for_attr_value
+        from summit_core import create_schema
     except ImportError as e:
         logger.error(f'ImportError occurred in check_load_dailies()')
         send_processor_email(PROC, exception=e)
@@ -189,7 +191,7 @@ async def check_load_dailies(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_daily.sqlite', core_dir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in check_load_dailies()')
         send_processor_email(PROC, exception=e)
@@ -226,17 +228,16 @@ async def check_load_dailies(logger):
             session.commit()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in check_load_dailies()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
+@cached_plot
 def summit_daily_plot(dates, compound_dict, limits=None, minor_ticks=None, major_ticks=None,
                       y_label_str='Temperature (\xb0C)'):
     """
@@ -263,26 +264,23 @@ def summit_daily_plot(dates, compound_dict, limits=None, minor_ticks=None, major
                                 'propane':[None, [.5, 1, 1.5]]})
     """
 
-    import matplotlib.pyplot as plt
     from matplotlib.dates import DateFormatter
     from pandas.plotting import register_matplotlib_converters
     register_matplotlib_converters()
 
-    f1 = plt.figure()
-    ax = f1.gca()
-
+    series = []
     if dates is None:  # dates supplied by individual compounds
         for compound, val_list in compound_dict.items():
             if val_list[0] and val_list[1]:
                 assert len(val_list[0]) > 0 and len(val_list[0]) == len(
                     val_list[1]), 'Supplied dates were empty or lengths did not match'
-                ax.plot(val_list[0], val_list[1], '-o')
+                series.append((val_list[0], val_list[1]))
             else:
                 pass
 
     else:
         for compound, val_list in compound_dict.items():
-            ax.plot(dates, val_list[1], '-o')
+            series.append((dates, val_list[1]))
 
     compounds_safe = []
     for k, _ in compound_dict.items():
@@ -293,6 +291,10 @@ def summit_daily_plot(dates, compound_dict, limits=None, minor_ticks=None, major
 
     comp_list = ', '.join(compound_dict.keys())  # use real names for plot title
     fn_list = '_'.join(compounds_safe)  # use 'safe' names for filename
+    plot_name = f'{fn_list}.png'
+
+    f1, ax = reuse_figure(('summit_daily_plot', plot_name))
+    draw_lines(ax, series)
 
     if limits is not None:
         ax.set_xlim(right=limits.get('right'))
@@ -319,9 +321,7 @@ def summit_daily_plot(dates, compound_dict, limits=None, minor_ticks=None, major
 
     f1.subplots_adjust(bottom=.20)
 
-    plot_name = f'{fn_list}.png'
     f1.savefig(plot_name, dpi=150)
-    plt.close(f1)
 
     return plot_name
 
@@ -338,7 +338,8 @@ async def plot_dailies(logger):
     try:
         from pathlib import Path
         import datetime as dt
-        from summit_core import connect_to_db, core_dir, TempDir, Config, Plot, add_or_ignore_plot, create_daily_ticks
+        from summit_core import connect_to_db, core_dir, Config, Plot, add_or_ignore_plot, create_daily_ticks
+        from summit_core import create_schema, PlotSpec, render_plots
         plotdir = core_dir / 'plots/daily'
         remotedir = r'/data/web/htdocs/instaar/groups/arl/summit/protected/plots'
 
@@ -354,7 +355,7 @@ async def plot_dailies(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_daily.sqlite', core_dir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in plot_dailies()')
         send_processor_email(PROC, exception=e)
@@ -362,8 +363,8 @@ async def plot_dailies(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Plot.__table__.create(core_engine, checkfirst=True)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Plot)
+        create_schema(core_engine, Config)
 
         daily_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
 
@@ -393,103 +394,96 @@ async def plot_dailies(logger):
         for param in daily_parameters:
             dailydict[param] = [getattr(d, param) for d in dailies]
 
-        with TempDir(plotdir):  ## PLOT i-butane, n-butane, acetylene
-
-            name = summit_daily_plot(dailydict.get('date'), ({'Ads Xfer A': [None, dailydict.get('ads_xfer_a')],
-                                                              'Ads Xfer B': [None, dailydict.get('ads_xfer_b')],
-                                                              'Valves Temp': [None, dailydict.get('valves_temp')],
-                                                              'GC Xfer Temp': [None, dailydict.get('gc_xfer_temp')],
-                                                              'Catalyst': [None, dailydict.get('catalyst')]}),
-                                     limits={'right': date_limits.get('right', None),
-                                             'left': date_limits.get('left', None),
-                                             'bottom': 0,
-                                             'top': 475},
-                                     major_ticks=major_ticks,
-                                     minor_ticks=minor_ticks)
-
-            hot_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(hot_plot, core_session)
-
-            name = summit_daily_plot(dailydict.get('date'), ({'CJ1 Temp': [None, dailydict.get('cj1')],
-                                                              'CJ2 Temp': [None, dailydict.get('cj2')],
-                                                              'Standard Temp': [None, dailydict.get('std_temp')]}),
-                                     limits={'right': date_limits.get('right', None),
-                                             'left': date_limits.get('left', None),
-                                             'bottom': 10,
-                                             'top': 50},
-                                     major_ticks=major_ticks,
-                                     minor_ticks=minor_ticks)
-
-            room_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(room_plot, core_session)
-
-            name = summit_daily_plot(dailydict.get('date'), ({'H2 Gen Pressure': [None, dailydict.get('h2_gen_p')],
-                                                              'Line Pressure': [None, dailydict.get('line_p')],
-                                                              'Zero Pressure': [None, dailydict.get('zero_p')],
-                                                              'FID Pressure': [None, dailydict.get('fid_p')]}),
-                                     limits={'right': date_limits.get('right', None),
-                                             'left': date_limits.get('left', None),
-                                             'bottom': 0,
-                                             'top': 75},
-                                     y_label_str='Pressure (PSI)',
-                                     major_ticks=major_ticks,
-                                     minor_ticks=minor_ticks)
-
-            pressure_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(pressure_plot, core_session)
-
-            name = summit_daily_plot(dailydict.get('date'),
-                                     ({'Inlet Short Temp': [None, dailydict.get('inlet_short')]}),
-                                     limits={'right': date_limits.get('right', None),
-                                             'left': date_limits.get('left', None),
-                                             'bottom': 0,
-                                             'top': 60},
-                                     major_ticks=major_ticks,
-                                     minor_ticks=minor_ticks)
-
-            inlet_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(inlet_plot, core_session)
-
-            name = summit_daily_plot(dailydict.get('date'), ({'5Va': [None, dailydict.get('v5a')]}),
-                                     limits={'right': date_limits.get('right', None),
-                                             'left': date_limits.get('left', None),
-                                             'bottom': 0,
-                                             'top': 30},
-                                     y_label_str='Voltage (v)',
-                                     major_ticks=major_ticks,
-                                     minor_ticks=minor_ticks)
-
-            voltage_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(voltage_plot, core_session)
-
-            name = summit_daily_plot(dailydict.get('date'), ({'MFC1': [None, dailydict.get('mfc1')],
-                                                              'MFC2': [None, dailydict.get('mfc2')],
-                                                              'MFC3a': [None, dailydict.get('mfc3a')],
-                                                              'MFC3b': [None, dailydict.get('mfc3b')],
-                                                              'MFC4': [None, dailydict.get('mfc4')],
-                                                              'MFC5': [None, dailydict.get('mfc5')]}),
-                                     limits={'right': date_limits.get('right', None),
-                                             'left': date_limits.get('left', None),
-                                             'bottom': -1,
-                                             'top': 3.5},
-                                     y_label_str='Flow (MFC V)',
-                                     major_ticks=major_ticks,
-                                     minor_ticks=minor_ticks)
-
-            flow_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(flow_plot, core_session)
+        plots = []
+
+        plots.append(PlotSpec(summit_daily_plot, plotdir,
+                              (dailydict.get('date'),
+                               {'Ads Xfer A': [None, dailydict.get('ads_xfer_a')],
+                                'Ads Xfer B': [None, dailydict.get('ads_xfer_b')],
+                                'Valves Temp': [None, dailydict.get('valves_temp')],
+                                'GC Xfer Temp': [None, dailydict.get('gc_xfer_temp')],
+                                'Catalyst': [None, dailydict.get('catalyst')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 475},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_daily_plot, plotdir,
+                              (dailydict.get('date'),
+                               {'CJ1 Temp': [None, dailydict.get('cj1')],
+                                'CJ2 Temp': [None, dailydict.get('cj2')],
+                                'Standard Temp': [None, dailydict.get('std_temp')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 10,
+                                           'top': 50},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_daily_plot, plotdir,
+                              (dailydict.get('date'),
+                               {'H2 Gen Pressure': [None, dailydict.get('h2_gen_p')],
+                                'Line Pressure': [None, dailydict.get('line_p')],
+                                'Zero Pressure': [None, dailydict.get('zero_p')],
+                                'FID Pressure': [None, dailydict.get('fid_p')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 75},
+                                   y_label_str='Pressure (PSI)',
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_daily_plot, plotdir,
+                              (dailydict.get('date'),
+                               {'Inlet Short Temp': [None, dailydict.get('inlet_short')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 60},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_daily_plot, plotdir,
+                              (dailydict.get('date'),
+                               {'5Va': [None, dailydict.get('v5a')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 30},
+                                   y_label_str='Voltage (v)',
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_daily_plot, plotdir,
+                              (dailydict.get('date'),
+                               {'MFC1': [None, dailydict.get('mfc1')],
+                                'MFC2': [None, dailydict.get('mfc2')],
+                                'MFC3a': [None, dailydict.get('mfc3a')],
+                                'MFC3b': [None, dailydict.get('mfc3b')],
+                                'MFC4': [None, dailydict.get('mfc4')],
+                                'MFC5': [None, dailydict.get('mfc5')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': -1,
+                                           'top': 3.5},
+                                   y_label_str='Flow (MFC V)',
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        for path in await render_plots(plots):
+            add_or_ignore_plot(Plot(path, remotedir, True), core_session)
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_dailies()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
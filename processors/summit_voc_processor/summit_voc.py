@@ -1,14 +1,14 @@
 import logging
 import datetime as dt
-from datetime import datetime
+from pathlib import Path
 
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
-from summit_core import JDict
+from summit_core import JDict, cached_plot, reuse_figure, draw_lines, parse_date
 
 Base = declarative_base()  # needed to subclass for sqlalchemy objects
 
@@ -25,6 +25,76 @@ log_params_list = (['filename', 'sampletime', 'sampleflow1', 'sampleflow2',
                     'WTA_hottemp', 'WTB_hottemp', 'GCHeadP1', 'GCoventemp'])
 # does not include date on purpose because it's handled in GcRun
 
+
+def to_int(value):
+    """LabView writes integers as floats, ie '4.000000'"""
+    return int(float(value))
+
+
+def log_file_date(value):
+    return parse_date(value, '%Y%j%H%M%S')
+
+
+log_file_line_count = 36  # LabView log files with any other number of lines are incomplete or malformed
+
+log_file_layout = {
+    'date': (15, 0, log_file_date),  # field: (line, tab-separated column, cast) in a LabView log file
+    'sampletime': (0, 1, float),
+    'sampleflow1': (1, 1, float),
+    'sampletype': (2, 1, to_int),
+    'backflushtime': (3, 1, float),
+    'desorbtemp': (4, 1, float),
+    'flashheattime': (5, 1, float),
+    'injecttime': (6, 1, float),
+    'bakeouttemp': (7, 1, float),
+    'bakeouttime': (8, 1, float),
+    'carrierflow': (9, 1, float),
+    'samplenum': (10, 1, to_int),
+    'WTinuse': (11, 1, to_int),
+    'adsTinuse': (12, 1, to_int),
+    'samplepressure1': (13, 1, float),
+    'GCHeadP': (14, 1, float),
+    'samplecode': (15, 0, to_int),
+    'chamber_temp_start': (16, 1, float),
+    'WTA_temp_start': (17, 1, float),
+    'WTB_temp_start': (18, 1, float),
+    'adsA_temp_start': (19, 1, float),
+    'adsB_temp_start': (20, 1, float),
+    'samplepressure2': (21, 1, float),
+    'sampleflow2': (22, 1, float),
+    'chamber_temp_end': (23, 1, float),
+    'WTA_temp_end': (24, 1, float),
+    'WTB_temp_end': (25, 1, float),
+    'adsA_temp_end': (26, 1, float),
+    'adsB_temp_end': (27, 1, float),
+    'traptempFH': (28, 1, float),
+    'GCstarttemp': (29, 1, float),
+    'traptempinject_end': (30, 1, float),
+    'traptempbakeout_end': (31, 1, float),
+    'WTA_hottemp': (32, 1, float),
+    'WTB_hottemp': (33, 1, float),
+    'GCHeadP1': (34, 1, float),
+    'GCoventemp': (35, 1, float),
+}
+
+
+def compile_log_layout(layout):
+    """
+    Group a log file layout by line, so each line is only split once when parsing.
+    :param layout: dict, of {field: (line, column, cast)}
+    :return: tuple, of (line, ((column, field, cast), ...)) for each line with a field, in line order
+    """
+    lines = {}
+    for field, (line, column, cast) in layout.items():
+        lines.setdefault(line, []).append((column, field, cast))
+
+    return tuple((line, tuple(fields)) for line, fields in sorted(lines.items()))
+
+
+compiled_log_layout = compile_log_layout(log_file_layout)
+compiled_log_batch_layout = compile_log_layout(dict(log_file_layout, date=(15, 0, str.strip)))  # dates as text,
+# for read_log_files() to parse the whole column at once
+
 log_parameter_bounds = ({'samplepressure1': (1.5, 2.65),
                          'samplepressure2': (6.5, 10),
                          'GCHeadP': (5, 7.75),
@@ -107,6 +177,8 @@ compound_windows_2 = (
      'benzene': (19.3, 19.7),
      'toluene': (22.55, 22.95)})
 
+relative_compounds = ['4b', 'acetylene', 'n-butane']  # named by RT difference from i-butane, in this order
+
 
 class CompoundWindow(Base):
     """
@@ -121,11 +193,41 @@ class CompoundWindow(Base):
     date_start = Column(DateTime)
     date_end = Column(DateTime)
     compounds = Column(MutableDict.as_mutable(JDict))
+    # the compounds and dates that lines were last named with, see reidentify_peaks()
+    # null for windows added before these were kept, whose lines were named with them when loaded
+    applied_compounds = Column(JDict)
+    applied_start = Column(DateTime)
+    applied_end = Column(DateTime)
 
     def __init__(self, date_start, date_end, compounds):
         self.date_start = date_start
         self.date_end = date_end
         self.compounds = compounds
+        self.applied_compounds = {}  # not applied to any lines yet
+        self.applied_start = None
+        self.applied_end = None
+
+    @property
+    def is_applied(self):
+        """
+        :return: boolean, True if lines were last named with the window's current compounds and dates
+        """
+        return (self.applied_compounds == self.compounds
+                and self.applied_start == self.date_start
+                and self.applied_end == self.date_end)
+
+    def mark_applied(self, compounds=None, date_start=None, date_end=None):
+        """
+        Record the compounds and dates that lines were named with, defaulting to the window's current ones.
+
+        :param compounds: dict, the compounds lines were named with
+        :param date_start: datetime, the start of the window lines were named with
+        :param date_end: datetime, the end of the window lines were named with
+        :return: None
+        """
+        self.applied_compounds = dict(compounds if compounds is not None else self.compounds)
+        self.applied_start = date_start if date_start is not None else self.date_start
+        self.applied_end = date_end if date_end is not None else self.date_end
 
 
 class Crf(Base):
@@ -282,6 +384,7 @@ class LogFile(Base):
     """
 
     __tablename__ = 'logfiles'
+    __table_args__ = (Index('ix_logfiles_filename', 'filename', unique=True),)
 
     id = Column(Integer, primary_key=True)
     filename = Column(String)
@@ -539,9 +642,117 @@ class Datum(Base):
             return None  # don't integrate if it's not an ambient or blank sample
 
 
+def integrate_peaks(conn, run_ids, chunk_size=500):
+    """
+    Calculate mixing ratios for every named peak of many GcRuns at once. This is the same calculation as
+    GcRun.integrate() and Datum.reintegrate(), but the peak areas, sample times and flows, and CRFs are pulled for all
+    runs in one joined query, calculated as arrays, and written back in one executemany() UPDATE, rather than loading
+    each peak, run and log through the ORM.
+
+    Only ambient and zero runs with a CRF are integrated. Nothing is committed, and any pending ORM changes to peaks
+    should be flushed first.
+
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param run_ids: list, of GcRun ids to integrate
+    :param chunk_size: int, number of runs per query, since SQLite can't take in clauses with > 1000 variables
+    :return: int, number of peaks that were given a mixing ratio
+    """
+    import numpy as np
+    import pandas as pd
+    from sqlalchemy import select, bindparam
+    from summit_core import split_into_sets_of_n
+
+    peaks = Peak.__table__
+    runs = GcRun.__table__
+    logs = LogFile.__table__
+
+    peak_data = []
+    for run_set in split_into_sets_of_n(list(run_ids), chunk_size):
+        peak_data.extend(conn.execute(
+            select(peaks.c.id, peaks.c.name, peaks.c.pa, runs.c.crf_id, logs.c.sampletime, logs.c.sampleflow1)
+            .select_from(peaks.join(runs, peaks.c.run_id == runs.c.id).join(logs, runs.c.logfile_id == logs.c.id))
+            .where(runs.c.id.in_(run_set))
+            .where(runs.c.type.in_(['ambient', 'zero']))
+            .where(runs.c.crf_id != None)
+            .where(peaks.c.name.in_(compound_list))).fetchall())
+
+    if not peak_data:
+        return 0
+
+    df = pd.DataFrame(peak_data, columns=['id', 'name', 'pa', 'crf_id', 'sampletime', 'sampleflow1'])
+
+    crf_ids = [int(i) for i in df['crf_id'].unique()]
+    crf_values = pd.DataFrame([(crf.id, name, value)
+                               for crf in conn.execute(select(Crf.__table__).where(Crf.__table__.c.id.in_(crf_ids)))
+                               for name, value in crf.compounds.items()],
+                              columns=['crf_id', 'name', 'crf'])
+
+    df = df.merge(crf_values, on=['crf_id', 'name'])  # only peaks with a crf for their compound
+    df['ecn'] = df['name'].map(compound_ecns)
+    df = df[df['ecn'].notna()]
+
+    # formula is (pa / (CRF * ECN * SampleTime * SampleFlow1)) * 1000 *1.5
+    # 1000 * 1.5 normalizes to a sample volume of 2000s by convention
+    mrs = (df['pa'].astype(float) / (df['crf'].astype(float) * df['ecn'] * df['sampletime'].astype(float)
+                                     * df['sampleflow1'].astype(float))) * 1000 * 1.5
+
+    mrs = [None if np.isnan(mr) or np.isinf(mr) else float(mr) for mr in mrs]  # no pa, no mixing ratio
+
+    if mrs:
+        conn.execute(peaks.update().where(peaks.c.id == bindparam('peak_id')).values(mr=bindparam('peak_mr')),
+                     [{'peak_id': int(peak_id), 'peak_mr': mr} for peak_id, mr in zip(df['id'], mrs)])
+
+    return len(mrs)
+
+
+def roll_up_peaks(conn, date_start=None, date_end=None):
+    """
+    Update the hourly and daily Rollups of the mixing ratios of every compound in ambient runs, for every day between
+    two dates. Nothing is committed, and any pending ORM changes to runs or peaks should be flushed first.
+
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param date_start: datetime, earliest run date that changed, or None to start at the oldest run
+    :param date_end: datetime, latest run date that changed, or None to end at the newest run
+    :return: int, number of Rollups written
+    """
+    import pandas as pd
+    from sqlalchemy import select, func
+    from summit_core import rollup_bounds, update_rollups
+
+    peaks = Peak.__table__
+    runs = GcRun.__table__
+
+    if date_start is None or date_end is None:
+        oldest, newest = conn.execute(select(func.min(runs.c.date), func.max(runs.c.date))).first()
+
+        if oldest is None:
+            return 0
+
+        date_start = date_start or oldest
+        date_end = date_end or newest
+
+    start, end = rollup_bounds(date_start, date_end)
+
+    peak_data = conn.execute(select(runs.c.date, peaks.c.name, peaks.c.mr)
+                             .select_from(peaks.join(runs, peaks.c.run_id == runs.c.id))
+                             .where(runs.c.type == 'ambient')
+                             .where(runs.c.date >= start)
+                             .where(runs.c.date < end)
+                             .where(peaks.c.name.in_(compound_list))
+                             .where(peaks.c.mr != None)).fetchall()
+
+    data = pd.DataFrame(peak_data, columns=['date', 'name', 'mr'])
+    data = (data.pivot_table(index='date', columns='name', values='mr', aggfunc='median')
+            .reindex(columns=compound_list)  # compounds with no data in the range have their Rollups removed
+            .reset_index())
+
+    return update_rollups(conn, data, start, end, periods=['hourly', 'daily'])
+
+
 def find_crf(crfs, sample_date):
     """
-    Returns the carbon response factor object for a sample at the given sample_date
+    Returns the carbon response factor object for a sample at the given sample_date. To find Crfs for many samples,
+    build a summit_core.IntervalIndex from the crfs instead.
     :param crfs: list, of Crf objects
     :param sample_date: datetime, datetime of sample to be matched to a CRF
     :return: Crf object
@@ -566,9 +777,9 @@ def read_crf_data(filename):
 
     for line in lines[1:]:
         ls = line.split('\t')
-        date_start = datetime.strptime(ls[0], '%m/%d/%Y %H:%M')
-        date_end = datetime.strptime(ls[1], '%m/%d/%Y %H:%M')
-        date_revision = datetime.strptime(ls[2], '%m/%d/%Y %H:%M')
+        date_start = parse_date(ls[0], '%m/%d/%Y %H:%M')
+        date_end = parse_date(ls[1], '%m/%d/%Y %H:%M')
+        date_revision = parse_date(ls[2], '%m/%d/%Y %H:%M')
 
         for index, (key, rf) in enumerate(zip(keys, ls[3:])):
             key = key.strip().lower()
@@ -581,6 +792,41 @@ def read_crf_data(filename):
     return Crfs
 
 
+def parse_log_file(path, layout=compiled_log_layout):
+    """
+    Parse a Summit LabView file into a dictionary of LogFile values, using compiled_log_layout by default.
+    :param path: Path or string, file to be read
+    :param layout: tuple, compiled by compile_log_layout()
+    :return: tuple, (dict of values, None) or (None, string reason it couldn't be parsed)
+    """
+    with open(path) as file:
+        contents = file.readlines()
+
+    if len(contents) != log_file_line_count:
+        return None, 'had an improper number of lines'
+
+    values = {'filename': Path(path).name}
+
+    try:
+        for line, fields in layout:
+            columns = contents[line].split('\t')
+            for column, field, cast in fields:
+                values[field] = cast(columns[column])
+    except (ValueError, IndexError) as e:
+        return None, f'failed to be processed with {e.args}'
+
+    return values, None
+
+
+def parse_log_files(paths):
+    """
+    Parse a chunk of LabView files in one call, for read_log_files().
+    :param paths: list, of Paths or strings
+    :return: list, of (filename, values, reason) tuples from parse_log_file()
+    """
+    return [(Path(path).name,) + parse_log_file(path, compiled_log_batch_layout) for path in paths]
+
+
 def read_log_file(filename):
     """
     Processes Summit LabView files into a dictionary that's unpacked into a LogFile object
@@ -589,60 +835,79 @@ def read_log_file(filename):
     """
     logger = logging.getLogger(__name__)
 
-    with open(filename) as file:
-        contents = file.readlines()
+    values, reason = parse_log_file(filename)
 
-        log_dict = dict()
+    if values is None:
+        logger.warning(f'File {Path(filename).name} {reason} and was ignored.')
+        return None
 
-        try:
-            if len(contents) == 36:
-                log_dict['filename'] = file.name
-                log_dict['date'] = datetime.strptime(contents[15].split('\t')[0], '%Y%j%H%M%S')
-                log_dict['sampletime'] = float(contents[0].split('\t')[1])
-                log_dict['sampleflow1'] = float(contents[1].split('\t')[1])
-                log_dict['sampleflow2'] = float(contents[22].split('\t')[1])
-                log_dict['sampletype'] = int(float(contents[2].split('\t')[1]))
-                log_dict['backflushtime'] = float(contents[3].split('\t')[1])
-                log_dict['desorbtemp'] = float(contents[4].split('\t')[1])
-                log_dict['flashheattime'] = float(contents[5].split('\t')[1])
-                log_dict['injecttime'] = float(contents[6].split('\t')[1])
-                log_dict['bakeouttemp'] = float(contents[7].split('\t')[1])
-                log_dict['bakeouttime'] = float(contents[8].split('\t')[1])
-                log_dict['carrierflow'] = float(contents[9].split('\t')[1])
-                log_dict['samplenum'] = int(float(contents[10].split('\t')[1]))
-                log_dict['WTinuse'] = int(float(contents[11].split('\t')[1]))
-                log_dict['adsTinuse'] = int(float(contents[12].split('\t')[1]))
-                log_dict['samplepressure1'] = float(contents[13].split('\t')[1])
-                log_dict['samplepressure2'] = float(contents[21].split('\t')[1])
-                log_dict['GCHeadP'] = float(contents[14].split('\t')[1])
-                log_dict['chamber_temp_start'] = float(contents[16].split('\t')[1])
-                log_dict['WTA_temp_start'] = float(contents[17].split('\t')[1])
-                log_dict['WTB_temp_start'] = float(contents[18].split('\t')[1])
-                log_dict['adsA_temp_start'] = float(contents[19].split('\t')[1])
-                log_dict['adsB_temp_start'] = float(contents[20].split('\t')[1])
-                log_dict['samplecode'] = int(float(contents[15].split('\t')[0]))
-                log_dict['chamber_temp_end'] = float(contents[23].split('\t')[1])
-                log_dict['WTA_temp_end'] = float(contents[24].split('\t')[1])
-                log_dict['WTB_temp_end'] = float(contents[25].split('\t')[1])
-                log_dict['adsA_temp_end'] = float(contents[26].split('\t')[1])
-                log_dict['adsB_temp_end'] = float(contents[27].split('\t')[1])
-                log_dict['traptempFH'] = float(contents[28].split('\t')[1])
-                log_dict['GCstarttemp'] = float(contents[29].split('\t')[1])
-                log_dict['traptempinject_end'] = float(contents[30].split('\t')[1])
-                log_dict['traptempbakeout_end'] = float(contents[31].split('\t')[1])
-                log_dict['WTA_hottemp'] = float(contents[32].split('\t')[1])
-                log_dict['WTB_hottemp'] = float(contents[33].split('\t')[1])
-                log_dict['GCHeadP1'] = float(contents[34].split('\t')[1])
-                log_dict['GCoventemp'] = float(contents[35].split('\t')[1])
-
-                return LogFile(log_dict)
+    return LogFile(values)
 
-            else:
-                logger.warning(f'File {file.name} had an improper number of lines and was ignored.')
-                return None
-        except:
-            logger.warning(f'File {file.name} failed to be processed and was ignored.')
-            return None
+
+def read_log_files(paths, chunk_size=250, max_workers=None):
+    """
+    Processes many Summit LabView files into one columnar batch of LogFile values, for insert_log_files(). Backfills of
+    more than one chunk are parsed in a pool of processes. Files that can't be parsed are logged and left out.
+    :param paths: list, of Paths or strings to read
+    :param chunk_size: int, number of files parsed per process at a time
+    :param max_workers: int, number of processes to parse in, defaults to the number of CPUs
+    :return: dict, of {field: list of values}, for 'filename' and every field of log_file_layout
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from summit_core import split_into_sets_of_n, parse_dates
+
+    logger = logging.getLogger(__name__)
+
+    chunks = list(split_into_sets_of_n(list(paths), chunk_size))
+
+    if len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = [result for chunk in executor.map(parse_log_files, chunks) for result in chunk]
+    else:
+        parsed = [result for chunk in chunks for result in parse_log_files(chunk)]
+
+    batch = {field: [] for field in ['filename'] + list(log_file_layout)}
+
+    for name, values, reason in parsed:
+        if values is None:
+            logger.warning(f'File {name} {reason} and was ignored.')
+            continue
+
+        for field, column in batch.items():
+            column.append(values[field])
+
+    dates = parse_dates(batch['date'], '%Y%j%H%M%S', errors='coerce').tolist()
+
+    if None in dates:
+        keep = [date is not None for date in dates]
+
+        for name, kept in zip(batch['filename'], keep):
+            if not kept:
+                logger.warning(f'File {name} had an unreadable date and was ignored.')
+
+        batch = {field: [value for value, kept in zip(column, keep) if kept] for field, column in batch.items()}
+        dates = [date for date in dates if date is not None]
+
+    batch['date'] = dates
+
+    return batch
+
+
+def insert_log_files(conn, batch):
+    """
+    Insert a columnar batch of LogFile values from read_log_files() with one executemany() INSERT, rather than
+    creating and merging a LogFile object for each. Files with the same filename or date as a LogFile already in the
+    database are skipped. Nothing is committed.
+    :param conn: sqlalchemy Connection, ie session.connection()
+    :param batch: dict, of {field: list of values}
+    :return: int, number of LogFiles inserted
+    """
+    rows = [dict(zip(batch, values), status='single') for values in zip(*batch.values())]  # all logs begin unmatched
+
+    if not rows:
+        return 0
+
+    return conn.execute(LogFile.__table__.insert().prefix_with('OR IGNORE'), rows).rowcount
 
 
 def read_pa_line(line):
@@ -656,7 +921,7 @@ def read_pa_line(line):
     ls = line.split('\t')
     line_peaks = []
 
-    line_date = datetime.strptime(ls[1] + ' ' + ls[2], '%m/%d/%Y %H:%M:%S')
+    line_date = parse_date(ls[1] + ' ' + ls[2], '%m/%d/%Y %H:%M:%S')
 
     for ind, item in enumerate(ls[3:]):
 
@@ -698,29 +963,23 @@ def match_log_to_pa(LogFiles, NmhcLines):
     :return: list, of GcRun objects created by matched LogFile/NmhcLine pairs
     """
 
-    from summit_core import find_closest_date, search_for_attr_value
-
-    runs = []
-    for log in LogFiles:
-        # For each log, attempt to find matching NmhcLine
-        # unpack date attr from all NmhcLines provided
-        nmhc_dates = [line.date for line in NmhcLines]
-
-        [match, diff] = find_closest_date(log.date, nmhc_dates)  # get matching date and it's difference
+    from summit_core import match_dates
 
-        if abs(diff) < dt.timedelta(minutes=40):
-            # Valid matches *usually* have ~35min diffs, but shorter means complications may have occurred.
-            # They should still match if shorter, though.
+    # Valid matches *usually* have ~35min diffs, but shorter means complications may have occurred.
+    # They should still match if shorter, though.
+    matches = match_dates([log.date for log in LogFiles], [line.date for line in NmhcLines],
+                          tolerance=dt.timedelta(minutes=40))
 
-            matched_line = search_for_attr_value(NmhcLines, 'date', match)  # pull matching NmhcLine
+    runs = []
+    for log_ind, line_ind in matches:
+        log = LogFiles[log_ind]
+        matched_line = NmhcLines[line_ind]
 
-            runs.append(GcRun(log, matched_line))
-            log.line_con = matched_line
-            log.peaks = matched_line.peaklist
-            log.status = 'married'
-            matched_line.status = 'married'
-        else:
-            continue
+        runs.append(GcRun(log, matched_line))
+        log.line_con = matched_line
+        log.peaks = matched_line.peaklist
+        log.status = 'married'
+        matched_line.status = 'married'
 
     return runs
 
@@ -800,34 +1059,221 @@ def get_dates_peak_info(session, compound, info, date_start=None, date_end=None)
         return dates, info
 
 
-def reassign_cfs(date_start, date_end):
+def reassign_cfs(date_start, date_end, chunk_size=1000):
     """
-    This looks through Datums for a specific period, reassigns their CRFs from the database,
-    and calls reintegrate_samples() on all the affected datums.
+    This looks through Datums for a specific period, reassigns their CRFs from the database, and reintegrates all the
+    affected datums. This is for correcting what happened on-the-fly at runtime if we didn't update RFs in time, or
+    when the CRF file is revised, without deleting and re-running the whole database.
+
+    Only the run ids and dates of the affected data are loaded, using the unique (indexed) NmhcLine dates. Their CRFs
+    are found with an IntervalIndex, then each chunk of runs is updated and reintegrated with integrate_peaks(), and
+    committed, so any length of period can be reprocessed without loading every object at once.
 
     :param date_start: datetime, the date to start checking from
     :param date_end: datetime, the end date to stop checking
-    :return: None
+    :param chunk_size: int, number of datums to reintegrate and commit at a time
+    :return: int, number of datums that were reintegrated
+    """
+    import time
+    from sqlalchemy import select, bindparam
+    from summit_core import connect_to_db, create_schema, split_into_sets_of_n, IntervalIndex, Rollup
+    from summit_core import voc_dir as rundir
+
+    logger = logging.getLogger(__name__)
+
+    engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
+    create_schema(engine, Base)
+    create_schema(engine, Rollup)
+
+    crf_index = IntervalIndex(session.query(Crf).order_by(Crf.id).all())
+    crf_index.log_qc(logger, 'CRF')
+
+    runs = GcRun.__table__
+    lines = NmhcLine.__table__
+
+    with engine.connect() as conn:
+        affected = conn.execute(
+            select(runs.c.id, runs.c.date.label('run_date'), lines.c.date)
+            .select_from(Datum.__table__
+                         .join(runs, Datum.__table__.c.run_id == runs.c.id)
+                         .join(lines, runs.c.nmhcline_id == lines.c.id))
+            .where(lines.c.date.between(date_start, date_end))
+            .order_by(lines.c.date)).fetchall()
+
+    set_crf = runs.update().where(runs.c.id == bindparam('run_id')).values(crf_id=bindparam('new_crf_id'))
+    clear_mrs = Peak.__table__.update().where(Peak.__table__.c.run_id == bindparam('cleared_run_id')).values(mr=None)
+    # integrate_peaks() skips runs without a CRF and compounds missing from it, so their old mixing ratios are cleared
+
+    logger.info(f'Reassigning CRFs for {len(affected)} data between {date_start} and {date_end}.')
+
+    started = time.time()
+    done = 0
+    for chunk in split_into_sets_of_n(affected, chunk_size):
+        crfs = crf_index.find_all([row.date for row in chunk])
+
+        with engine.begin() as conn:
+            conn.execute(set_crf, [{'run_id': row.id, 'new_crf_id': crf.id if crf else None}
+                                   for row, crf in zip(chunk, crfs)])
+            conn.execute(clear_mrs, [{'cleared_run_id': row.id} for row in chunk])
+            integrate_peaks(conn, [row.id for row in chunk])
+            roll_up_peaks(conn, min(row.run_date for row in chunk), max(row.run_date for row in chunk))
 
-    Outline:
-    This should be a one-off, since running it is for correcting what happened on-the-fly at runtime if we
-    didn't update RFs in time. If the database were deleted and everything were re-run, this wouldn't matter because
-    all the data would be properly related to CRFs that were loaded.
+        missing = len([crf for crf in crfs if crf is None])
+        if missing:
+            logger.warning(f'{missing} data had no CRF, so their mixing ratios were cleared and not reintegrated.')
 
-    Connect to the VOC database and query for all Datums during the period
-        .filter(Datum.date.between(date_start, date_end))
+        done += len(chunk)
+        elapsed = time.time() - started
+        logger.info(f'{done}/{len(affected)} data reintegrated ({done / elapsed if elapsed else 0:.0f} rows/s).')
 
-    Load all CRFs from database that have a start OR end date in the period
+    session.close()
 
-    For each datum, find the matching CRF; see find_crf(crfs, sample_date)
+    return done
 
-    Assign the CRF to that datum, then call the reintegrate() method on each affected datum
 
-    Merge every datum back to the DB and commit
+def rename_peaks_chunk(compounds, lines):
     """
-    pass
+    Name the peaks of a chunk of NmhcLines from scratch, for reidentify_peaks(). Peaks are passed as plain tuples, and
+    named as simple objects, so chunks can be sent to other processes without any database objects.
+
+    :param compounds: dict, the compounds of a CompoundWindow, {name: (low, high)}
+    :param lines: list, of lists of (peak id, rt, pa) tuples, one list per line, in peaklist order
+    :return: dict, of {peak id: name} for every peak
+    """
+    from types import SimpleNamespace
+
+    absolute, relative = compile_rt_windows(SimpleNamespace(compounds=compounds))
+
+    names = {}
+    for peaks in lines:
+        peaklist = [SimpleNamespace(id=peak_id, rt=rt, pa=pa, name='-') for peak_id, rt, pa in peaks]
+        name_peaklist(peaklist, absolute, relative)
+        names.update((peak.id, peak.name) for peak in peaklist)
+
+    return names
+
+
+def reidentify_peaks(window_id, chunk_size=500, max_workers=None):
+    """
+    Re-name the peaks of every NmhcLine a CompoundWindow applies to, after it's been added or its windows have changed,
+    without deleting and re-running the whole database. Lines with applied NmhcCorrections keep their corrected names.
+
+    Lines are named in chunks in a pool of processes, and only peaks whose name changed are written back. Those peaks'
+    runs are then reintegrated with integrate_peaks() and their Rollups updated, and each chunk is committed as it
+    finishes. Chunks are only loaded as processes free up, one per process at a time, so any length of period can be
+    reprocessed without holding all of its peaks in memory.
+
+    :param window_id: int, id of the CompoundWindow to re-identify peaks for
+    :param chunk_size: int, number of lines to name in each process and commit at a time
+    :param max_workers: int, number of processes to name lines in, defaults to the number of CPUs
+    :return: int, number of peaks that were renamed
+    """
+    import os
+    import time
+    from itertools import islice
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from sqlalchemy import select, bindparam, or_
+    from summit_core import connect_to_db, create_schema, split_into_sets_of_n, IntervalIndex, Rollup
+    from summit_core import voc_dir as rundir
+
+    logger = logging.getLogger(__name__)
+
+    engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
+    create_schema(engine, Base)
+    create_schema(engine, Rollup)
+
+    windows = session.query(CompoundWindow).all()
+    window = next((w for w in windows if w.id == window_id), None)
+
+    if window is None or not window.compounds:
+        session.close()
+        return 0
+
+    compounds = dict(window.compounds)
+    window_index = IntervalIndex(windows, include_start=False)  # as check_load_pas() finds the window for each line
+
+    peaks = Peak.__table__
+    lines = NmhcLine.__table__
+    runs = GcRun.__table__
+    corrections = NmhcCorrection.__table__
+
+    with engine.connect() as conn:
+        line_rows = conn.execute(
+            select(lines.c.id, lines.c.date)
+            .where(lines.c.date.between(window.date_start, window.date_end))
+            .where(or_(lines.c.correction_id == None,
+                       ~lines.c.correction_id.in_(select(corrections.c.id).where(corrections.c.status == 'applied'))))
+            .order_by(lines.c.date)).fetchall()
+
+    line_ids = [row.id for row, covering in zip(line_rows, window_index.find_all([row.date for row in line_rows]))
+                if covering is window]
+
+    set_name = peaks.update().where(peaks.c.id == bindparam('peak_id')).values(name=bindparam('new_name'), mr=None)
+
+    logger.info(f'Re-identifying peaks of {len(line_ids)} lines between {window.date_start} and {window.date_end}.')
+
+    def submit_chunk(executor, chunk):
+        with engine.connect() as conn:
+            peak_rows = conn.execute(select(peaks.c.id, peaks.c.line_id, peaks.c.run_id, peaks.c.name,
+                                            peaks.c.rt, peaks.c.pa)
+                                     .where(peaks.c.line_id.in_(chunk))
+                                     .where(peaks.c.rt != None)
+                                     .where(peaks.c.pa != None)
+                                     .order_by(peaks.c.line_id, peaks.c.id)).fetchall()
+
+        line_peaks = {}
+        for row in peak_rows:
+            line_peaks.setdefault(row.line_id, []).append((row.id, row.rt, row.pa))
+
+        stored = {row.id: (row.name, row.run_id) for row in peak_rows}
+        return executor.submit(rename_peaks_chunk, compounds, list(line_peaks.values())), (len(chunk), stored)
+
+    in_flight = max_workers or os.cpu_count() or 1  # chunks loaded and being named at once
+    chunks = split_into_sets_of_n(line_ids, chunk_size)
+
+    started = time.time()
+    done = 0
+    renamed = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        while True:
+            for chunk in islice(chunks, in_flight - len(futures)):
+                future, info = submit_chunk(executor, chunk)
+                futures[future] = info
+
+            if not futures:
+                break
+
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            future = finished.pop()
+            chunk_lines, stored = futures.pop(future)
+            changed = {peak_id: name for peak_id, name in future.result().items() if stored[peak_id][0] != name}
+
+            if changed:
+                run_ids = list({stored[peak_id][1] for peak_id in changed if stored[peak_id][1] is not None})
+
+                with engine.begin() as conn:
+                    conn.execute(set_name, [{'peak_id': peak_id, 'new_name': name}
+                                            for peak_id, name in changed.items()])
+
+                    if run_ids:
+                        integrate_peaks(conn, run_ids)
+                        run_dates = [row.date for run_set in split_into_sets_of_n(run_ids, chunk_size)
+                                     for row in conn.execute(select(runs.c.date).where(runs.c.id.in_(run_set)))]
+                        roll_up_peaks(conn, min(run_dates), max(run_dates))
+
+            done += chunk_lines
+            renamed += len(changed)
+            elapsed = time.time() - started
+            logger.info(f'{done}/{len(line_ids)} lines re-identified, {renamed} peaks renamed '
+                        + f'({done / elapsed if elapsed else 0:.0f} lines/s).')
+
+    session.close()
 
+    return renamed
 
+
+@cached_plot
 def summit_voc_plot(dates, compound_dict, limits=None, minor_ticks=None, major_ticks=None,
                     y_label_str='Mixing Ratio (ppbv)'):
     """
@@ -854,26 +1300,23 @@ def summit_voc_plot(dates, compound_dict, limits=None, minor_ticks=None, major_t
                                 'propane':[None, [.5, 1, 1.5]]})
     """
 
-    import matplotlib.pyplot as plt
     from matplotlib.dates import DateFormatter
     from pandas.plotting import register_matplotlib_converters
     register_matplotlib_converters()
 
-    f1 = plt.figure()
-    ax = f1.gca()
-
+    series = []
     if dates is None:  # dates supplied by individual compounds
         for compound, val_list in compound_dict.items():
             if val_list[0] and val_list[1]:
                 assert len(val_list[0]) > 0 and len(val_list[0]) == len(
                     val_list[1]), 'Supplied dates were empty or lengths did not match'
-                ax.plot(val_list[0], val_list[1], '-o')
+                series.append((val_list[0], val_list[1]))
             else:
                 pass
 
     else:
         for compound, val_list in compound_dict.items():
-            ax.plot(dates, val_list[1], '-o')
+            series.append((dates, val_list[1]))
 
     compounds_safe = []
     for k, _ in compound_dict.items():
@@ -884,6 +1327,10 @@ def summit_voc_plot(dates, compound_dict, limits=None, minor_ticks=None, major_t
 
     comp_list = ', '.join(compound_dict.keys())  # use real names for plot title
     fn_list = '_'.join(compounds_safe)  # use 'safe' names for filename
+    plot_name = f'{fn_list}_last_week.png'
+
+    f1, ax = reuse_figure(('summit_voc_plot', plot_name))
+    draw_lines(ax, series)
 
     if limits is not None:
         ax.set_xlim(right=limits.get('right'))
@@ -910,13 +1357,12 @@ def summit_voc_plot(dates, compound_dict, limits=None, minor_ticks=None, major_t
 
     f1.subplots_adjust(bottom=.20)
 
-    plot_name = f'{fn_list}_last_week.png'
     f1.savefig(plot_name, dpi=150)
-    plt.close(f1)
 
     return plot_name
 
 
+@cached_plot
 def summit_log_plot(name, dates, compound_dict, limits=None, minor_ticks=None, major_ticks=None,
                     y_label_str='Temperature (\xb0C)'):
     """
@@ -931,7 +1377,7 @@ def summit_log_plot(name, dates, compound_dict, limits=None, minor_ticks=None, m
     :param limits: dict, optional dictionary of limits including ['top','bottom','right','left']
     :param minor_ticks: list, of major tick marks
     :param major_ticks: list, of minor tick marks
-    :return: None
+    :return: str, name the plot was saved with
 
     This plots stuff.
 
@@ -944,26 +1390,26 @@ def summit_log_plot(name, dates, compound_dict, limits=None, minor_ticks=None, m
                                 'propane':[None, [.5, 1, 1.5]]})
     """
 
-    import matplotlib.pyplot as plt
     from matplotlib.dates import DateFormatter
     from pandas.plotting import register_matplotlib_converters
     register_matplotlib_converters()
 
-    f1 = plt.figure()
-    ax = f1.gca()
-
+    series = []
     if dates is None:  # dates supplied by individual compounds
         for compound, val_list in compound_dict.items():
             if val_list[0] and val_list[1]:
                 assert len(val_list[0]) > 0 and len(val_list[0]) == len(
                     val_list[1]), 'Supplied dates were empty or lengths did not match'
-                ax.plot(val_list[0], val_list[1], '-o')
+                series.append((val_list[0], val_list[1]))
             else:
                 pass
 
     else:
         for compound, val_list in compound_dict.items():
-            ax.plot(dates, val_list[1], '-o')
+            series.append((dates, val_list[1]))
+
+    f1, ax = reuse_figure(('summit_log_plot', name))
+    draw_lines(ax, series)
 
     compounds_safe = []
     for k, _ in compound_dict.items():
@@ -1001,9 +1447,8 @@ def summit_log_plot(name, dates, compound_dict, limits=None, minor_ticks=None, m
     f1.subplots_adjust(bottom=.20)
 
     f1.savefig(name, dpi=150)
-    plt.close(f1)
 
-    return
+    return name
 
 
 def get_peak_data(run):
@@ -1021,88 +1466,91 @@ def get_peak_data(run):
     return (pas, rts)
 
 
-def name_summit_peaks(nmhcline, rt_windows):
+def compile_rt_windows(rt_windows):
     """
-    'Simple' peak identification based on retention times. The C4 compounds get more rigorous treatment, though.
-    :param nmhcline: NmhcLine object
-    :return: NmhcLine object, with named peaks
+    Turn a CompoundWindow into the lists of windows applied by name_peaklist(), so it only has to be done once for all
+    the lines it applies to.
+    :param rt_windows: CompoundWindow, with the retention time windows to use
+    :return: tuple, (list, list) of (name, low, high) windows; all windows in the CompoundWindow's order, and those of
+        relative_compounds, which are the retention time difference from i-butane rather than a retention time
     """
+    absolute = [(name, limits[0], limits[1]) for name, limits in rt_windows.compounds.items()]
+    relative = [(name, rt_windows.compounds[name][0], rt_windows.compounds[name][1])
+                for name in relative_compounds if rt_windows.compounds.get(name)]
 
-    from summit_core import search_for_attr_value
+    return absolute, relative
 
-    compound_pools = dict()
 
-    for peak in nmhcline.peaklist:
-        for compound, limits in rt_windows.compounds.items():
-            if limits[0] < peak.rt < limits[1]:
-                try:  # add peak to pool for that compound and stop attempting to assign it. NEXT!
-                    compound_pools[compound].append(peak)
-                    break
-                except KeyError:
-                    compound_pools[compound] = [peak]
-                    break
+def name_peaklist(peaklist, absolute, relative):
+    """
+    Name a list of peaks given compiled windows from compile_rt_windows(). Peaks are sorted by retention time once, and
+    each window's peaks are found by bisecting the sorted retention times, instead of checking every peak against every
+    window. Each peak belongs to the first window it falls in, and the largest peak in a window takes its name. The
+    relative_compounds are then named by their retention time difference from i-butane.
+    :param peaklist: list, of Peaks
+    :param absolute: list, of (name, low, high) windows, in order of precedence
+    :param relative: list, of (name, low, high) windows relative to i-butane, in the order they're named
+    :return: None, peaks are named in place
+    """
+    from bisect import bisect_left, bisect_right
 
-    for name, pool in compound_pools.items():
-        """Address all EXCEPT n-butane, acetylene, and 4b in this loop."""
-        if name not in ['n-butane', 'acetylene', '4b']:
+    order = sorted(range(len(peaklist)), key=lambda ind: peaklist[ind].rt)
+    rts = [peaklist[ind].rt for ind in order]
 
-            if len(pool) is 1:
-                chosen = pool[0]  # take only value if there
-            else:
-                chosen = max(pool, key=lambda peak: peak.pa)  # get largest peak in possible peaks
+    def largest(pool):
+        return max(pool, key=lambda ind: (peaklist[ind].pa, -ind))  # first in peaklist breaks ties, as max() would
 
-            if chosen is not None:
-                chosen.name = name
+    claimed = set()
+    for name, low, high in absolute:
+        pool = [ind for ind in order[bisect_right(rts, low):bisect_left(rts, high)] if ind not in claimed]
+        claimed.update(pool)  # peaks in relative windows are claimed too, though they're not named here
 
-    ibut = search_for_attr_value(nmhcline.peaklist, 'name', 'i-butane')
+        if pool and name not in relative_compounds:
+            peaklist[largest(pool)].name = name
 
-    find_nbut = True
-    find_acet = True  # default to all needing to be found
-    find_4b = True
+    ibut = next((peak for peak in peaklist if peak.name == 'i-butane'), None)
 
-    if ibut is not None:
-        ibut_rt = ibut.rt
+    if ibut is None:
+        return
 
-        if find_4b:
-            b4_limits = rt_windows.compounds.get('4b')
-            if b4_limits:
-                b4_pool = [peak for peak in nmhcline.peaklist if
-                           b4_limits[0] < (peak.rt - ibut_rt) < b4_limits[1]]
-            else:
-                b4_pool = None
-            if not b4_pool:
-                pass
-            else:
-                b4 = max(b4_pool, key=lambda peak: peak.pa)  # get largest peak in possible peaks
-                b4.name = '4b'
-
-        if find_acet:
-            acet_limits = rt_windows.compounds.get('acetylene')
-            if acet_limits:
-                acet_pool = [peak for peak in nmhcline.peaklist if
-                             acet_limits[0] < (peak.rt - ibut_rt) < acet_limits[1]]
-            else:
-                acet_pool = None
-            if not acet_pool:
-                pass
-            else:
-                acet = max(acet_pool, key=lambda peak: peak.pa)  # get largest peak in possible peaks
-                acet.name = 'acetylene'
-
-        if find_nbut:
-            nbut_limits = rt_windows.compounds.get('n-butane')
-            if nbut_limits:
-                nbut_pool = [peak for peak in nmhcline.peaklist
-                             if nbut_limits[0] < (peak.rt - ibut_rt) < nbut_limits[1]]
-            else:
-                nbut_pool = None
-            if not nbut_pool:
-                pass
-            else:
-                nbut = max(nbut_pool, key=lambda peak: peak.pa)  # get largest peak in possible peaks
-                nbut.name = 'n-butane'
+    for name, low, high in relative:
+        # bisect a slightly wider range, then compare differences exactly as they were before the peaks were sorted
+        candidates = order[bisect_left(rts, ibut.rt + low - 1e-6):bisect_right(rts, ibut.rt + high + 1e-6)]
+        pool = [ind for ind in candidates if low < (peaklist[ind].rt - ibut.rt) < high]
+
+        if pool:
+            peaklist[largest(pool)].name = name
+
+
+def name_summit_lines(nmhclines, all_rt_windows):
+    """
+    'Simple' peak identification based on retention times for many NmhcLines at once. The C4 compounds get more
+    rigorous treatment, though. Each distinct CompoundWindow is only compiled once for all the lines it applies to.
+    :param nmhclines: list, of NmhcLine objects
+    :param all_rt_windows: list, of the CompoundWindow for each line, or None to leave that line's peaks unnamed
+    :return: list, the same NmhcLine objects, with named peaks
+    """
+    compiled = {}
+
+    for line, rt_windows in zip(nmhclines, all_rt_windows):
+        if not rt_windows:
+            continue
 
-    return nmhcline
+        if id(rt_windows) not in compiled:
+            compiled[id(rt_windows)] = compile_rt_windows(rt_windows)
+
+        name_peaklist(line.peaklist, *compiled[id(rt_windows)])
+
+    return nmhclines
+
+
+def name_summit_peaks(nmhcline, rt_windows):
+    """
+    'Simple' peak identification based on retention times. The C4 compounds get more rigorous treatment, though.
+    :param nmhcline: NmhcLine object
+    :return: NmhcLine object, with named peaks
+    """
+    return name_summit_lines([nmhcline], [rt_windows])[0]
 
 
 def check_sheet_cols(name):
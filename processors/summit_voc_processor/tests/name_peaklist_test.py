@@ -0,0 +1,96 @@
+"""
+Randomized test that name_peaklist() (through name_summit_peaks()) names peaks exactly as the original, peak-by-window
+name_summit_peaks() did. The original is kept below as old_name_summit_peaks() to compare against.
+"""
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from summit_voc import compound_windows_1, compound_windows_2, name_summit_peaks
+
+
+def old_name_summit_peaks(nmhcline, rt_windows):
+    """
+    The original name_summit_peaks(), which checked every peak against every window.
+    :param nmhcline: NmhcLine object
+    :return: NmhcLine object, with named peaks
+    """
+    compound_pools = dict()
+
+    for peak in nmhcline.peaklist:
+        for compound, limits in rt_windows.compounds.items():
+            if limits[0] < peak.rt < limits[1]:
+                compound_pools.setdefault(compound, []).append(peak)
+                break
+
+    for name, pool in compound_pools.items():
+        if name not in ['n-butane', 'acetylene', '4b']:
+            max(pool, key=lambda peak: peak.pa).name = name  # get largest peak in possible peaks
+
+    ibut = next((peak for peak in nmhcline.peaklist if peak.name == 'i-butane'), None)
+
+    if ibut is not None:
+        for name in ['4b', 'acetylene', 'n-butane']:
+            limits = rt_windows.compounds.get(name)
+            if limits:
+                pool = [peak for peak in nmhcline.peaklist if limits[0] < (peak.rt - ibut.rt) < limits[1]]
+                if pool:
+                    max(pool, key=lambda peak: peak.pa).name = name
+
+    return nmhcline
+
+
+def random_peaks(rng, windows):
+    """
+    Create a random list of (name, rt, pa) peaks, with some retention times on or near window limits and some repeated
+    peak areas, so ties and boundaries are exercised as well as typical peaks.
+    :param rng: random.Random
+    :param windows: dict, of {name: (low, high)} retention time windows
+    :return: list, of (name, rt, pa) tuples
+    """
+    limits = [limit for window in windows.values() for limit in window]
+    ibut_rt = rng.uniform(*windows['i-butane'])
+
+    peaks = []
+    for _ in range(rng.randint(0, 40)):
+        kind = rng.random()
+        if kind < .2:
+            rt = rng.choice(limits)  # exactly on a window limit
+        elif kind < .3:
+            rt = ibut_rt + rng.choice(limits)  # on a limit relative to i-butane
+        elif kind < .4:
+            rt = ibut_rt + rng.uniform(0, 1.5)  # near i-butane, where the relative compounds are
+        else:
+            rt = round(rng.uniform(0, 25), 2)
+
+        pa = rng.choice([1.0, 2.0, round(rng.uniform(0, 100), 1)])
+        peaks.append((rng.choice(['-', 'x']), rt, pa))
+
+    if rng.random() < .8:
+        peaks.append(('-', ibut_rt, 1000.))  # make sure there's usually an i-butane to name relative compounds from
+
+    rng.shuffle(peaks)
+    return peaks
+
+
+def named(peaks, name_peaks, rt_windows):
+    """
+    :param peaks: list, of (name, rt, pa) tuples
+    :param name_peaks: function, old_name_summit_peaks or name_summit_peaks
+    :param rt_windows: object with a compounds attribute, like a CompoundWindow
+    :return: list, of the name of every peak after naming
+    """
+    line = SimpleNamespace(peaklist=[SimpleNamespace(name=n, rt=rt, pa=pa) for n, rt, pa in peaks])
+    name_peaks(line, rt_windows)
+    return [peak.name for peak in line.peaklist]
+
+
+@pytest.mark.parametrize('windows', [compound_windows_1, compound_windows_2])
+def test_name_peaklist_matches_original(windows):
+    rng = random.Random(2019)
+    rt_windows = SimpleNamespace(compounds=windows)
+
+    for _ in range(5000):
+        peaks = random_peaks(rng, windows)
+        assert named(peaks, name_summit_peaks, rt_windows) == named(peaks, old_name_summit_peaks, rt_windows), peaks
@@ -13,19 +13,20 @@ def crf_warning_body(rf):
 
 async def check_load_logs(logger):
     """
-    Check for new logfiles and convert new files to LogFile objects for persistence.
+    Check for new logfiles and convert new files to LogFile objects for persistence. The size and modification time of
+    every file seen is kept in a manifest, so only files that are new or changed since the last check are looked for in
+    the database.
 
     :param logger: logger, to log events to
     :return: Boolean, True if it ran without error and created data, False if not
     """
 
     try:
-        import os
-        import math
         from summit_core import voc_logs_path as logpath
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir, core_dir, Config
-        from summit_voc import LogFile, read_log_file, Base
+        from summit_core import connect_to_db, create_schema, split_into_sets_of_n
+        from summit_core import scan_directory, read_manifest, write_manifest, find_changed_files
+        from summit_voc import LogFile, read_log_files, insert_log_files, Base
 
     except ImportError as e:
         logger.error('Import in check_load_logs() failed.')
@@ -34,7 +35,7 @@ async def check_load_logs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error('Connection to VOC database failed in check_load_logs()')
         send_processor_email(PROC, exception=e)
@@ -43,61 +44,44 @@ async def check_load_logs(logger):
     try:
         logger.info('Running check_load_logs()')
 
-        logfns = [file.name for file in os.scandir(logpath) if 'l.txt' in file.name]
-        if logfns:
-            # if greater than 999 files, SQL throws error, use list comprehension to query in chunks
-            if len(logfns) >= 999:
-                logger.info('Number of Logs > 999, processing in chunks')
-                # number of files to query in a given chunk
-                iterations = math.ceil(len(logfns) / 1000)
-                n = int(len(logfns) / (iterations * 2))
-
-                # list comprehension to seperate logfns into seperate chunks
-                chunked_logfiles = [logfns[i * n:(i + 1) * n] for i in range((len(logfns) + n - 1) // n)]
-
-                # query each chunk and append it to the total logs in db
-                logs_in_db = []
-                for i in range(len(chunked_logfiles)):
-                    database_logs = session.query(LogFile).filter(LogFile.filename.in_(chunked_logfiles[i])).all()
-                    logs_in_db = logs_in_db + database_logs
-
-                logs_in_db[:] = [l.filename for l in logs_in_db]
-            # else, the number of logfiles is normal and under 1000
-            else:
-                logs_in_db = session.query(LogFile).filter(LogFile.filename.in_(logfns)).all()
-                logs_in_db[:] = [l.filename for l in logs_in_db]
-
-            logs_to_load = []
-            for log in logfns:
-                if log not in logs_in_db:
-                    logs_to_load.append(log)  # add files if not in the database filenames
-
-            if logs_to_load:
-                new_logs = []
-                with TempDir(logpath):
-                    for log in logs_to_load:
-                        new_logs.append(read_log_file(log))
-
-                if new_logs:
-                    for item in new_logs:
-                        session.merge(item)
-                        logger.info(f'Log File {item} added.')
-                    session.commit()
-
-                    session.close()
-                    engine.dispose()
-
-                    return True
-            else:
-                logger.info('No new logs were loaded.')
-                return False
-        else:
+        manifest_path = rundir / 'logfile_manifest.json'
+
+        current = scan_directory(logpath, 'l.txt')
+
+        if not current:
             logger.critical('No log files found in directory.')
+            session.close()
+            return False
+
+        changed = find_changed_files(read_manifest(manifest_path), current)
+
+        logs_in_db = set()
+        for chunk in split_into_sets_of_n(sorted(changed), 500):  # SQLite can't take > 999 variables
+            logs_in_db.update(name for name, in session.query(LogFile.filename).filter(LogFile.filename.in_(chunk)))
+
+        logs_to_load = sorted(changed - logs_in_db)
+
+        ct = 0
+        if logs_to_load:
+            new_logs = read_log_files([logpath / log for log in logs_to_load])
+            ct = insert_log_files(session.connection(), new_logs)
+            session.commit()
+
+        write_manifest(manifest_path, current)  # only after committing, so no file is skipped if loading fails
+
+        session.close()
+
+        if ct:
+            logger.info(f'{ct} Log Files added, from {new_logs["filename"][0]} to {new_logs["filename"][-1]}.')
+            return True
+        else:
+            logger.info('No new logs were loaded.')
             return False
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in check_load_logs().')
         send_processor_email(PROC, exception=e)
+        session.close()
         return False
 
 
@@ -113,8 +97,8 @@ async def check_load_pas(logger):
         logger.info('Running check_load_pas()')
         from summit_core import voc_LOG_path as pa_path
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir, check_filesize, core_dir, Config
-        from summit_voc import Base, NmhcLine, read_pa_line, name_summit_peaks, CompoundWindow
+        from summit_core import connect_to_db, create_schema, read_new_lines, core_dir, Config, IntervalIndex
+        from summit_voc import Base, NmhcLine, read_pa_line, name_summit_lines, CompoundWindow
     except ImportError as e:
         logger.error('Imports failed in check_load_logs()')
         send_processor_email(PROC, exception=e)
@@ -122,7 +106,7 @@ async def check_load_pas(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} connecting to database in check_load_pas()')
         send_processor_email(PROC, exception=e)
@@ -130,7 +114,7 @@ async def check_load_pas(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Config)
 
         voc_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
 
@@ -146,55 +130,47 @@ async def check_load_pas(logger):
 
     try:
         if pa_path.is_file():
-            with TempDir(rundir):
-                new_file_size = check_filesize(pa_path)
-
-            if new_file_size > voc_config.filesize:
-
-                with TempDir(rundir):
-                    contents = pa_path.read_text().split('\n')
+            # only what's been appended
+            contents, new_offset, file_id = read_new_lines(pa_path, voc_config.filesize, voc_config.file_id)
 
-                new_startline = len(contents) - 4  # only read what's necessary, but w/ some padding
+            if new_offset != voc_config.filesize or file_id != voc_config.file_id:
 
                 contents[:] = [c for c in contents if c]  # keep only lines with information
 
+                voc_config.filesize = new_offset  # committed after the lines, or only the offset if none were new
+                voc_config.file_id = file_id
+
                 new_lines = []
-                for line in contents[voc_config.pa_startline:]:
+                for line in contents:
                     try:
-                        with TempDir(rundir):
-                            new_lines.append(read_pa_line(line))
+                        new_lines.append(read_pa_line(line))
                     except:
                         logger.warning('A line in NMHC_PA.LOG was not processed by read_pa_line() due to an exception.')
                         logger.warning(f'That line was: {line}')
 
                 if not new_lines:
                     logger.info('No new pa lines were added.')
+                    core_session.merge(voc_config)
+                    core_session.commit()
                     return False
 
                 else:
-                    # If list isn't empty, attempt to name all peaks
-                    run_one = 1
-                    rt_windows = None
-
-                    for ind, line in enumerate(new_lines):
-
-                        if run_one or not (rt_windows.date_start < line.date < rt_windows.date_end):
-                            # get rt_windows on first iteration OR retrieve if the current sample is outside the past
-                            # window. This should prevent constant needless queries
-                            rt_windows = (session.query(CompoundWindow)
-                                          .filter(
-                                (CompoundWindow.date_start < line.date) & (CompoundWindow.date_end > line.date))
-                                          .one_or_none())
-                            if run_one:
-                                run_one = 0
+                    # If list isn't empty, attempt to name all peaks, finding all windows from one query
+                    window_index = IntervalIndex(session.query(CompoundWindow).all(), include_start=False)
+                    window_index.log_qc(logger, 'CompoundWindow')
 
+                    all_rt_windows = window_index.find_all([line.date for line in new_lines])
+
+                    for line, rt_windows in zip(new_lines, all_rt_windows):
                         if not rt_windows:
                             logger.warning(f'No retention time windows found for NmhcLine for {line.date}.'
                                            + 'It was not quantified.')
-                            run_one = 1  # reset so next sample will re-check for a Window
-                            continue
 
-                        new_lines[ind] = name_summit_peaks(line, rt_windows)
+                    new_lines = name_summit_lines(new_lines, all_rt_windows)
+
+                    for window in {id(w): w for w in all_rt_windows if w}.values():
+                        if window.applied_compounds is None:
+                            window.mark_applied()  # record what new lines were named with, committed with them
 
                 ct = 0
                 if new_lines:
@@ -210,46 +186,36 @@ async def check_load_pas(logger):
                             ct += 1
 
                 if ct:
-                    voc_config.pa_startline = new_startline
-                    core_session.merge(voc_config)
+                    session.commit()  # lines first, so a failed commit doesn't move the offset past them
 
-                    voc_config.filesize = new_file_size
                     core_session.merge(voc_config)
-
                     core_session.commit()
-                    session.commit()
                 else:
                     logger.info('No new pa lines were added.')
+                    core_session.merge(voc_config)
+                    core_session.commit()
                     return False
 
                 session.close()
                 core_session.close()
-                engine.dispose()
-                core_engine.dispose()
 
                 return True
 
             else:
                 session.close()
                 core_session.close()
-                engine.dispose()
-                core_engine.dispose()
                 logger.info('PA file was not larger, so  it was not touched.')
                 return False
 
         else:
             session.close()
             core_session.close()
-            engine.dispose()
-            core_engine.dispose()
             logger.critical('VOC.LOG does not exist.')
             return False
 
     except Exception as e:
         session.close()
         core_session.close()
-        engine.dispose()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in check_load_pas()')
         send_processor_email(PROC, exception=e)
         return False
@@ -257,7 +223,8 @@ async def check_load_pas(logger):
 
 async def load_crfs(logger):
     """
-    Read the CRF file and commit any new Crf objects to the database.
+    Read the CRF file and commit any new Crf objects to the database. Data in any period where the CRFs were revised
+    is reintegrated with the new ones.
 
     :param logger: logger, to log events to
     :return: Boolean, True if it ran without error, False if not
@@ -265,8 +232,8 @@ async def load_crfs(logger):
 
     try:
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir
-        from summit_voc import Base, Crf, read_crf_data
+        from summit_core import connect_to_db, create_schema
+        from summit_voc import Base, Crf, read_crf_data, reassign_cfs
         from sqlalchemy import or_, and_
         from summit_errors import send_processor_warning
     except ImportError as e:
@@ -276,7 +243,7 @@ async def load_crfs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in load_crfs()')
         send_processor_email(PROC, exception=e)
@@ -284,10 +251,10 @@ async def load_crfs(logger):
 
     try:
         logger.info('Running load_crfs()')
-        with TempDir(rundir):
-            crfs = read_crf_data('summit_CRFs.txt')  # creates a list of Crf objects
+        crfs = read_crf_data(rundir / 'summit_CRFs.txt')  # creates a list of Crf objects
 
         rfs_to_process = []
+        revised_periods = []
         for rf in crfs:
             exact_match = (session.query(Crf)
                                   .filter(Crf.date_start == rf.date_start, Crf.date_end == rf.date_end)
@@ -299,6 +266,9 @@ async def load_crfs(logger):
                     send_processor_warning('CRF', 'Loading', crf_warning_body(rf))
                 exact_match = exact_match[0]
 
+                if exact_match.compounds != rf.compounds:
+                    revised_periods.append((rf.date_start, rf.date_end))
+
                 # update the date_end and compound dict if only date_start matches, don't process the one from the file
                 exact_match.compounds = rf.compounds
                 exact_match.date_revision = rf.date_revision
@@ -316,6 +286,7 @@ async def load_crfs(logger):
                             f'Multiple start matches found for a CRF between {rf.date_start} and {rf.date_end}.')
                         send_processor_warning('CRF', 'Loading', crf_warning_body(rf))
                     start_match = start_match[0]
+                    revised_periods.append((rf.date_start, max(rf.date_end, start_match.date_end)))
                     # update the date_end and compound dict if only date_start matches
                     start_match.date_end = rf.date_end
                     start_match.compounds = rf.compounds
@@ -349,6 +320,7 @@ async def load_crfs(logger):
                             logger.info(f'Deleting CRF from database for {over.date_start} to {over.date_end}')
                             logger.info(f'It overlapped with CRF for {rf.date_start} to {rf.date_end} from the file.')
                             session.delete(over)  # delete any in the database if their start/end dates overlap
+                            revised_periods.append((over.date_start, over.date_end))
 
                     rfs_to_process.append(rf)
 
@@ -359,7 +331,10 @@ async def load_crfs(logger):
         session.commit()
 
         session.close()
-        engine.dispose()
+
+        for date_start, date_end in revised_periods:
+            ct = reassign_cfs(date_start, date_end)
+            logger.info(f'{ct} data between {date_start} and {date_end} reintegrated with revised CRFs.')
 
         return True
 
@@ -367,18 +342,24 @@ async def load_crfs(logger):
         logger.error(f'Exception {e.args} occurred in load_crfs()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
 async def add_compound_windows(logger):
+    """
+    Add the CompoundWindows defined in summit_voc to the database, or update their windows if they've been edited. The
+    peaks of lines named with an older version of a window are re-identified separately by reidentify_windows().
+
+    :param logger: logger, to log events to
+    :return: Boolean, True if it ran without error, False if not
+    """
     try:
         logger.info('Running add_compound_windows()')
+        import json
         from datetime import datetime
-        from summit_core import voc_LOG_path as pa_path
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir, check_filesize, core_dir
-        from summit_voc import Base, NmhcLine, read_pa_line, name_summit_peaks, CompoundWindow
+        from summit_core import connect_to_db, create_schema
+        from summit_voc import Base, CompoundWindow
         from summit_voc import compound_windows_1, compound_windows_2
     except ImportError as e:
         logger.error('Imports failed in add_compound_windows()')
@@ -387,7 +368,7 @@ async def add_compound_windows(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} connecting to database in add_compound_windows()')
         send_processor_email(PROC, exception=e)
@@ -396,28 +377,88 @@ async def add_compound_windows(logger):
     try:
 
         windows_in_db = session.query(CompoundWindow).all()
-        dates_in_db = [w.date_start for w in windows_in_db]
+        windows_by_start = {w.date_start: w for w in windows_in_db}
 
         window1 = CompoundWindow(datetime(2018, 11, 1), datetime(2019, 4, 9),
                                  compound_windows_1)  # TODO: This is a guess
         window2 = CompoundWindow(datetime(2019, 4, 9), datetime(2019, 12, 31), compound_windows_2)  # TODO: Also a guess
 
-        if window1.date_start not in dates_in_db:
-            session.add(window1)
+        for window in [window1, window2]:
+            window_in_db = windows_by_start.get(window.date_start)
+            compounds = json.loads(json.dumps(window.compounds))  # as they'll be when loaded, ie tuples to lists
 
-        if window2.date_start not in dates_in_db:
-            session.add(window2)
+            if window_in_db is None:
+                session.add(window)
+            elif window_in_db.compounds != compounds or window_in_db.date_end != window.date_end:
+                if window_in_db.applied_compounds is None:
+                    window_in_db.mark_applied()  # lines were named with it as stored when they were loaded
+
+                window_in_db.compounds = compounds
+                window_in_db.date_end = window.date_end
+                logger.info(f'CompoundWindow for {window.date_start} to {window.date_end} was revised.')
 
         session.commit()
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Error {e.args} occurred in add_compound_windows()')
-        session.commit()
+        send_processor_email(PROC, exception=e)
+        session.close()
+        return False
+
+
+async def reidentify_windows(logger):
+    """
+    Re-identify the peaks of all lines for any CompoundWindow whose compounds or dates differ from those the lines were
+    named with, ie after a window is added or edited. This can take a long time for a large database, so it's run as
+    its own job after the VOC processor rather than as part of it, and new data keeps being processed in the meantime.
+
+    :param logger: logger, to log events to
+    :return: Boolean, True if any peaks were renamed, False if not or if it failed
+    """
+    try:
+        from summit_core import voc_dir as rundir
+        from summit_core import connect_to_db, create_schema
+        from summit_voc import Base, CompoundWindow, reidentify_peaks
+    except ImportError as e:
+        logger.error('Imports failed in reidentify_windows()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
+        create_schema(engine, Base)
+    except Exception as e:
+        logger.error(f'Error {e.args} connecting to database in reidentify_windows()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        renamed = 0
+
+        for window in session.query(CompoundWindow).order_by(CompoundWindow.date_start).all():
+            if window.applied_compounds is None:
+                window.mark_applied()  # lines were named with it when they were loaded, nothing to re-identify
+                session.commit()
+
+            elif not window.is_applied:
+                # as they were when re-identifying started
+                compounds, date_start, date_end = dict(window.compounds), window.date_start, window.date_end
+                ct = reidentify_peaks(window.id)
+                window.mark_applied(compounds, date_start, date_end)
+                session.commit()
+                renamed += ct
+                logger.info(f'{ct} peaks between {window.date_start} and {window.date_end} renamed with revised '
+                            + 'CompoundWindow.')
+
+        session.close()
+        return bool(renamed)
+
+    except Exception as e:
+        logger.error(f'Error {e.args} occurred in reidentify_windows()')
+        send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
@@ -432,7 +473,7 @@ async def create_gc_runs(logger):
 
     try:
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db
+        from summit_core import connect_to_db, create_schema
         from summit_voc import Base, LogFile, NmhcLine, GcRun
         from summit_voc import match_log_to_pa
     except ImportError as e:
@@ -442,7 +483,7 @@ async def create_gc_runs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in create_gc_runs()')
         send_processor_email(PROC, exception=e)
@@ -461,7 +502,6 @@ async def create_gc_runs(logger):
         if not log_files or not nmhc_lines:
             logger.info('No new logs or pa lines matched.')
             session.close()
-            engine.dispose()
             return False
 
         gc_runs = match_log_to_pa(log_files, nmhc_lines)
@@ -469,7 +509,6 @@ async def create_gc_runs(logger):
         if not gc_runs:
             logger.info('No new logs or pa lines matched.')
             session.close()
-            engine.dispose()
             return False
         else:
             run_dates = [run.date for run in gc_runs]
@@ -485,7 +524,6 @@ async def create_gc_runs(logger):
             session.commit()
 
         session.close()
-        engine.dispose()
         return True
     except Exception as e:
         logger.error(f'Error {e.args} occurred in create_gc_runs()')
@@ -504,9 +542,8 @@ async def integrate_runs(logger):
 
     try:
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db
-        from summit_voc import find_crf
-        from summit_voc import Base, GcRun, Datum, Crf
+        from summit_core import connect_to_db, create_schema, IntervalIndex, Rollup
+        from summit_voc import Base, GcRun, Datum, Crf, NmhcLine, integrate_peaks, roll_up_peaks
     except ImportError as e:
         logger.error(f'ImportError occurred in integrate_runs()')
         send_processor_email(PROC, exception=e)
@@ -514,7 +551,8 @@ async def integrate_runs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
+        create_schema(engine, Rollup)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in integrate_runs()')
         send_processor_email(PROC, exception=e)
@@ -522,25 +560,39 @@ async def integrate_runs(logger):
 
     try:
         logger.info('Running integrate_runs()')
+
+        if session.query(Rollup.id).first() is None:
+            logger.info('No Rollups exist, all existing runs will be rolled up.')
+            roll_up_peaks(session.connection())
+
         gc_runs = (session.query(GcRun)
                    .filter(GcRun.data_con == None)
                    .order_by(GcRun.id).all())  # get all un-integrated runs
 
-        crfs = session.query(Crf).order_by(Crf.id).all()  # get all crfs
+        crf_index = IntervalIndex(session.query(Crf).order_by(Crf.id).all())  # get all crfs
+        crf_index.log_qc(logger, 'CRF')
+
+        for run, crf in zip(gc_runs, crf_index.find_all([run.date_end for run in gc_runs])):
+            run.crfs = crf  # Match all runs with available CRFs
+        session.flush()
+
+        runs_to_integrate = [run for run in gc_runs if run.crfs is not None and run.type in ['ambient', 'zero']]
 
-        data = []  # Match all runs with available CRFs
-        for run in gc_runs:
-            run.crfs = find_crf(crfs, run.date_end)
-            session.commit()  # commit changes to crfs?
-            data.append(run.integrate())
+        peak_ct = integrate_peaks(session.connection(), [run.id for run in runs_to_integrate])
+        logger.info(f'{peak_ct} peaks were integrated in {len(runs_to_integrate)} runs.')
 
-        data_in_db = session.query(Datum).order_by(Datum.id).all()
-        data_dates = [d.date_end for d in data_in_db]
+        if runs_to_integrate:
+            roll_up_peaks(session.connection(), min(run.date for run in runs_to_integrate),
+                          max(run.date for run in runs_to_integrate))
+
+        data_dates = {d.date for d in session.query(NmhcLine.date).join(Datum, Datum.line_id == NmhcLine.id).all()}
+
+        data = [Datum(run) for run in runs_to_integrate]
 
         if data:
             for datum in data:
                 if datum is not None and datum.date_end not in data_dates:  # prevent duplicates in db
-                    data_dates.append(datum.date_end)  # prevent duplicates on this load
+                    data_dates.add(datum.date_end)  # prevent duplicates on this load
                     session.merge(datum)
                     logger.info(f'Data {datum} was added.')
 
@@ -551,14 +603,12 @@ async def integrate_runs(logger):
         session.commit()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in integrate_runs()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
@@ -573,8 +623,9 @@ async def plot_new_data(logger):
     try:
         from summit_core import voc_dir as rundir
         from summit_core import core_dir, Plot, Config
-        from summit_core import connect_to_db, TempDir, create_daily_ticks, add_or_ignore_plot
-        from summit_voc import Base, GcRun, summit_voc_plot, get_dates_peak_info
+        from summit_core import connect_to_db, create_schema, create_daily_ticks, add_or_ignore_plot
+        from summit_core import PlotSpec, render_plots, get_rollups, get_rollup_medians, Rollup
+        from summit_voc import Base, GcRun, summit_voc_plot
         from pathlib import Path
         from datetime import datetime
         import datetime as dt
@@ -588,7 +639,8 @@ async def plot_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
+        create_schema(engine, Rollup)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in plot_new_data()')
         send_processor_email(PROC, exception=e)
@@ -596,8 +648,8 @@ async def plot_new_data(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Plot.__table__.create(core_engine, checkfirst=True)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Plot)
+        create_schema(core_engine, Config)
 
         voc_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
 
@@ -626,117 +678,102 @@ async def plot_new_data(logger):
         except (ValueError, AssertionError):
             logger.error('No new data was found within time window. Plots were not created.')
             session.close()
-            engine.dispose()
             return False
 
         if dates[-1] > voc_config.last_data_date:
 
             logger.info('New data found to be plotted.')
 
-            with TempDir(plotdir):  ## PLOT ethane and propane
-                ethane_dates, ethane_mrs = get_dates_peak_info(session, 'ethane', 'mr', date_start=date_ago)
-                propane_dates, propane_mrs = get_dates_peak_info(session, 'propane', 'mr', date_start=date_ago)
+            plots = []
+            conn = session.connection()  # all compounds are plotted from their hourly Rollups
+
+            ## PLOT ethane and propane
+            ethane_dates, ethane_mrs = get_rollup_medians(conn, 'ethane', 'hourly', date_start=date_ago)
+            propane_dates, propane_mrs = get_rollup_medians(conn, 'propane', 'hourly', date_start=date_ago)
 
-                name = summit_voc_plot(None, ({'Ethane': [ethane_dates, ethane_mrs],
-                                               'Propane': [propane_dates, propane_mrs]}),
-                                       limits={'right': date_limits.get('right', None),
+            plots.append(PlotSpec(summit_voc_plot, plotdir,
+                                  (None, {'Ethane': [ethane_dates, ethane_mrs],
+                                          'Propane': [propane_dates, propane_mrs]}),
+                                  dict(limits={'right': date_limits.get('right', None),
                                                'left': date_limits.get('left', None),
                                                'bottom': 0},
                                        major_ticks=major_ticks,
-                                       minor_ticks=minor_ticks)
-
-                ethane_plot = Plot(plotdir / name, remotedir, True)
-                add_or_ignore_plot(ethane_plot, core_session)
-
-            with TempDir(plotdir):  ## PLOT i-butane, n-butane, acetylene
-                ibut_dates, ibut_mrs = get_dates_peak_info(session, 'i-butane', 'mr', date_start=date_ago)
-                nbut_dates, nbut_mrs = get_dates_peak_info(session, 'n-butane', 'mr', date_start=date_ago)
-                acet_dates, acet_mrs = get_dates_peak_info(session, 'acetylene', 'mr', date_start=date_ago)
-
-                name = summit_voc_plot(None, ({'i-Butane': [ibut_dates, ibut_mrs],
-                                               'n-Butane': [nbut_dates, nbut_mrs],
-                                               'Acetylene': [acet_dates, acet_mrs]}),
-                                       limits={'right': date_limits.get('right', None),
+                                       minor_ticks=minor_ticks)))
+
+            ## PLOT i-butane, n-butane, acetylene
+            ibut_dates, ibut_mrs = get_rollup_medians(conn, 'i-butane', 'hourly', date_start=date_ago)
+            nbut_dates, nbut_mrs = get_rollup_medians(conn, 'n-butane', 'hourly', date_start=date_ago)
+            acet_dates, acet_mrs = get_rollup_medians(conn, 'acetylene', 'hourly', date_start=date_ago)
+
+            plots.append(PlotSpec(summit_voc_plot, plotdir,
+                                  (None, {'i-Butane': [ibut_dates, ibut_mrs],
+                                          'n-Butane': [nbut_dates, nbut_mrs],
+                                          'Acetylene': [acet_dates, acet_mrs]}),
+                                  dict(limits={'right': date_limits.get('right', None),
                                                'left': date_limits.get('left', None),
                                                'bottom': 0},
                                        major_ticks=major_ticks,
-                                       minor_ticks=minor_ticks)
-
-                c4_plot = Plot(plotdir / name, remotedir, True)
-                add_or_ignore_plot(c4_plot, core_session)
-
-            with TempDir(plotdir):  ## PLOT i-pentane and n-pentane, & ratio
-                from summit_voc import Peak, LogFile
-                from sqlalchemy.orm import aliased
-                ipentane = aliased(Peak)
-                npentane = aliased(Peak)
-
-                data = (session.query(GcRun.date, ipentane.mr, npentane.mr)
-                        .join(ipentane, ipentane.run_id == GcRun.id)
-                        .join(npentane, npentane.run_id == GcRun.id)
-                        .filter(ipentane.name == 'i-pentane')
-                        .filter(npentane.name == 'n-pentane')
-                        .filter(GcRun.date >= date_ago)
-                        .order_by(GcRun.date)
-                        .all())
-
-                pentane_dates = [d.date for d in data]
-                ipent_mrs = [d[1] for d in data]
-                npent_mrs = [d[2] for d in data]
-
-                inpent_ratio = []
-
-                if ipent_mrs is not None and npent_mrs is not None:
-                    for i, n in zip(ipent_mrs, npent_mrs):
-                        if not n or not i:
-                            inpent_ratio.append(None)
-                        else:
-                            inpent_ratio.append(i / n)
+                                       minor_ticks=minor_ticks)))
+
+            ## PLOT i-pentane and n-pentane, & ratio
+            data = (get_rollups(conn, 'i-pentane', 'hourly', date_start=date_ago)
+                    .merge(get_rollups(conn, 'n-pentane', 'hourly', date_start=date_ago),
+                           on='date', suffixes=('_i', '_n')))  # only hours with both pentanes
 
-                    all_mrs = ipent_mrs + npent_mrs
-                    all_mrs[:] = [mr for mr in all_mrs if mr]  # remove any 0s or NoneTypes before taking max of list
-                    top_plot_limit = max(all_mrs) * 1.05
-                    # set the plot max as 5% above the max value
+            pentane_dates = list(data['date'].dt.to_pydatetime())
+            ipent_mrs = data['median_i'].tolist()
+            npent_mrs = data['median_n'].tolist()
+
+            inpent_ratio = []
+
+            if ipent_mrs is not None and npent_mrs is not None:
+                for i, n in zip(ipent_mrs, npent_mrs):
+                    if not n or not i:
+                        inpent_ratio.append(None)
+                    else:
+                        inpent_ratio.append(i / n)
 
-                    name = summit_voc_plot(pentane_dates, ({'i-Pentane': [None, ipent_mrs],
-                                                            'n-Pentane': [None, npent_mrs]}),
-                                           limits={'right': date_limits.get('right', None),
+                all_mrs = ipent_mrs + npent_mrs
+                all_mrs[:] = [mr for mr in all_mrs if mr]  # remove any 0s or NoneTypes before taking max of list
+                top_plot_limit = max(all_mrs) * 1.05
+                # set the plot max as 5% above the max value
+
+                plots.append(PlotSpec(summit_voc_plot, plotdir,
+                                      (pentane_dates, {'i-Pentane': [None, ipent_mrs],
+                                                       'n-Pentane': [None, npent_mrs]}),
+                                      dict(limits={'right': date_limits.get('right', None),
                                                    'left': date_limits.get('left', None),
                                                    'top': top_plot_limit,
                                                    'bottom': 0},
                                            # 'top': np.amax(ipent_mrs) + .01
                                            major_ticks=major_ticks,
-                                           minor_ticks=minor_ticks)
-
-                    in_pent_plot = Plot(plotdir / name, remotedir, True)
-                    add_or_ignore_plot(in_pent_plot, core_session)
+                                           minor_ticks=minor_ticks)))
 
-                    name = summit_voc_plot(pentane_dates, ({'i/n Pentane ratio': [None, inpent_ratio]}),
-                                           limits={'right': date_limits.get('right', None),
+                plots.append(PlotSpec(summit_voc_plot, plotdir,
+                                      (pentane_dates, {'i/n Pentane ratio': [None, inpent_ratio]}),
+                                      dict(limits={'right': date_limits.get('right', None),
                                                    'left': date_limits.get('left', None),
                                                    'bottom': 0,
                                                    'top': 3},
                                            major_ticks=major_ticks,
                                            minor_ticks=minor_ticks,
-                                           y_label_str='')
-
-                    in_pent_ratio_plot = Plot(plotdir / name, remotedir, True)
-                    add_or_ignore_plot(in_pent_ratio_plot, core_session)
+                                           y_label_str='')))
 
-            with TempDir(plotdir):  ## PLOT benzene and toluene
-                benz_dates, benz_mrs = get_dates_peak_info(session, 'benzene', 'mr', date_start=date_ago)
-                tol_dates, tol_mrs = get_dates_peak_info(session, 'toluene', 'mr', date_start=date_ago)
+            ## PLOT benzene and toluene
+            benz_dates, benz_mrs = get_rollup_medians(conn, 'benzene', 'hourly', date_start=date_ago)
+            tol_dates, tol_mrs = get_rollup_medians(conn, 'toluene', 'hourly', date_start=date_ago)
 
-                name = summit_voc_plot(None, ({'Benzene': [benz_dates, benz_mrs],
-                                               'Toluene': [tol_dates, tol_mrs]}),
-                                       limits={'right': date_limits.get('right', None),
+            plots.append(PlotSpec(summit_voc_plot, plotdir,
+                                  (None, {'Benzene': [benz_dates, benz_mrs],
+                                          'Toluene': [tol_dates, tol_mrs]}),
+                                  dict(limits={'right': date_limits.get('right', None),
                                                'left': date_limits.get('left', None),
                                                'bottom': 0},
                                        major_ticks=major_ticks,
-                                       minor_ticks=minor_ticks)
+                                       minor_ticks=minor_ticks)))
 
-                benz_tol_plot = Plot(plotdir / name, remotedir, True)
-                add_or_ignore_plot(benz_tol_plot, core_session)
+            for path in await render_plots(plots):
+                add_or_ignore_plot(Plot(path, remotedir, True), core_session)  # stage plots to be uploaded
 
             voc_config.last_data_date = dates[-1]
             core_session.merge(voc_config)
@@ -744,21 +781,17 @@ async def plot_new_data(logger):
             logger.info('New data plots created.')
 
             session.close()
-            engine.dispose()
 
             core_session.commit()
             core_session.close()
-            core_engine.dispose()
             return True
 
         else:
             logger.info('No new data, plots were not created.')
 
             session.close()
-            engine.dispose()
 
             core_session.close()
-            core_engine.dispose()
             return False
 
     except Exception as e:
@@ -766,10 +799,8 @@ async def plot_new_data(logger):
         send_processor_email(PROC, exception=e)
 
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
 
         return False
 
@@ -787,7 +818,8 @@ async def plot_logdata(logger):
         import datetime as dt
         from pathlib import Path
         from datetime import datetime
-        from summit_core import connect_to_db, TempDir, Config, Plot, add_or_ignore_plot, create_daily_ticks
+        from summit_core import connect_to_db, Config, Plot, add_or_ignore_plot, create_daily_ticks
+        from summit_core import create_schema, PlotSpec, render_plots
         from summit_core import voc_dir, core_dir
         from summit_voc import LogFile, summit_log_plot
         from summit_voc import log_params_list as log_parameters
@@ -818,8 +850,8 @@ async def plot_logdata(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Plot.__table__.create(core_engine, checkfirst=True)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Plot)
+        create_schema(core_engine, Config)
 
         log_config = core_session.query(Config).filter(Config.processor == 'Log Plotting').one_or_none()
 
@@ -852,118 +884,99 @@ async def plot_logdata(logger):
 
         dates = [l.date for l in logs]
 
-        with TempDir(plotdir):  ## PLOT i-butane, n-butane, acetylene
-
-            name = 'trap_starts_ends.png'
-            summit_log_plot(name, dates,
-                            ({'H20 Trap A, Sample Start': [None, logdict.get('WTA_temp_start')],
-                              'H20 Trap B, Sample Start': [None, logdict.get('WTB_temp_start')],
-                              'Ads Trap A, Sample Start': [None, logdict.get('adsA_temp_start')],
-                              'Ads Trap B, Sample Start': [None, logdict.get('adsB_temp_start')],
-                              'H20 Trap A, Sample End': [None, logdict.get('WTA_temp_end')],
-                              'H20 Trap B, Sample End': [None, logdict.get('WTB_temp_end')],
-                              'Ads Trap A, Sample End': [None, logdict.get('adsA_temp_end')],
-                              'Ads Trap B, Sample End': [None, logdict.get('adsB_temp_end')]}),
-                            limits={'right': date_limits.get('right', None),
-                                    'left': date_limits.get('left', None),
-                                    'bottom': -40,
-                                    'top': 40},
-                            major_ticks=major_ticks,
-                            minor_ticks=minor_ticks)
-
-            traps_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(traps_plot, core_session)
-
-            name = 'sample_flow_and_pressure.png'
-            summit_log_plot(name, dates,
-                            ({'Sample Flow (V)': [None, logdict.get('samplepressure2')],
-                              'Sample Pressure (PSI)': [None, logdict.get('sampleflow2')]}),
-                            limits={'right': date_limits.get('right', None),
-                                    'left': date_limits.get('left', None),
-                                    'bottom': 0,
-                                    'top': 10},
-                            y_label_str='',
-                            major_ticks=major_ticks,
-                            minor_ticks=minor_ticks)
-
-            sample_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(sample_plot, core_session)
-
-            name = 'water_trap_hot_temps.png'
-            summit_log_plot(name, dates,
-                            ({'H20 Trap A Hot Temp': [None, logdict.get('WTA_hottemp')],
-                              'H20 Trap B Hot Temp': [None, logdict.get('WTB_hottemp')]}),
-                            limits={'right': date_limits.get('right', None),
-                                    'left': date_limits.get('left', None),
-                                    'bottom': 0,
-                                    'top': 90},
-                            y_label_str='',
-                            major_ticks=major_ticks,
-                            minor_ticks=minor_ticks)
-
-            hot_water_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(hot_water_plot, core_session)
-
-            name = 'trap_temps_inject_flashheat.png'
-            summit_log_plot(name, dates,
-                            ({'Trap Temp, Flash Heat': [None, logdict.get('traptempFH')],
-                              'Trap Temp, Inject': [None, logdict.get('traptempinject_end')],
-                              'Trap Temp, Bakeout': [None, logdict.get('traptempbakeout_end')]}),
-                            limits={'right': date_limits.get('right', None),
-                                    'left': date_limits.get('left', None),
-                                    'bottom': -50,
-                                    'top': 350},
-                            major_ticks=major_ticks,
-                            minor_ticks=minor_ticks)
-
-            traptemp_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(traptemp_plot, core_session)
-
-            name = 'gc_oven_start_end.png'
-            summit_log_plot(name, dates,
-                            ({'GC Oven Temp': [None, logdict.get('GCoventemp')],
-                              'GC Start Temp': [None, logdict.get('GCstarttemp')]}),
-                            limits={'right': date_limits.get('right', None),
-                                    'left': date_limits.get('left', None),
-                                    'bottom': 0,
-                                    'top': 300},
-                            major_ticks=major_ticks,
-                            minor_ticks=minor_ticks)
-
-            ovenstend_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(ovenstend_plot, core_session)
-
-            name = 'gc_head_start_end.png'
-            summit_log_plot(name, dates,
-                            ({'GC Head Pressure Start': [None, logdict.get('GCHeadP')],
-                              'GC Head Pressure End': [None, logdict.get('GCHeadP1')]}),
-                            limits={'right': date_limits.get('right', None),
-                                    'left': date_limits.get('left', None),
-                                    'bottom': 0,
-                                    'top': 25},
-                            y_label_str='Pressure (PSI)',
-                            major_ticks=major_ticks,
-                            minor_ticks=minor_ticks)
-
-            gcheadstend_plot = Plot(plotdir / name, remotedir, True)
-            add_or_ignore_plot(gcheadstend_plot, core_session)
+        plots = []
+
+        plots.append(PlotSpec(summit_log_plot, plotdir,
+                              ('trap_starts_ends.png', dates,
+                               {'H20 Trap A, Sample Start': [None, logdict.get('WTA_temp_start')],
+                                'H20 Trap B, Sample Start': [None, logdict.get('WTB_temp_start')],
+                                'Ads Trap A, Sample Start': [None, logdict.get('adsA_temp_start')],
+                                'Ads Trap B, Sample Start': [None, logdict.get('adsB_temp_start')],
+                                'H20 Trap A, Sample End': [None, logdict.get('WTA_temp_end')],
+                                'H20 Trap B, Sample End': [None, logdict.get('WTB_temp_end')],
+                                'Ads Trap A, Sample End': [None, logdict.get('adsA_temp_end')],
+                                'Ads Trap B, Sample End': [None, logdict.get('adsB_temp_end')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': -40,
+                                           'top': 40},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_log_plot, plotdir,
+                              ('sample_flow_and_pressure.png', dates,
+                               {'Sample Flow (V)': [None, logdict.get('samplepressure2')],
+                                'Sample Pressure (PSI)': [None, logdict.get('sampleflow2')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 10},
+                                   y_label_str='',
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_log_plot, plotdir,
+                              ('water_trap_hot_temps.png', dates,
+                               {'H20 Trap A Hot Temp': [None, logdict.get('WTA_hottemp')],
+                                'H20 Trap B Hot Temp': [None, logdict.get('WTB_hottemp')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 90},
+                                   y_label_str='',
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_log_plot, plotdir,
+                              ('trap_temps_inject_flashheat.png', dates,
+                               {'Trap Temp, Flash Heat': [None, logdict.get('traptempFH')],
+                                'Trap Temp, Inject': [None, logdict.get('traptempinject_end')],
+                                'Trap Temp, Bakeout': [None, logdict.get('traptempbakeout_end')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': -50,
+                                           'top': 350},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_log_plot, plotdir,
+                              ('gc_oven_start_end.png', dates,
+                               {'GC Oven Temp': [None, logdict.get('GCoventemp')],
+                                'GC Start Temp': [None, logdict.get('GCstarttemp')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 300},
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        plots.append(PlotSpec(summit_log_plot, plotdir,
+                              ('gc_head_start_end.png', dates,
+                               {'GC Head Pressure Start': [None, logdict.get('GCHeadP')],
+                                'GC Head Pressure End': [None, logdict.get('GCHeadP1')]}),
+                              dict(limits={'right': date_limits.get('right', None),
+                                           'left': date_limits.get('left', None),
+                                           'bottom': 0,
+                                           'top': 25},
+                                   y_label_str='Pressure (PSI)',
+                                   major_ticks=major_ticks,
+                                   minor_ticks=minor_ticks)))
+
+        for path in await render_plots(plots):
+            add_or_ignore_plot(Plot(path, remotedir, True), core_session)
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_logdata()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
 
         return False
 
@@ -982,7 +995,7 @@ async def check_new_logs(logger):
         import datetime as dt
         from pathlib import Path
         from datetime import datetime
-        from summit_core import connect_to_db, TempDir, Config
+        from summit_core import connect_to_db, create_schema, TempDir, Config
         from summit_core import voc_dir, core_dir
         from summit_voc import LogFile, log_parameter_bounds
         from summit_errors import send_logparam_email
@@ -1001,7 +1014,7 @@ async def check_new_logs(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_schema(core_engine, Config)
 
         logcheck_config = core_session.query(Config).filter(Config.processor == 'Log Checking').one_or_none()
 
@@ -1101,10 +1114,8 @@ async def check_new_logs(logger):
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
 
         session.close()
-        engine.dispose()
 
         return True
 
@@ -1112,10 +1123,8 @@ async def check_new_logs(logger):
         logger.error(f'Exception {e.args} occurred in check_new_logs()')
         send_processor_email('Log Checking', exception=e)
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
 
         return False
 
@@ -1137,7 +1146,8 @@ async def load_excel_corrections(sheet_name, logger):
         from pathlib import Path
         from summit_voc import Peak, LogFile, NmhcLine, NmhcCorrection, GcRun, Datum, Base
         from summit_voc import check_sheet_cols, correction_from_df_column, find_approximate_rt, sheet_slices
-        from summit_core import connect_to_db, search_for_attr_value, data_file_paths
+        from summit_voc import integrate_peaks, roll_up_peaks
+        from summit_core import connect_to_db, create_schema, search_for_attr_value, data_file_paths, Rollup
         from summit_core import voc_dir as rundir
     except ImportError as e:
         logger.error('ImportError occurred in load_excel_corrections()')
@@ -1145,7 +1155,8 @@ async def load_excel_corrections(sheet_name, logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_schema(engine, Base)
+        create_schema(engine, Rollup)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in load_excel_corrections()')
         send_processor_email(PROC, exception=e)
@@ -1191,6 +1202,8 @@ async def load_excel_corrections(sheet_name, logger):
                             .all())
         # re-get all added corrections that haven't been applied, but have a date from a matched line
 
+        runs_to_reintegrate = []
+        dates_to_reintegrate = []
         for correction in nmhc_corrections:
             if correction:
                 line = session.query(NmhcLine).filter(NmhcLine.correction_id == correction.id).one_or_none()
@@ -1251,17 +1264,22 @@ async def load_excel_corrections(sheet_name, logger):
             data = session.query(Datum).filter(Datum.line_id == line.id).one_or_none()
 
             if data:
-                data.reintegrate()
-                session.merge(data)
-            # find and reintegrate data after correcting peaks
+                runs_to_reintegrate.append(data.run_id)
+                dates_to_reintegrate.append(data.run_con.date)
+            # find data to reintegrate after correcting peaks
 
             session.merge(correction)
             session.merge(line)
             logger.info(f'Successful peak corrections made to {line.date}')
 
+        session.flush()  # corrected peak areas need to be in the db before reintegrating all at once
+        integrate_peaks(session.connection(), runs_to_reintegrate)
+
+        if dates_to_reintegrate:
+            roll_up_peaks(session.connection(), min(dates_to_reintegrate), max(dates_to_reintegrate))
+
         session.commit()
         session.close()
-        engine.dispose()
 
         return True
 
@@ -1269,7 +1287,6 @@ async def load_excel_corrections(sheet_name, logger):
         logger.error(f'Exception {e.args} occurred in load_excel_corrections()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 